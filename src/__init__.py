@@ -0,0 +1,7 @@
+"""
+williams-racing-strategies - KPI and analysis modules.
+
+Importing this package, or any of the kpi modules in it, does no work: no CSVs are read, nothing is printed or written,
+and heavy dependencies (fastf1, matplotlib, seaborn, scipy) are only imported inside the functions that need them.
+Each module's demo output runs from the project root with e.g. python -m src.kpi1
+"""
@@ -0,0 +1,238 @@
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+
+"""
+Bootstrap Confidence Intervals - vectorised resampling for KPI comparisons
+
+The hypothesis tests in src/analysis1.py, src/analysis2.py and src/analysis3.py report a single ttest_ind / mannwhitneyu
+p-value, with repeated worries about n < 30 (e.g. Williams at technical circuits, n = 26; technical sectors, n = 16).
+A bootstrap confidence interval for the difference in means or medians shows how large the gap plausibly is,
+without assuming normality.
+
+Steps:
+1. Draw every resample of a group at once, as one (resamples x n) matrix of row indices - no Python loop over resamples.
+2. Reduce each row to the statistic (mean or median) with one numpy call, and difference the two groups.
+3. Large jobs are split into chunks of resamples, each with its own seed spawned from the main one, and spread over
+    a process pool. The chunks do not depend on the number of workers, so results are identical serial or parallel.
+4. Report the observed difference, its bootstrap standard error and a percentile confidence interval.
+
+Run from the project root: python -m src.bootstrap (CIs for the three KPI hypotheses, plus a benchmark at 10,000 resamples)
+"""
+
+# index matrix elements per chunk - bounds memory at roughly 32 MB of int64 indices per group
+CHUNK_ELEMENTS = 1 << 22
+
+# jobs smaller than this (resamples x total sample size) run in-process - a process pool costs more than it saves
+PARALLEL_MIN_ELEMENTS = 1 << 24
+
+STATISTICS = {
+    'mean': lambda samples: samples.mean(axis=1),
+    'median': lambda samples: np.median(samples, axis=1),
+}
+
+# -------------------------------------------------------------------------------------------------------- #
+
+# steps 1 & 2 - one chunk of resamples, as index matrices
+
+def _bootstrap_chunk(a: np.ndarray, b: np.ndarray, statistic: str, n_resamples: int, seed: np.random.SeedSequence) -> np.ndarray:
+    """
+    Worker task: n_resamples bootstrap differences statistic(a*) - statistic(b*).
+    """
+    rng = np.random.default_rng(seed)
+    a_resamples = a[rng.integers(0, len(a), size=(n_resamples, len(a)))]
+    b_resamples = b[rng.integers(0, len(b), size=(n_resamples, len(b)))]
+    return STATISTICS[statistic](a_resamples) - STATISTICS[statistic](b_resamples)
+
+
+def bootstrap_differences(a, b,
+                          statistic: str = 'mean',
+                          n_resamples: int = 10_000,
+                          seed: int = 0,
+                          max_workers: int = None) -> np.ndarray:
+    """
+    Bootstrap distribution of statistic(a) - statistic(b), resampling each group independently with replacement.
+
+    Arguments:
+    a, b (array-like): The two samples - NaNs are dropped.
+    statistic (str): 'mean' or 'median'. Default is 'mean'.
+    n_resamples (int): Number of bootstrap resamples. Default is 10,000.
+    seed (int): Seed for the resamples - the same seed always gives the same differences. Default is 0.
+    max_workers (int): Worker processes for large jobs - 1 never starts a pool. Default is one per CPU.
+
+    Returns:
+    np.ndarray: n_resamples bootstrap differences.
+    """
+    if statistic not in STATISTICS:
+        raise ValueError(f"statistic must be one of {list(STATISTICS)}, not '{statistic}'")
+
+    a = np.asarray(a, dtype='float64')
+    b = np.asarray(b, dtype='float64')
+    a, b = a[~np.isnan(a)], b[~np.isnan(b)]
+    if len(a) == 0 or len(b) == 0:
+        raise ValueError("both samples need at least one value")
+
+    # 3. ---------- fixed-size chunks, each with its own seed ----------
+    chunk_size = max(1, CHUNK_ELEMENTS // max(len(a), len(b)))
+    chunk_sizes = [min(chunk_size, n_resamples - start) for start in range(0, n_resamples, chunk_size)]
+    seeds = np.random.SeedSequence(seed).spawn(len(chunk_sizes))
+
+    parallel = (max_workers != 1 and len(chunk_sizes) > 1
+                and n_resamples * (len(a) + len(b)) >= PARALLEL_MIN_ELEMENTS)
+
+    if not parallel:
+        chunks = [_bootstrap_chunk(a, b, statistic, size, chunk_seed) for size, chunk_seed in zip(chunk_sizes, seeds)]
+    else:
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            chunks = list(executor.map(_bootstrap_chunk, [a] * len(seeds), [b] * len(seeds), [statistic] * len(seeds),
+                                       chunk_sizes, seeds))
+
+    return np.concatenate(chunks)
+
+# -------------------------------------------------------------------------------------------------------- #
+
+# step 4 - confidence intervals, one comparison or many
+
+def bootstrap_ci(a, b,
+                 statistic: str = 'mean',
+                 n_resamples: int = 10_000,
+                 confidence: float = 0.95,
+                 seed: int = 0,
+                 max_workers: int = None) -> dict:
+    """
+    Percentile bootstrap confidence interval for statistic(a) - statistic(b).
+
+    Arguments:
+    a, b (array-like): The two samples, e.g. Williams and rival grid deltas.
+    statistic (str): 'mean' or 'median'. Default is 'mean'.
+    n_resamples (int): Number of bootstrap resamples. Default is 10,000.
+    confidence (float): Confidence level of the interval. Default is 0.95.
+    seed (int): Seed for the resamples. Default is 0.
+    max_workers (int): Worker processes for large jobs (see bootstrap_differences). Default is one per CPU.
+
+    Returns:
+    dict: 'statistic', 'n_a', 'n_b', 'difference' (observed), 'std_error', 'ci_low', 'ci_high' and 'excludes_zero'.
+    """
+    a = pd.Series(a, dtype='float64').dropna().to_numpy()
+    b = pd.Series(b, dtype='float64').dropna().to_numpy()
+
+    differences = bootstrap_differences(a, b, statistic, n_resamples, seed, max_workers)
+    observed = STATISTICS[statistic](a[np.newaxis])[0] - STATISTICS[statistic](b[np.newaxis])[0]
+    ci_low, ci_high = np.quantile(differences, [(1 - confidence) / 2, (1 + confidence) / 2])
+
+    return {
+        'statistic': statistic, 'n_a': len(a), 'n_b': len(b),
+        'difference': observed, 'std_error': differences.std(ddof=1),
+        'ci_low': ci_low, 'ci_high': ci_high,
+        'excludes_zero': bool(ci_low > 0 or ci_high < 0),
+    }
+
+
+def bootstrap_comparisons(comparisons: dict[str, tuple],
+                          statistics: list[str] = ['mean', 'median'],
+                          n_resamples: int = 10_000,
+                          confidence: float = 0.95,
+                          seed: int = 0,
+                          max_workers: int = None) -> pd.DataFrame:
+    """
+    Bootstrap CIs for several comparisons and statistics, as one table.
+
+    Arguments:
+    comparisons (dict[str, tuple]): Comparison name -> (a, b), e.g. {'williams vs rivals': (williams_deltas, rival_deltas)}.
+    statistics (list[str]): Statistics to compare. Default is ['mean', 'median'].
+    n_resamples, confidence, seed, max_workers: As bootstrap_ci.
+
+    Returns:
+    pd.DataFrame: One row per comparison and statistic, with the columns of bootstrap_ci plus 'comparison'.
+    """
+    rows = []
+    for name, (a, b) in comparisons.items():
+        for statistic in statistics:
+            rows.append({'comparison': name, **bootstrap_ci(a, b, statistic, n_resamples, confidence, seed, max_workers)})
+    return pd.DataFrame(rows)
+
+# -------------------------------------------------------------------------------------------------------- #
+
+# the three KPI hypotheses, as tested in src/analysis1.py, src/analysis2.py and src/analysis3.py
+
+def get_kpi_comparisons() -> dict[str, tuple[pd.Series, pd.Series]]:
+    """
+    Returns:
+    dict[str, tuple[pd.Series, pd.Series]]: The two groups of each hypothesis test, from processed_data/.
+    - KPI 1: Williams vs midfield rival grid deltas at technical circuits (delta-all-circuits.csv)
+    - KPI 2: Williams' technical vs power sector deficits, in seconds (williams-deltas-by-sector-type.csv)
+    - KPI 3: rookie vs experienced lap time standard deviation, in ms, without the two largest experienced outliers (laptimes_std.csv)
+    """
+    from src.kpi2 import circuit_type
+
+    df_deltas = pd.read_csv('processed_data/delta-all-circuits.csv', index_col=0)
+    df_technical = df_deltas[df_deltas['gp_name'].map(circuit_type) == 'technical']
+
+    df_sectors = pd.read_csv('processed_data/williams-deltas-by-sector-type.csv', index_col=0)
+
+    df_std = pd.read_csv('processed_data/laptimes_std.csv', index_col=0)
+    df_std = df_std.drop(df_std[df_std['rookie_or_experienced'] == 'experienced'].nlargest(2, 'laptime_std_ms').index)
+
+    return {
+        'kpi1 williams - rivals, technical circuits (places)': (
+            df_technical[df_technical['is_williams']]['grid_delta'], df_technical[~df_technical['is_williams']]['grid_delta']),
+        'kpi2 technical - power sector deficit (s)': (
+            df_sectors[df_sectors['sector_type'] == 'technical']['sector_delta'], df_sectors[df_sectors['sector_type'] == 'power']['sector_delta']),
+        'kpi3 rookie - experienced lap time std (ms)': (
+            df_std[df_std['rookie_or_experienced'] == 'rookie']['laptime_std_ms'], df_std[df_std['rookie_or_experienced'] == 'experienced']['laptime_std_ms']),
+    }
+
+# -------------------------------------------------------------------------------------------------------- #
+
+# benchmark - a Python loop over resamples vs the index matrix, serial and parallel
+
+def compare_bootstrap_times(a, b, statistic: str = 'mean', n_resamples: int = 10_000, max_workers: int = None) -> pd.DataFrame:
+    """
+    Returns:
+    pd.DataFrame: One row per method with columns 'method', 'n_resamples', 'total_ms' and 'resamples_per_s'.
+    """
+    a = pd.Series(a, dtype='float64').dropna().to_numpy()
+    b = pd.Series(b, dtype='float64').dropna().to_numpy()
+
+    def python_loop():
+        rng = np.random.default_rng(0)
+        reduce = np.mean if statistic == 'mean' else np.median
+        return np.array([reduce(rng.choice(a, len(a))) - reduce(rng.choice(b, len(b))) for _ in range(n_resamples)])
+
+    methods = {
+        'python loop': python_loop,
+        'index matrix (serial)': lambda: bootstrap_differences(a, b, statistic, n_resamples, max_workers=1),
+    }
+    if n_resamples * (len(a) + len(b)) >= PARALLEL_MIN_ELEMENTS:
+        methods['index matrix (process pool)'] = lambda: bootstrap_differences(a, b, statistic, n_resamples, max_workers=max_workers)
+
+    rows = []
+    for method, run in methods.items():
+        start = time.perf_counter()
+        run()
+        total_ms = (time.perf_counter() - start) * 1000
+        rows.append({'method': method, 'n_resamples': n_resamples, 'total_ms': round(total_ms, 1),
+                     'resamples_per_s': int(n_resamples / (total_ms / 1000))})
+    return pd.DataFrame(rows)
+
+
+if __name__ == '__main__':
+    comparisons = get_kpi_comparisons()
+
+    print("95% bootstrap confidence intervals (10,000 resamples) for each KPI hypothesis.\n")
+    print(bootstrap_comparisons(comparisons).round(3).to_string(index=False))
+
+    print("\n\nBenchmark - 10,000 resamples per comparison.\n")
+    for name, (a, b) in comparisons.items():
+        print(name)
+        print(compare_bootstrap_times(a, b, 'median').to_string(index=False))
+        print()
+
+    # a large job, e.g. every driver's lap times pooled, to show the process pool at work
+    laps = pd.read_csv('processed_data/driver-lap-times-validated.csv')
+    rookie_laps = laps[laps['rookie_or_experienced'] == 'rookie']['lap_time_ms']
+    experienced_laps = laps[laps['rookie_or_experienced'] == 'experienced']['lap_time_ms']
+    print(f"rookie - experienced lap times, n = {len(rookie_laps)} vs {len(experienced_laps)} laps ({os.cpu_count()} CPUs)")
+    print(compare_bootstrap_times(rookie_laps, experienced_laps, 'mean', n_resamples=2_000).to_string(index=False))
@@ -0,0 +1,314 @@
+import hashlib
+import inspect
+import json
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+import pandas as pd
+
+"""
+Build Graph - incremental processed_data builds
+
+The derived files in processed_data/ used to come from running notebooks and scripts by hand, in the right order.
+Here each artifact is declared once, with its inputs, outputs and build function (STAGES below).
+
+Steps:
+1. Order the stages by their inputs and outputs - a stage depends on whichever stage writes one of its inputs.
+2. A stage is stale if any output is missing, or if the hash of its inputs, of its build function's source or of the
+    src/ modules it calls into ('code') differs from the manifest recorded after its last successful build
+    (cache/build-manifest.json).
+3. Run stale stages as soon as the stages they depend on have finished, independent stages in parallel.
+4. Print a per-stage timing report.
+
+The source files - grid-to-finish.csv and driver-lap-times.csv (BigQuery exports, see sql/) and all-laps.csv (FastF1) -
+are inputs only. Editing one of them rebuilds just the artifacts downstream of it.
+
+Run from the project root: python -m src.build  (add --force to rebuild everything)
+"""
+
+MANIFEST_PATH = 'cache/build-manifest.json'
+
+# -------------------------------------------------------------------------------------------------------- #
+
+# build functions - one per stage, each reads its inputs and writes its outputs
+
+def build_grid_to_finish_validated():
+    # validation in notebooks/kpi1-1-validation.ipynb - no nulls or duplicates expected, drop any that appear
+    df = pd.read_csv('processed_data/grid-to-finish.csv')
+    df = df.dropna().drop_duplicates()
+    df.to_csv('processed_data/grid-to-finish-validated.csv', index=False)
+
+
+def build_grid_deltas():
+    from src.kpi1 import GRID_TO_FINISH_PATH, get_driver_level_delta, get_high_downforce_deltas
+
+    df = pd.read_csv(GRID_TO_FINISH_PATH)
+    get_driver_level_delta(df) # adds gained_or_lost and num_places to df in place
+
+    df.to_csv('processed_data/delta-all-circuits.csv')
+    get_high_downforce_deltas(df).to_csv('processed_data/delta-high-downforce.csv')
+
+
+def build_driver_lap_times_validated():
+    # validation in notebooks/kpi3-1-validation.ipynb - drop laps over 2 minutes (in-laps, red flags, etc.)
+    df = pd.read_csv('processed_data/driver-lap-times.csv')
+    df = df[df['lap_time_ms'] <= 120000]
+    df.to_csv('processed_data/driver-lap-times-validated.csv', index=False)
+
+
+def build_laptimes_std():
+    # per-driver, per-race lap time standard deviation, as in notebooks/kpi3-2-features.ipynb
+    from src.kpi3 import LAP_TIMES_PATH, format_ms
+
+    df = pd.read_csv(LAP_TIMES_PATH)
+    grouped = df.groupby(['gp_year', 'gp_name', 'gp_round', 'driver_name', 'rookie_or_experienced'])
+
+    laptimes_std = grouped['lap_time_ms'].std().reset_index().rename(columns={'lap_time_ms': 'laptime_std_ms'})
+    laptimes_std['laptime_std'] = format_ms(laptimes_std['laptime_std_ms'])
+
+    laptimes_std = laptimes_std[['gp_year', 'gp_name', 'gp_round', 'driver_name', 'rookie_or_experienced', 'laptime_std', 'laptime_std_ms']]
+    laptimes_std.to_csv('processed_data/laptimes_std.csv')
+
+
+def build_laptimes_std_clean():
+    # laptimes_std.csv again, next to the same std without in-laps, out-laps and lap 1
+    from src.lap_flags import LAP_TIMES_PATH, LAPTIMES_STD_CLEAN_PATH, flag_pit_laps, get_clean_laptimes_std
+    from src.loader import load_table
+
+    flagged = flag_pit_laps(pd.read_csv(LAP_TIMES_PATH), load_table('pit_stops'))
+    get_clean_laptimes_std(flagged).to_csv(LAPTIMES_STD_CLEAN_PATH)
+
+
+def build_laptimes_consistency():
+    # rolling-window and per-stint lap time consistency, one row per driver and race
+    from src.consistency import LAPTIMES_CONSISTENCY_PATH, get_consistency_table
+    from src.lap_flags import LAP_TIMES_PATH, flag_pit_laps
+    from src.loader import load_table
+
+    flagged = flag_pit_laps(pd.read_csv(LAP_TIMES_PATH), load_table('pit_stops'))
+    get_consistency_table(flagged).to_csv(LAPTIMES_CONSISTENCY_PATH)
+
+
+def build_sector_deltas():
+    from src.kpi2 import (ALL_LAPS_PATH, add_zscores, get_best_midfield_laps, get_fastest_by_team,
+                          get_labelled_sector_deficits, get_team_deficits)
+
+    df_best_midfield = get_best_midfield_laps(pd.read_csv(ALL_LAPS_PATH))
+    df_best_midfield.to_csv('processed_data/all-laps-best-midfield.csv')
+    df_best_midfield[df_best_midfield['Team'] == 'Williams'].to_csv('processed_data/williams-best-laps.csv')
+
+    df_deficits = get_team_deficits(get_fastest_by_team(df_best_midfield), team='Williams')
+    add_zscores(get_labelled_sector_deficits(df_deficits)).to_csv('processed_data/williams-deltas-by-sector-type.csv')
+
+# -------------------------------------------------------------------------------------------------------- #
+
+# the graph - every derived artifact in processed_data/, with its inputs and the src/ modules its build function calls into
+
+STAGES = [
+    {
+        'name': 'grid_to_finish_validated',
+        'inputs': ['processed_data/grid-to-finish.csv'],
+        'outputs': ['processed_data/grid-to-finish-validated.csv'],
+        'build': build_grid_to_finish_validated,
+    },
+    {
+        'name': 'grid_deltas',
+        'inputs': ['processed_data/grid-to-finish-validated.csv'],
+        'outputs': ['processed_data/delta-all-circuits.csv', 'processed_data/delta-high-downforce.csv'],
+        'code': ['src/kpi1.py'],
+        'build': build_grid_deltas,
+    },
+    {
+        'name': 'driver_lap_times_validated',
+        'inputs': ['processed_data/driver-lap-times.csv'],
+        'outputs': ['processed_data/driver-lap-times-validated.csv'],
+        'build': build_driver_lap_times_validated,
+    },
+    {
+        'name': 'laptimes_std',
+        'inputs': ['processed_data/driver-lap-times-validated.csv'],
+        'outputs': ['processed_data/laptimes_std.csv'],
+        'code': ['src/kpi3.py'],
+        'build': build_laptimes_std,
+    },
+    {
+        'name': 'laptimes_std_clean',
+        'inputs': ['processed_data/driver-lap-times-validated.csv', 'raw_data/pit_stops.csv'],
+        'outputs': ['processed_data/laptimes_std_clean.csv'],
+        'code': ['src/lap_flags.py', 'src/kpi3.py', 'src/loader.py'],
+        'build': build_laptimes_std_clean,
+    },
+    {
+        'name': 'laptimes_consistency',
+        'inputs': ['processed_data/driver-lap-times-validated.csv', 'raw_data/pit_stops.csv'],
+        'outputs': ['processed_data/laptimes_consistency.csv'],
+        'code': ['src/consistency.py', 'src/lap_flags.py', 'src/race_sim.py', 'src/loader.py'],
+        'build': build_laptimes_consistency,
+    },
+    {
+        'name': 'sector_deltas',
+        'inputs': ['processed_data/all-laps.csv'],
+        'outputs': ['processed_data/all-laps-best-midfield.csv', 'processed_data/williams-best-laps.csv',
+                    'processed_data/williams-deltas-by-sector-type.csv'],
+        'code': ['src/kpi2.py', 'src/fastf1_times.py'],
+        'build': build_sector_deltas,
+    },
+]
+
+# -------------------------------------------------------------------------------------------------------- #
+
+# steps 1 & 2 - dependencies and staleness
+
+def get_dependencies(stages: list[dict]) -> dict[str, set[str]]:
+    """
+    Returns:
+    dict[str, set[str]]: For each stage name, the names of the stages writing its inputs.
+    """
+    producers = {output: stage['name'] for stage in stages for output in stage['outputs']}
+    dependencies = {
+        stage['name']: {producers[path] for path in stage['inputs'] if path in producers}
+        for stage in stages
+    }
+
+    # a cycle would leave stages waiting forever - check the graph can be ordered before running anything
+    done = set()
+    while len(done) < len(stages):
+        ready = {name for name, deps in dependencies.items() if name not in done and deps <= done}
+        if not ready:
+            raise ValueError(f"Build graph has a cycle between stages: {sorted(set(dependencies) - done)}")
+        done |= ready
+
+    return dependencies
+
+
+def hash_file(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def get_stage_fingerprint(stage: dict) -> dict:
+    """
+    Fingerprint of everything a stage's outputs depend on - the content of each input, the build function's source and
+    the content of each module listed in the stage's 'code' (the build functions are thin wrappers around them).
+    """
+    return {
+        'inputs': {path: hash_file(path) for path in stage['inputs']},
+        'code': hashlib.sha256(inspect.getsource(stage['build']).encode()).hexdigest(),
+        'modules': {path: hash_file(path) for path in stage.get('code', [])},
+    }
+
+
+def is_stage_stale(stage: dict, manifest: dict) -> bool:
+    if any(not os.path.exists(path) for path in stage['outputs']):
+        return True
+    return manifest.get(stage['name']) != get_stage_fingerprint(stage)
+
+
+def load_manifest(manifest_path: str = MANIFEST_PATH) -> dict:
+    if not os.path.exists(manifest_path):
+        return {}
+    with open(manifest_path) as f:
+        return json.load(f)
+
+
+def save_manifest(manifest: dict, manifest_path: str = MANIFEST_PATH) -> None:
+    os.makedirs(os.path.dirname(manifest_path), exist_ok=True)
+    with open(manifest_path + '.tmp', 'w') as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    os.replace(manifest_path + '.tmp', manifest_path)
+
+
+def _run_stage(build) -> float:
+    """
+    Worker task: run one build function and return its wall time in seconds.
+    """
+    start = time.perf_counter()
+    build()
+    return time.perf_counter() - start
+
+# -------------------------------------------------------------------------------------------------------- #
+
+# steps 3 & 4 - run stale stages, in parallel where possible, and report
+
+def run_build(stages: list[dict] = STAGES,
+              manifest_path: str = MANIFEST_PATH,
+              force: bool = False,
+              max_workers: int = None,
+              verbose: bool = True) -> pd.DataFrame:
+    """
+    Rebuild every stale stage, in dependency order. Staleness is checked just before each stage would run,
+    so a stage whose upstream rebuild produced identical output is not rebuilt.
+
+    Arguments:
+    stages (list[dict]): The build graph. Default is STAGES.
+    manifest_path (str): Where input/code fingerprints of the last successful builds are kept. Default is 'cache/build-manifest.json'.
+    force (bool): If True, rebuild every stage. Default is False.
+    max_workers (int): Number of worker processes - 1 runs stages one by one in this process. Default is one per CPU.
+    verbose (bool): If True, print each stage as it finishes. Default is True.
+
+    Returns:
+    pd.DataFrame: One row per stage with columns 'stage', 'status' ('built', 'up-to-date', 'failed' or 'skipped'),
+    'seconds' and 'error'. Stages downstream of a failure are 'skipped'.
+    """
+    dependencies = get_dependencies(stages)
+    stages_by_name = {stage['name']: stage for stage in stages}
+    manifest = load_manifest(manifest_path)
+
+    report = {}
+    running = {} # future -> stage name
+    executor = ProcessPoolExecutor(max_workers=max_workers) if max_workers != 1 else None
+
+    def finish(name: str, status: str, seconds: float = 0.0, error: str = None):
+        report[name] = {'stage': name, 'status': status, 'seconds': round(seconds, 3), 'error': error}
+        if status == 'built':
+            manifest[name] = get_stage_fingerprint(stages_by_name[name])
+            save_manifest(manifest, manifest_path)
+        if verbose:
+            print(f"{name}: {status}" + (f" in {seconds:.2f}s" if status == 'built' else '') + (f" ({error})" if error else ''))
+
+    try:
+        while len(report) < len(stages):
+            # 1. ---------- start every stage whose dependencies have all finished ----------
+            for name, deps in dependencies.items():
+                if name in report or name in running.values() or not deps <= set(report):
+                    continue
+                if any(report[dep]['status'] in ('failed', 'skipped') for dep in deps):
+                    finish(name, 'skipped', error='upstream stage failed')
+                elif not force and not is_stage_stale(stages_by_name[name], manifest):
+                    finish(name, 'up-to-date')
+                elif executor is None:
+                    try:
+                        finish(name, 'built', _run_stage(stages_by_name[name]['build']))
+                    except Exception as error:
+                        finish(name, 'failed', error=repr(error))
+                else:
+                    running[executor.submit(_run_stage, stages_by_name[name]['build'])] = name
+
+            # 2. ---------- wait for at least one running stage to finish ----------
+            if running:
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    name = running.pop(future)
+                    try:
+                        finish(name, 'built', future.result())
+                    except Exception as error:
+                        finish(name, 'failed', error=repr(error))
+    finally:
+        if executor is not None:
+            executor.shutdown()
+
+    return pd.DataFrame([report[stage['name']] for stage in stages])
+
+
+if __name__ == '__main__':
+    import sys
+
+    start = time.perf_counter()
+    df_report = run_build(force='--force' in sys.argv[1:], verbose=False)
+
+    print("processed_data build report\n")
+    print(df_report.drop(columns='error').to_string(index=False))
+    print(f"\nTotal wall time: {time.perf_counter() - start:.2f}s")
@@ -0,0 +1,177 @@
+import time
+import numpy as np
+import pandas as pd
+from numpy.lib.stride_tricks import sliding_window_view
+
+from src.lap_flags import LAPTIME_GROUPS, LAP_TIMES_PATH
+from src.race_sim import REPRESENTATIVE_LAP_RATIO
+
+"""
+Rolling and Stint Consistency - lap time std and MAD over rolling windows and per stint, for every driver and race
+
+processed_data/laptimes_std.csv gives one std per driver per race, so a driver who was steady for 50 laps and lost
+20 seconds in one spin looks as inconsistent as one who was ragged all race. Rolling windows and stints show
+consistency where it happened.
+
+Steps:
+1. Flag in-laps, out-laps and lap 1 (src.lap_flags) and number each driver's stints - a stint ends on an in-lap.
+    Only clean, representative laps are used - laps beyond 107% of the driver's best in the race (safety car,
+    virtual safety car, a spin) are dropped, as for the lap model in src/race_sim.py - and a window never spans a pit stop.
+2. Sort the clean laps by race, driver, stint and lap, and view the whole lap time array as overlapping windows with
+    numpy's sliding_window_view - one array for every driver, no loop per driver. A window is kept if its first and last laps are in
+    the same stint (the array is sorted, so every lap between them is too).
+3. Rolling std (ddof 1) and rolling MAD (median absolute deviation from the window median) for every window at once,
+    for 5- and 10-lap windows.
+4. Per-stint std from one groupby, then one compact row per driver and race - the laptimes_std.csv keys with the median
+    rolling std and MAD per window size and the lap-weighted mean stint std - so the season plots in src/analysis3.py
+    can swap y='laptime_std_ms' for any of these columns. Written to processed_data/laptimes_consistency.csv by src/build.py.
+
+Run from the project root: python -m src.consistency (rookie vs experienced, checked and timed against pandas rolling)
+"""
+
+LAPTIMES_CONSISTENCY_PATH = 'processed_data/laptimes_consistency.csv'
+
+ROLLING_WINDOWS = [5, 10]
+
+# -------------------------------------------------------------------------------------------------------- #
+
+# step 1 - clean laps with stint numbers
+
+def get_stint_laps(flagged: pd.DataFrame) -> pd.DataFrame:
+    """
+    Clean, representative laps of a flag_pit_laps output, with a 'stint' number (1 for the first) per driver and race,
+    sorted by race, driver and lap. Laps slower than REPRESENTATIVE_LAP_RATIO times the driver's best lap in the race
+    are dropped - a few safety car laps would otherwise set a whole stint's std.
+    """
+    laps = flagged.sort_values(['race_id', 'driver_id', 'lap_number'])
+    in_laps = laps['is_in_lap'].astype('int64')
+    laps = laps.assign(stint=in_laps.groupby([laps['race_id'], laps['driver_id']]).cumsum() - in_laps + 1)
+    laps = laps[laps['is_clean_lap']]
+
+    best = laps.groupby(['race_id', 'driver_id'])['lap_time_ms'].transform('min')
+    return laps[laps['lap_time_ms'] <= best * REPRESENTATIVE_LAP_RATIO].reset_index(drop=True)
+
+# -------------------------------------------------------------------------------------------------------- #
+
+# steps 2 & 3 - rolling windows over the whole sorted array
+
+def rolling_window_stats(values: np.ndarray, groups: np.ndarray, window: int) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Rolling std and MAD of values over windows that stay within one group.
+
+    Arguments:
+    values (np.ndarray): Lap times, sorted so every group is contiguous and in lap order.
+    groups (np.ndarray): Group code of every value, e.g. one per driver, race and stint.
+    window (int): Window length in laps.
+
+    Returns:
+    tuple[np.ndarray, np.ndarray]: Std (ddof 1) and MAD of the window ending at each value - NaN where fewer than
+    window laps of the same group end there.
+    """
+    values = np.asarray(values, dtype='float64')
+    std, mad = np.full(len(values), np.nan), np.full(len(values), np.nan)
+    if len(values) < window:
+        return std, mad
+
+    windows = sliding_window_view(values, window) # (values - window + 1, window), a view of values
+    within_group = groups[window - 1:] == groups[:len(groups) - window + 1]
+    windows = windows[within_group]
+
+    median = np.median(windows, axis=1)
+    std[window - 1:][within_group] = windows.std(axis=1, ddof=1)
+    mad[window - 1:][within_group] = np.median(np.abs(windows - median[:, np.newaxis]), axis=1)
+    return std, mad
+
+
+def get_rolling_consistency(stint_laps: pd.DataFrame, windows: list[int] = ROLLING_WINDOWS) -> pd.DataFrame:
+    """
+    Returns:
+    pd.DataFrame: stint_laps with 'rolling_std_<w>_ms' and 'rolling_mad_<w>_ms' for every window length w.
+    """
+    groups = stint_laps.groupby(['race_id', 'driver_id', 'stint'], sort=False).ngroup().to_numpy()
+    values = stint_laps['lap_time_ms'].to_numpy()
+
+    rolling = stint_laps.copy()
+    for window in windows:
+        rolling[f'rolling_std_{window}_ms'], rolling[f'rolling_mad_{window}_ms'] = rolling_window_stats(values, groups, window)
+    return rolling
+
+# -------------------------------------------------------------------------------------------------------- #
+
+# step 4 - per stint, and one compact row per driver and race
+
+def get_stint_consistency(stint_laps: pd.DataFrame) -> pd.DataFrame:
+    """
+    Returns:
+    pd.DataFrame: One row per driver, race and stint - the laptimes_std.csv keys, 'stint', 'n_laps' and 'stint_std_ms'.
+    """
+    return stint_laps.groupby(LAPTIME_GROUPS + ['stint']).agg(
+        n_laps=('lap_time_ms', 'size'),
+        stint_std_ms=('lap_time_ms', 'std'),
+    ).reset_index()
+
+
+def get_consistency_table(flagged: pd.DataFrame, windows: list[int] = ROLLING_WINDOWS) -> pd.DataFrame:
+    """
+    Compact consistency table - one row per driver and race.
+
+    Arguments:
+    flagged (pd.DataFrame): Output of src.lap_flags.flag_pit_laps on driver-lap-times-validated.csv.
+    windows (list[int]): Rolling window lengths in laps. Default is ROLLING_WINDOWS.
+
+    Returns:
+    pd.DataFrame: The laptimes_std.csv keys, 'n_clean_laps', 'n_stints', 'stint_std_ms' (mean stint std, weighted by laps)
+    and the median 'rolling_std_<w>_ms' and 'rolling_mad_<w>_ms' over each driver's race, for every window length w.
+    """
+    stint_laps = get_stint_laps(flagged)
+    rolling_columns = [f'rolling_{stat}_{window}_ms' for window in windows for stat in ['std', 'mad']]
+
+    table = get_rolling_consistency(stint_laps, windows).groupby(LAPTIME_GROUPS).agg(
+        n_clean_laps=('lap_time_ms', 'size'),
+        **{column: (column, 'median') for column in rolling_columns}
+    )
+
+    stints = get_stint_consistency(stint_laps).dropna(subset=['stint_std_ms'])
+    stints['weighted_std_ms'] = stints['stint_std_ms'] * stints['n_laps']
+    per_race = stints.groupby(LAPTIME_GROUPS).agg(n_stints=('stint', 'size'), n_laps=('n_laps', 'sum'), weighted_std_ms=('weighted_std_ms', 'sum'))
+    table = table.join(per_race)
+    table['stint_std_ms'] = table['weighted_std_ms'] / table['n_laps']
+
+    return table.reset_index()[LAPTIME_GROUPS + ['n_clean_laps', 'n_stints', 'stint_std_ms'] + rolling_columns]
+
+
+if __name__ == '__main__':
+    from src.lap_flags import flag_pit_laps
+    from src.loader import load_table
+
+    stops = load_table('pit_stops')[['raceId', 'driverId', 'lap']]
+    flagged = flag_pit_laps(pd.read_csv(LAP_TIMES_PATH), stops)
+
+    start = time.perf_counter()
+    table = get_consistency_table(flagged)
+    print(f"{len(table)} driver-races, {len(flagged):,} laps in {(time.perf_counter() - start) * 1000:.0f} ms\n")
+    print(table.groupby('rookie_or_experienced').median(numeric_only=True).drop(columns=['gp_year', 'gp_round']).round(0).T)
+
+    # the same windows with pandas groupby().rolling() - std built in, MAD through a Python function per window
+    stint_laps = get_stint_laps(flagged)
+    rolling = get_rolling_consistency(stint_laps)
+
+    start = time.perf_counter()
+    by_stint = stint_laps.groupby(['race_id', 'driver_id', 'stint'], sort=False)['lap_time_ms']
+    pandas_std = by_stint.rolling(5).std().reset_index(level=[0, 1, 2], drop=True).sort_index()
+    pandas_mad = by_stint.rolling(5).apply(lambda x: np.median(np.abs(x - np.median(x))), raw=True).reset_index(level=[0, 1, 2], drop=True).sort_index()
+    pandas_ms = (time.perf_counter() - start) * 1000
+
+    start = time.perf_counter()
+    get_rolling_consistency(stint_laps, windows=[5])
+    strided_ms = (time.perf_counter() - start) * 1000
+
+    assert np.allclose(rolling['rolling_std_5_ms'], pandas_std, equal_nan=True)
+    assert np.allclose(rolling['rolling_mad_5_ms'], pandas_mad, equal_nan=True)
+    print(f"\n5-lap rolling std and MAD - pandas groupby().rolling(): {pandas_ms:.0f} ms, strided windows: {strided_ms:.1f} ms (same values)")
+
+    # every driver of every season - the lap table tiled 40 times, as separate races
+    tiled = pd.concat([flagged.assign(race_id=flagged['race_id'] + copy * 10_000, gp_year=flagged['gp_year'] + copy * 100) for copy in range(40)], ignore_index=True)
+    start = time.perf_counter()
+    get_consistency_table(tiled)
+    print(f"{len(tiled):,} laps ({tiled['race_id'].nunique():,} races): {time.perf_counter() - start:.2f} s")
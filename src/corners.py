@@ -0,0 +1,454 @@
+import os
+import time
+from functools import partial
+import numpy as np
+import pandas as pd
+
+from src.ingest import FASTF1_CACHE_DIR, ingest_sessions, read_session_store
+from src.kpi2 import MIDFIELD_TEAMS, circuit_type
+from src.telemetry import TEAM, interpolate_traces
+
+"""
+Corner Deficits - corners detected from FastF1 position and speed data, and Williams' time loss in each
+
+KPI 2's hypothesis is that Williams lost more time in technical sectors than in power sectors, but a sector holds
+straights and corners alike. Timing every corner separately tests the hypothesis where it is meant to apply.
+
+Steps:
+1. For each session, load position and car data (X, Y, speed, time, distance) for the fastest lap of every midfield
+    driver - or every accurate lap, for full-session telemetry.
+2. Circuit layout: the session's fastest lap resampled every REFERENCE_STEP_M metres is the reference line. Corners are
+    local minima of its smoothed speed along distance, at least MIN_CORNER_DROP_KMH below the speed either side; each corner
+    spans CORNER_RADIUS_M either side of its apex (split halfway where two corners are closer). The layout is cached per
+    circuit in cache/corners/ and reused by every later session on the same layout - the first one stored wins, so every
+    season is timed over the same corners.
+3. Every telemetry sample of every lap is matched to its nearest point on the reference line with a KD-tree over the
+    line's X/Y (scipy.spatial.cKDTree) - O(log n) per sample instead of a distance scan over the whole line. That gives
+    each sample a position along the reference line, consistent across cars, and the corner it is in.
+4. Per lap and corner: minimum speed over the samples in the corner, and entry and exit times interpolated at the
+    corner's boundaries on the reference line (src.telemetry.interpolate_traces - every lap and corner in one pass).
+    Sessions run across a process pool through src.ingest and are stored in cache/corner_times/.
+5. Williams' per-corner deficit = best Williams corner time - fastest midfield corner time, with the minimum speed gap.
+
+Limitations:
+- FastF1 X/Y come from the timing feed at roughly 4 Hz and are merged with car data, so a corner's entry and exit
+    times are interpolated between samples ~20 m apart at speed - corner deficits below ~0.01 s are noise.
+- Where the track passes close to itself (Suzuka's crossover), a sample can match the other part of the line.
+    Positions along the line are forced to increase through the lap, which clears up most of these.
+
+Run from the project root: python -m src.corners (the KPI 2 qualifying sessions - needs fastf1 and network access,
+or a populated FastF1 cache - plus a KD-tree vs distance scan benchmark)
+"""
+
+CORNER_STORE_DIR = 'cache/corner_times'
+LAYOUT_CACHE_DIR = 'cache/corners'
+
+# spacing of the reference line, in metres
+REFERENCE_STEP_M = 1.0
+
+# corner detection - speed smoothed over SMOOTHING_M, minima at least MIN_CORNER_DROP_KMH deep and MIN_CORNER_GAP_M apart
+SMOOTHING_M = 50
+MIN_CORNER_DROP_KMH = 10.0
+MIN_CORNER_GAP_M = 100
+
+# a corner spans this far either side of its apex, along the reference line
+CORNER_RADIUS_M = 100.0
+
+# a cached layout is reused if its length is within this share of the session's reference lap
+LAYOUT_TOLERANCE = 0.02
+
+# -------------------------------------------------------------------------------------------------------- #
+
+# step 1 - position and car data of the laps
+
+def load_lap_positions(year: int, event: str, session_type: str,
+                       teams: list[str] = MIDFIELD_TEAMS,
+                       fastest_only: bool = True,
+                       fastf1_cache_dir: str = FASTF1_CACHE_DIR,
+                       offline: bool = False) -> pd.DataFrame:
+    """
+    Load merged position and car data for the laps of the given teams in one session.
+
+    Arguments:
+    year (int): The season, e.g. 2019.
+    event (str): The GP name, e.g. 'Monaco Grand Prix'.
+    session_type (str): The FastF1 session identifier, e.g. 'Q'.
+    teams (list[str]): Teams to load. Default is MIDFIELD_TEAMS.
+    fastest_only (bool): If True, only each driver's fastest accurate lap - otherwise every accurate lap. Default is True.
+    fastf1_cache_dir (str): The FastF1 cache directory. Default is 'cache/fastf1'. None disables the cache.
+    offline (bool): If True, only use data already in the FastF1 cache - never download. Default is False.
+
+    Returns:
+    pd.DataFrame: One row per telemetry sample - 'Team', 'Driver', 'LapNumber', 'LapTime' (seconds), 'Distance' (metres),
+    'Time' (seconds from the start of the lap), 'Speed' (km/h), and 'X' and 'Y' (metres).
+    """
+    import fastf1 # imported lazily - heavy, and each worker process imports it once
+
+    if fastf1_cache_dir is not None:
+        os.makedirs(fastf1_cache_dir, exist_ok=True)
+        fastf1.Cache.enable_cache(fastf1_cache_dir)
+        fastf1.Cache.offline_mode(offline)
+
+    session = fastf1.get_session(year, event, session_type)
+    session.load(laps=True, telemetry=True, weather=False, messages=False)
+
+    laps = session.laps
+    laps = laps[laps['Team'].isin(teams) & (laps['IsAccurate'] == True)] # accurate laps only, as KPI 2
+
+    if fastest_only:
+        selected = [laps[laps['Driver'] == driver].pick_fastest() for driver in laps['Driver'].unique()]
+    else:
+        selected = [lap for _, lap in laps.iterlaps()]
+
+    traces = []
+    for lap in selected:
+        if lap is None or pd.isna(lap['LapTime']):
+            continue
+
+        telemetry = lap.get_telemetry() # position and car data merged, with distance
+        traces.append(pd.DataFrame({
+            'Team': lap['Team'],
+            'Driver': lap['Driver'],
+            'LapNumber': int(lap['LapNumber']),
+            'LapTime': lap['LapTime'].total_seconds(),
+            'Distance': telemetry['Distance'].to_numpy(dtype='float64'),
+            'Time': telemetry['Time'].dt.total_seconds().to_numpy(),
+            'Speed': telemetry['Speed'].to_numpy(dtype='float64'),
+            'X': telemetry['X'].to_numpy(dtype='float64') / 10, # FastF1 positions are in 1/10 m
+            'Y': telemetry['Y'].to_numpy(dtype='float64') / 10,
+        }))
+    return pd.concat(traces, ignore_index=True) if traces else pd.DataFrame()
+
+# -------------------------------------------------------------------------------------------------------- #
+
+# step 2 - the reference line, its corners, and the layout cache
+
+def get_reference_line(lap: pd.DataFrame, step_m: float = REFERENCE_STEP_M) -> pd.DataFrame:
+    """
+    Resample one lap's position and speed every step_m metres along the lap.
+
+    Returns:
+    pd.DataFrame: 'distance_m', 'X', 'Y' and 'speed_kmh' on the grid.
+    """
+    lap = lap.sort_values('Distance')
+    grid = np.arange(0, lap['Distance'].max(), step_m)
+    return pd.DataFrame({'distance_m': grid, **{column: np.interp(grid, lap['Distance'], lap[source])
+                                               for column, source in [('X', 'X'), ('Y', 'Y'), ('speed_kmh', 'Speed')]}})
+
+
+def detect_corners(line: pd.DataFrame) -> pd.DataFrame:
+    """
+    Find corners as local minima of speed along the reference line.
+
+    Arguments:
+    line (pd.DataFrame): Output of get_reference_line.
+
+    Returns:
+    pd.DataFrame: line with 'corner' (number of the corner each point is in, from 1 - 0 if in none) and 'is_apex'.
+    """
+    from scipy.ndimage import uniform_filter1d
+    from scipy.signal import find_peaks # imported lazily - only needed to build a layout
+
+    step_m = line['distance_m'].iloc[1] - line['distance_m'].iloc[0]
+    speed = uniform_filter1d(line['speed_kmh'].to_numpy(), size=max(1, int(SMOOTHING_M / step_m)), mode='wrap') # the lap is a loop
+    apexes, _ = find_peaks(-speed, prominence=MIN_CORNER_DROP_KMH, distance=max(1, int(MIN_CORNER_GAP_M / step_m)))
+
+    # corner boundaries - CORNER_RADIUS_M either side of the apex, split halfway between close corners
+    distance = line['distance_m'].to_numpy()
+    apex_m = distance[apexes]
+    halfway = (apex_m[1:] + apex_m[:-1]) / 2
+    entry_m = np.maximum(apex_m - CORNER_RADIUS_M, np.r_[0, halfway])
+    exit_m = np.minimum(apex_m + CORNER_RADIUS_M, np.r_[halfway, distance[-1]])
+
+    corner = np.searchsorted(entry_m, distance, side='right') # candidate corner, from 1
+    inside = (corner > 0) & (distance <= exit_m[np.maximum(corner - 1, 0)])
+
+    line = line.copy()
+    line['corner'] = np.where(inside, corner, 0)
+    line['is_apex'] = np.isin(np.arange(len(line)), apexes)
+    return line
+
+
+def get_corners(line: pd.DataFrame) -> pd.DataFrame:
+    """
+    Returns:
+    pd.DataFrame: One row per corner of a detect_corners line - 'corner', 'entry_m', 'apex_m', 'exit_m', 'apex_x', 'apex_y'
+    and 'apex_speed_kmh' (reference lap).
+    """
+    in_corner = line[line['corner'] > 0]
+    corners = in_corner.groupby('corner')['distance_m'].agg(entry_m='min', exit_m='max')
+    apexes = line[line['is_apex']].set_index('corner')[['distance_m', 'X', 'Y', 'speed_kmh']]
+    apexes.columns = ['apex_m', 'apex_x', 'apex_y', 'apex_speed_kmh']
+    return corners.join(apexes).reset_index()[['corner', 'entry_m', 'apex_m', 'exit_m', 'apex_x', 'apex_y', 'apex_speed_kmh']]
+
+
+def get_circuit_layout(event: str, reference_lap: pd.DataFrame, layout_dir: str = LAYOUT_CACHE_DIR) -> pd.DataFrame:
+    """
+    The cached layout for a circuit, built from reference_lap if no cached layout of the same length exists.
+
+    Arguments:
+    event (str): The GP name, e.g. 'Monaco Grand Prix' - the cache key, with the layout length.
+    reference_lap (pd.DataFrame): One lap of load_lap_positions output, e.g. the session's fastest.
+    layout_dir (str): The layout cache. Default is 'cache/corners'.
+
+    Returns:
+    pd.DataFrame: The detect_corners line of the layout.
+    """
+    event_slug = event.lower().replace(' ', '-')
+    lap_length = reference_lap['Distance'].max()
+
+    # one file per layout of the circuit - a changed layout (a new chicane, a different length) gets the next number
+    layout = 0
+    os.makedirs(layout_dir, exist_ok=True)
+    while os.path.exists(path := os.path.join(layout_dir, f'{event_slug}_{layout}.parquet')):
+        line = pd.read_parquet(path)
+        if abs(line['distance_m'].iloc[-1] - lap_length) <= LAYOUT_TOLERANCE * lap_length:
+            return line
+        layout += 1
+
+    line = detect_corners(get_reference_line(reference_lap))
+    line.to_parquet(path + f'.{os.getpid()}.tmp', compression='zstd', index=False)
+    try:
+        os.link(path + f'.{os.getpid()}.tmp', path) # fails if another worker stored this layout first - theirs is kept
+    except FileExistsError:
+        pass
+    finally:
+        os.remove(path + f'.{os.getpid()}.tmp')
+    return pd.read_parquet(path)
+
+# -------------------------------------------------------------------------------------------------------- #
+
+# step 3 - every sample onto the reference line, through a KD-tree
+
+def map_to_line(line: pd.DataFrame, x: np.ndarray, y: np.ndarray, lap_fraction: np.ndarray, trace: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Nearest reference line point of every sample, as a position along the line that increases through each lap.
+
+    Arguments:
+    line (pd.DataFrame): A detect_corners line.
+    x, y (np.ndarray): Position of every sample, in metres.
+    lap_fraction (np.ndarray): How far through its own lap each sample is, 0 to 1 - used to unwrap the start/finish line.
+    trace (np.ndarray): Lap number of every sample, 0 to laps - 1, ascending, samples of a lap in time order.
+
+    Returns:
+    tuple[np.ndarray, np.ndarray]: Index of the nearest line point, and position along the line in metres - can run
+    slightly below 0 or above the line's length at the start and end of a lap.
+    """
+    from scipy.spatial import cKDTree # imported lazily - only needed for corner timing
+
+    _, nearest = cKDTree(line[['X', 'Y']].to_numpy()).query(np.column_stack([x, y]))
+    length = line['distance_m'].iloc[-1]
+    position = line['distance_m'].to_numpy()[nearest]
+
+    # samples just before the line at the start of a lap match the end of the line, and vice versa
+    position = np.where((lap_fraction < 0.25) & (position > 0.75 * length), position - length, position)
+    position = np.where((lap_fraction > 0.75) & (position < 0.25 * length), position + length, position)
+
+    # running max within each lap - offset every lap so one accumulate does them all
+    offset = trace * 4 * length
+    position = np.maximum.accumulate(position + offset) - offset
+    return nearest, position
+
+# -------------------------------------------------------------------------------------------------------- #
+
+# step 4 - minimum speed, entry and exit time per lap and corner
+
+def get_corner_times(telemetry: pd.DataFrame, line: pd.DataFrame) -> pd.DataFrame:
+    """
+    Time every lap through every corner of a layout.
+
+    Arguments:
+    telemetry (pd.DataFrame): Output of load_lap_positions.
+    line (pd.DataFrame): The layout, from get_circuit_layout.
+
+    Returns:
+    pd.DataFrame: One row per lap and corner - 'Team', 'Driver', 'LapNumber', 'LapTime', 'corner', 'apex_m',
+    'min_speed_kmh', 'entry_s' and 'exit_s' (from the start of the lap) and 'corner_time_s'.
+    """
+    telemetry = telemetry.sort_values(['Driver', 'LapNumber', 'Time'], kind='stable')
+    trace = telemetry.groupby(['Driver', 'LapNumber'], sort=False).ngroup().to_numpy()
+    lap_length = telemetry.groupby(trace)['Distance'].transform('max').to_numpy()
+
+    nearest, position = map_to_line(line, telemetry['X'].to_numpy(), telemetry['Y'].to_numpy(),
+                                    telemetry['Distance'].to_numpy() / lap_length, trace)
+
+    corners = get_corners(line)
+    n_corners = len(corners)
+
+    # minimum speed - each sample counts towards the corner of its nearest line point
+    corner = line['corner'].to_numpy()[nearest]
+    in_corner = corner > 0
+    min_speed = pd.Series(telemetry['Speed'].to_numpy()[in_corner]).groupby([trace[in_corner], corner[in_corner]]).min()
+    min_speed_kmh = np.full((trace.max() + 1, n_corners), np.nan)
+    min_speed_kmh[min_speed.index.get_level_values(0), min_speed.index.get_level_values(1) - 1] = min_speed.to_numpy()
+
+    # entry and exit times - every boundary of every lap in one interpolation along the reference line
+    boundaries = np.column_stack([corners['entry_m'], corners['exit_m']]).ravel()
+    elapsed = interpolate_traces(boundaries, position, telemetry[['Time']].to_numpy(dtype='float64'), trace)[:, :, 0]
+    entry_s, exit_s = elapsed[:, 0::2], elapsed[:, 1::2]
+
+    laps = telemetry.drop_duplicates(['Driver', 'LapNumber'])
+    n_laps = len(laps)
+    return pd.DataFrame({
+        **{column: np.repeat(laps[column].to_numpy(), n_corners) for column in ['Team', 'Driver', 'LapNumber', 'LapTime']},
+        'corner': np.tile(corners['corner'].to_numpy(), n_laps),
+        'apex_m': np.tile(corners['apex_m'].to_numpy(), n_laps),
+        'min_speed_kmh': min_speed_kmh.ravel(),
+        'entry_s': entry_s.ravel(),
+        'exit_s': exit_s.ravel(),
+        'corner_time_s': (exit_s - entry_s).ravel(),
+    })
+
+
+def load_corner_times(year: int, event: str, session_type: str,
+                      load_telemetry = None,
+                      layout_dir: str = LAYOUT_CACHE_DIR) -> pd.DataFrame:
+    """
+    Session loader for src.ingest: load the laps, fetch or build the circuit layout, and time every corner.
+
+    Arguments:
+    year, event, session_type: The session, as in load_lap_positions.
+    load_telemetry (callable): Loader taking (year, event, session_type) and returning laps in the shape of
+        load_lap_positions. Default is load_lap_positions.
+    layout_dir (str): The layout cache. Default is 'cache/corners'.
+
+    Returns:
+    pd.DataFrame: get_corner_times output with added 'Year' and 'Race' columns - empty if the session has no laps.
+    """
+    telemetry = (load_telemetry or load_lap_positions)(year, event, session_type)
+    if telemetry.empty:
+        return pd.DataFrame()
+
+    fastest = telemetry.loc[telemetry['LapTime'].idxmin(), ['Driver', 'LapNumber']]
+    reference_lap = telemetry[(telemetry['Driver'] == fastest['Driver']) & (telemetry['LapNumber'] == fastest['LapNumber'])]
+    line = get_circuit_layout(event, reference_lap, layout_dir)
+
+    corner_times = get_corner_times(telemetry, line)
+    corner_times.insert(0, 'Year', year)
+    corner_times.insert(1, 'Race', event)
+    return corner_times
+
+
+def time_corners(sessions: list[tuple[int, str, str]],
+                 store_dir: str = CORNER_STORE_DIR,
+                 layout_dir: str = LAYOUT_CACHE_DIR,
+                 load_telemetry = None,
+                 max_workers: int = None,
+                 refresh: bool = False) -> pd.DataFrame:
+    """
+    Time the corners of every session missing from the store across a process pool (src.ingest.ingest_sessions).
+
+    Arguments:
+    sessions (list[tuple[int, str, str]]): (year, event, session_type) for each session, e.g. (2019, 'Monaco Grand Prix', 'Q').
+    store_dir (str): The corner time store. Default is 'cache/corner_times'.
+    layout_dir (str): The layout cache. Default is 'cache/corners'.
+    load_telemetry (callable): Lap loader, as in load_corner_times - must be picklable. Default is load_lap_positions.
+    max_workers (int): Number of worker processes - 1 processes sessions in this process. Default is one per CPU.
+    refresh (bool): If True, retime sessions already in the store - cached layouts are kept. Default is False.
+
+    Returns:
+    pd.DataFrame: The ingest_sessions report - one row per session, 'rows' being laps x corners.
+    """
+    loader = partial(load_corner_times, load_telemetry=load_telemetry, layout_dir=layout_dir)
+    return ingest_sessions(sessions, store_dir=store_dir, load_laps=loader, max_workers=max_workers, refresh=refresh, verbose=False)
+
+
+def read_corner_times(years: list[int] = None, session_type: str = 'Q', store_dir: str = CORNER_STORE_DIR) -> pd.DataFrame:
+    """
+    Returns:
+    pd.DataFrame: Stored corner times of every session of session_type (and of years, if given).
+    """
+    return read_session_store(store_dir, years=years, session_type=session_type)
+
+# -------------------------------------------------------------------------------------------------------- #
+
+# step 5 - Williams' deficit per corner
+
+def get_corner_deficits(corner_times: pd.DataFrame, team: str = TEAM) -> pd.DataFrame:
+    """
+    Team's best time through every corner against the fastest midfield time.
+
+    Arguments:
+    corner_times (pd.DataFrame): Output of read_corner_times.
+    team (str): Team to compare. Default is 'Williams'.
+
+    Returns:
+    pd.DataFrame: One row per session and corner where team has a lap - 'year', 'race', 'corner', 'apex_m', 'fastest_s',
+    'fastest_driver', 'fastest_team', 'team_s', 'deficit_s', 'min_speed_kmh' (team's best), 'fastest_min_speed_kmh',
+    'speed_deficit_kmh' and 'circuit_type'.
+    """
+    keys = ['Year', 'Race', 'corner']
+    timed = corner_times.dropna(subset=['corner_time_s'])
+
+    fastest = timed.loc[timed.groupby(keys)['corner_time_s'].idxmin()].set_index(keys)
+    team_times = timed[timed['Team'] == team].groupby(keys).agg(team_s=('corner_time_s', 'min'), min_speed_kmh=('min_speed_kmh', 'max'))
+    midfield_speed = timed.groupby(keys)['min_speed_kmh'].max().rename('fastest_min_speed_kmh')
+
+    deficits = team_times.join(fastest[['apex_m', 'corner_time_s', 'Driver', 'Team']]).join(midfield_speed).reset_index()
+    deficits = deficits.rename(columns={'Year': 'year', 'Race': 'race', 'corner_time_s': 'fastest_s',
+                                        'Driver': 'fastest_driver', 'Team': 'fastest_team'})
+    deficits['deficit_s'] = deficits['team_s'] - deficits['fastest_s']
+    deficits['speed_deficit_kmh'] = deficits['fastest_min_speed_kmh'] - deficits['min_speed_kmh']
+    deficits['circuit_type'] = deficits['race'].map(circuit_type)
+
+    return deficits[['year', 'race', 'corner', 'apex_m', 'fastest_s', 'fastest_driver', 'fastest_team', 'team_s', 'deficit_s',
+                     'min_speed_kmh', 'fastest_min_speed_kmh', 'speed_deficit_kmh', 'circuit_type']]
+
+# -------------------------------------------------------------------------------------------------------- #
+
+# benchmark - nearest line point by a distance scan, the approach the KD-tree replaces
+
+def get_nearest_by_scan(line: pd.DataFrame, x: np.ndarray, y: np.ndarray, chunk_size: int = 2048) -> np.ndarray:
+    """
+    Index of the nearest line point of every sample, by computing the distance to every line point (in chunks of samples).
+    """
+    points = line[['X', 'Y']].to_numpy()
+    nearest = np.empty(len(x), dtype='int64')
+    for start in range(0, len(x), chunk_size):
+        dx = x[start:start + chunk_size, np.newaxis] - points[:, 0]
+        dy = y[start:start + chunk_size, np.newaxis] - points[:, 1]
+        nearest[start:start + chunk_size] = (dx * dx + dy * dy).argmin(axis=1)
+    return nearest
+
+
+if __name__ == '__main__':
+    kpi2_sessions = [(year, race, 'Q') for year in [2018, 2019] for race in circuit_type.keys()]
+
+    start = time.perf_counter()
+    df_report = time_corners(kpi2_sessions)
+    print(df_report.drop(columns=['path', 'error']).to_string(index=False))
+    print(f"\n{len(kpi2_sessions)} sessions in {time.perf_counter() - start:.1f}s (stored sessions are skipped)\n")
+
+    df_deficits = get_corner_deficits(read_corner_times())
+    print("Williams' deficit per corner to the fastest midfield car, by circuit type:\n")
+    print(df_deficits.groupby('circuit_type')[['deficit_s', 'speed_deficit_kmh']].agg(['mean', 'median']).round(3))
+
+    print("\nThe three corners where Williams lost the most, per session:\n")
+    worst = df_deficits.sort_values('deficit_s', ascending=False).groupby(['year', 'race']).head(3)
+    print(worst.sort_values(['year', 'race', 'deficit_s'], ascending=[True, True, False]).round(3).to_string(index=False))
+
+    # full-session telemetry - every accurate lap of one session, tiled to a season's worth of samples
+    year, race, session_type = kpi2_sessions[0]
+    telemetry = load_lap_positions(year, race, session_type, fastest_only=False)
+    line = get_circuit_layout(race, telemetry[telemetry['LapTime'] == telemetry['LapTime'].min()])
+    x, y = np.tile(telemetry['X'].to_numpy(), 10), np.tile(telemetry['Y'].to_numpy(), 10)
+
+    from scipy.spatial import cKDTree
+    start = time.perf_counter()
+    _, kd_nearest = cKDTree(line[['X', 'Y']].to_numpy()).query(np.column_stack([x, y]))
+    kd_ms = (time.perf_counter() - start) * 1000
+
+    start = time.perf_counter()
+    scan_nearest = get_nearest_by_scan(line, x, y)
+    scan_ms = (time.perf_counter() - start) * 1000
+
+    points = line[['X', 'Y']].to_numpy()
+    assert np.allclose(np.hypot(x - points[kd_nearest, 0], y - points[kd_nearest, 1]),
+                       np.hypot(x - points[scan_nearest, 0], y - points[scan_nearest, 1])) # ties aside, the same points
+    print(f"\n{len(x):,} samples onto a {len(line):,}-point line - distance scan: {scan_ms:.0f} ms, KD-tree: {kd_ms:.0f} ms "
+          f"({scan_ms / kd_ms:.0f}x, same nearest points)")
+
+    start = time.perf_counter()
+    get_corner_times(telemetry, line)
+    print(f"Every corner of {telemetry.groupby(['Driver', 'LapNumber']).ngroups} laps ({len(telemetry):,} samples): "
+          f"{(time.perf_counter() - start) * 1000:.0f} ms")
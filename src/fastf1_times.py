@@ -0,0 +1,225 @@
+import time
+import numpy as np
+import pandas as pd
+
+"""
+FastF1 Time Decoder - vectorised parsing of timedelta strings
+
+FastF1 laps saved to CSV (processed_data/all-laps.csv) store every time column as a string like "0 days 00:01:22.275000".
+pd.to_timedelta parses these one string at a time, which dominates load time once every session since 2018 is loaded.
+
+Steps:
+1. Stack all requested time columns into one fixed-width byte matrix - one row per value.
+2. Locate the "HH:MM:SS" part of every row at once (after "N days ", if present) and read the digits
+    as uint8 arrays with fancy indexing, so the whole table is decoded in a single vectorised pass.
+3. Rows which do not fit the "[N days ]HH:MM:SS[.fffffffff]" layout (e.g. negative timedeltas) fall back to pd.to_timedelta.
+4. Return int64 nanoseconds or milliseconds, with missing values as NaT's integer value (np.iinfo(np.int64).min).
+
+Run from the project root: python -m src.fastf1_times (prints a benchmark against pd.to_timedelta)
+"""
+
+# every FastF1 lap time column stored as a timedelta string
+FASTF1_TIME_COLUMNS = [
+    'Time', 'LapTime', 'PitOutTime', 'PitInTime',
+    'Sector1Time', 'Sector2Time', 'Sector3Time',
+    'Sector1SessionTime', 'Sector2SessionTime', 'Sector3SessionTime',
+    'LapStartTime'
+]
+
+# integer value of NaT - marks missing times in the int64 arrays
+NAT_VALUE = np.iinfo(np.int64).min
+
+NS_PER_UNIT = {'ns': 1, 'ms': 1_000_000}
+
+# -------------------------------------------------------------------------------------------------------- #
+
+# steps 1-3 - decode a flat array of timedelta strings
+
+def decode_timedelta_strings(values: np.ndarray) -> np.ndarray:
+    """
+    Decode timedelta strings, e.g. "0 days 00:01:22.275000" or "00:01:22.275", into int64 nanoseconds.
+
+    Arguments:
+    values (np.ndarray): A 1-D array of strings - NaN, None or '' are treated as missing.
+
+    Returns:
+    np.ndarray: int64 nanoseconds, NAT_VALUE where missing.
+    """
+    values = np.asarray(values, dtype=object)
+    missing = pd.isna(values) | (values == '')
+    nanoseconds = np.full(len(values), NAT_VALUE, dtype=np.int64)
+
+    if missing.all():
+        return nanoseconds
+
+    # 1. ---------- fixed-width byte matrix: one row per string, right-padded with zero bytes ----------
+    text = np.where(missing, '', values).astype('S')
+    chars = text.view(np.uint8).reshape(len(text), text.itemsize)
+    chars = np.pad(chars, ((0, 0), (0, 18))) # room to index past the end of the longest string
+    rows = np.arange(len(chars))
+
+    # 2. ---------- find where "HH:MM:SS" starts - after "N days ", or at the start of the string ----------
+    days_end = np.char.find(text, b' days ')
+    time_start = np.where(days_end >= 0, days_end + len(' days '), 0)
+
+    # only the bytes at known offsets from time_start are ever read - never the whole matrix
+    def char_at(offset: int) -> np.ndarray:
+        return chars[rows, time_start + offset]
+
+    def digit_at(offset: int) -> tuple[np.ndarray, np.ndarray]:
+        digit = char_at(offset).astype(np.int64) - ord('0')
+        is_digit = (digit >= 0) & (digit <= 9)
+        return np.where(is_digit, digit, 0), is_digit
+
+    well_formed = ~missing
+
+    # days - every digit before " days ", e.g. "12 days" -> 12
+    days = np.zeros(len(chars), dtype=np.int64)
+    for position in range(max(int(days_end.max()), 0)):
+        in_days = position < days_end
+        digit = chars[:, position].astype(np.int64) - ord('0')
+        days = np.where(in_days, days * 10 + digit, days)
+        well_formed &= ~in_days | ((digit >= 0) & (digit <= 9))
+
+    # hours, minutes, seconds - "HH:MM:SS"
+    clock = []
+    for offset in [0, 3, 6]:
+        tens, tens_ok = digit_at(offset)
+        units, units_ok = digit_at(offset + 1)
+        clock.append(tens * 10 + units)
+        well_formed &= tens_ok & units_ok
+    hours, minutes, seconds = clock
+    well_formed &= (char_at(2) == ord(':')) & (char_at(5) == ord(':'))
+
+    # fraction - up to 9 digits after the '.', each digit worth 10^(8 - k) nanoseconds
+    has_fraction = char_at(8) == ord('.')
+    fraction = np.zeros(len(chars), dtype=np.int64)
+    n_fraction_digits = np.zeros(len(chars), dtype=np.int64)
+    still_digits = has_fraction.copy()
+    for k in range(9):
+        digit, is_digit = digit_at(9 + k)
+        still_digits &= is_digit
+        fraction += np.where(still_digits, digit * 10 ** (8 - k), 0)
+        n_fraction_digits += still_digits
+
+    # 3. ---------- check the layout, fall back to pd.to_timedelta for anything unusual ----------
+    end = time_start + np.where(has_fraction, 9 + n_fraction_digits, 8) # first byte after the time
+    well_formed &= (~has_fraction | (n_fraction_digits > 0)) & (chars[rows, end] == 0) # nothing may follow the time
+
+    total_seconds = days * 86400 + hours * 3600 + minutes * 60 + seconds
+    nanoseconds[well_formed] = total_seconds[well_formed] * 1_000_000_000 + fraction[well_formed]
+
+    fallback = ~missing & ~well_formed
+    if fallback.any():
+        nanoseconds[fallback] = pd.to_timedelta(values[fallback]).to_numpy(dtype='timedelta64[ns]').astype(np.int64)
+
+    return nanoseconds
+
+# -------------------------------------------------------------------------------------------------------- #
+
+# step 4 - decode whole DataFrames of FastF1 time columns
+
+def decode_time_columns(df: pd.DataFrame, columns: list[str] = None, unit: str = 'ns') -> dict[str, np.ndarray]:
+    """
+    Decode several time columns in one pass - the columns are stacked end to end and decoded together.
+    Columns that are already timedelta64 are converted without parsing.
+
+    Arguments:
+    df (pd.DataFrame): A DataFrame of FastF1 laps, e.g. processed_data/all-laps.csv.
+    columns (list[str]): The time columns to decode. Default is every FASTF1_TIME_COLUMNS column present in df.
+    unit (str): 'ns' or 'ms' - milliseconds are rounded down. Default is 'ns'.
+
+    Returns:
+    dict[str, np.ndarray]: int64 array per column, NAT_VALUE where missing.
+    """
+    if unit not in NS_PER_UNIT:
+        raise ValueError(f"unit must be one of {list(NS_PER_UNIT)}, not '{unit}'")
+    if columns is None:
+        columns = [col for col in FASTF1_TIME_COLUMNS if col in df.columns]
+
+    string_columns = [col for col in columns if not pd.api.types.is_timedelta64_dtype(df[col])]
+
+    decoded = {}
+    if string_columns:
+        stacked = decode_timedelta_strings(np.concatenate([df[col].to_numpy(dtype=object) for col in string_columns]))
+        for i, col in enumerate(string_columns):
+            decoded[col] = stacked[i * len(df):(i + 1) * len(df)]
+    for col in columns:
+        if col not in decoded:
+            decoded[col] = df[col].to_numpy(dtype='timedelta64[ns]').astype(np.int64)
+
+    if unit != 'ns':
+        for col in columns:
+            values = decoded[col]
+            decoded[col] = np.where(values == NAT_VALUE, NAT_VALUE, values // NS_PER_UNIT[unit])
+
+    return {col: decoded[col] for col in columns}
+
+
+def to_timedelta_columns(df: pd.DataFrame, columns: list[str] = None) -> pd.DataFrame:
+    """
+    Drop-in replacement for looping pd.to_timedelta over columns: returns a copy of df
+    with the given time columns converted to timedelta64[ns].
+
+    Arguments:
+    df (pd.DataFrame): A DataFrame of FastF1 laps.
+    columns (list[str]): The time columns to convert. Default is every FASTF1_TIME_COLUMNS column present in df.
+
+    Returns:
+    pd.DataFrame: A copy of df with timedelta64[ns] time columns.
+    """
+    df = df.copy()
+    for col, values in decode_time_columns(df, columns).items():
+        df[col] = values.view('timedelta64[ns]')
+    return df
+
+# -------------------------------------------------------------------------------------------------------- #
+
+# benchmark against pd.to_timedelta, column by column
+
+def compare_decode_times(df: pd.DataFrame, columns: list[str] = None, repeats: int = 3) -> pd.DataFrame:
+    """
+    Time decode_time_columns against pd.to_timedelta on every column, and check both give the same values.
+
+    Returns:
+    pd.DataFrame: One row per method with columns 'method', 'rows', 'values', 'best_ms' and 'values_per_s'.
+    """
+    if columns is None:
+        columns = [col for col in FASTF1_TIME_COLUMNS if col in df.columns]
+
+    def best_of(decode) -> float:
+        timings = []
+        for _ in range(repeats):
+            start = time.perf_counter()
+            decode()
+            timings.append((time.perf_counter() - start) * 1000)
+        return min(timings)
+
+    # sanity check before timing anything
+    decoded = decode_time_columns(df, columns)
+    for col in columns:
+        expected = pd.to_timedelta(df[col]).to_numpy(dtype='timedelta64[ns]').astype(np.int64)
+        if not np.array_equal(decoded[col], expected):
+            raise ValueError(f"decoded values for '{col}' do not match pd.to_timedelta")
+
+    n_values = len(df) * len(columns)
+    results = [
+        {'method': 'pd.to_timedelta per column', 'best_ms': best_of(lambda: [pd.to_timedelta(df[col]) for col in columns])},
+        {'method': 'decode_time_columns', 'best_ms': best_of(lambda: decode_time_columns(df, columns))},
+    ]
+    df_times = pd.DataFrame(results)
+    df_times.insert(1, 'rows', len(df))
+    df_times.insert(2, 'values', n_values)
+    df_times['values_per_s'] = (n_values / (df_times['best_ms'] / 1000)).astype(int)
+
+    return df_times.round(1)
+
+
+if __name__ == '__main__':
+    df_laps = pd.read_csv('processed_data/all-laps.csv')
+
+    # 20 sessions today - tile to roughly every qualifying session since 2018 to see how each approach scales
+    for n_copies in [1, 10]:
+        df_tiled = pd.concat([df_laps] * n_copies, ignore_index=True)
+        print(f"\nDecoding {len(FASTF1_TIME_COLUMNS)} FastF1 time columns x {len(df_tiled)} laps (best of 3).\n")
+        print(compare_decode_times(df_tiled).to_string(index=False))
@@ -0,0 +1,78 @@
+import subprocess
+import sys
+import pandas as pd
+
+"""
+Startup Benchmark - cold import time of the KPI modules
+
+Short-lived workers import the KPI functions and then do a small amount of work, so import time matters.
+Each import runs in a fresh interpreter (a cold start) to avoid measuring modules already cached in sys.modules.
+
+Steps:
+1. For each module, start a new Python process which times 'import <module>'.
+2. Record which heavy dependencies were pulled in by the import - there should be none.
+3. Report the best of several runs, alongside the cost of importing pandas alone as a baseline.
+
+Run from the project root: python -m src.import_benchmark
+"""
+
+KPI_MODULES = ['src.kpi1', 'src.kpi2', 'src.kpi3']
+
+# dependencies which should only ever be imported lazily
+HEAVY_MODULES = ['fastf1', 'matplotlib', 'seaborn', 'scipy']
+
+# runs inside the child process - prints the import time in ms, then any heavy modules loaded
+TIMING_SNIPPET = """
+import sys, time
+start = time.perf_counter()
+import {module}
+elapsed_ms = (time.perf_counter() - start) * 1000
+print(elapsed_ms)
+print(','.join(m for m in {heavy} if m in sys.modules))
+"""
+
+# -------------------------------------------------------------------------------------------------------- #
+
+def time_cold_import(module: str, repeats: int = 5) -> dict:
+    """
+    Time importing a module in a fresh interpreter, several times over.
+
+    Arguments:
+    module (str): The dotted module name, e.g. 'src.kpi1'.
+    repeats (int): Number of fresh interpreters to start. Default is 5.
+
+    Returns:
+    dict: 'module', 'best_ms', 'median_ms' and 'heavy_modules_loaded' (comma separated, empty if none).
+    """
+    timings = []
+    heavy_loaded = ''
+
+    for _ in range(repeats):
+        result = subprocess.run(
+            [sys.executable, '-c', TIMING_SNIPPET.format(module=module, heavy=HEAVY_MODULES)],
+            capture_output=True, text=True, check=True
+        )
+        elapsed_ms, heavy_loaded = (result.stdout.splitlines() + [''])[:2]
+        timings.append(float(elapsed_ms))
+
+    return {
+        'module': module,
+        'best_ms': round(min(timings), 1),
+        'median_ms': round(pd.Series(timings).median(), 1),
+        'heavy_modules_loaded': heavy_loaded,
+    }
+
+
+def benchmark_imports(modules: list[str] = KPI_MODULES, repeats: int = 5) -> pd.DataFrame:
+    """
+    Cold import times for each module, with 'pandas' alone as the first row for reference.
+
+    Returns:
+    pd.DataFrame: One row per module, see time_cold_import.
+    """
+    return pd.DataFrame([time_cold_import(module, repeats) for module in ['pandas'] + modules])
+
+
+if __name__ == '__main__':
+    print("Cold import times (fresh interpreter per run, best and median of 5).\n")
+    print(benchmark_imports().to_string(index=False))
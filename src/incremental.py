@@ -0,0 +1,414 @@
+import os
+import time
+import numpy as np
+import pandas as pd
+
+from src.kpi2 import MIDFIELD_CONSTRUCTORS, circuit_type
+
+"""
+Incremental KPI Updates - append-only, per-race refreshes of the KPI 1 and KPI 3 tables
+
+Adding a Grand Prix used to mean re-running the grid-to-finish query and every KPI 1 / KPI 3 aggregation from scratch.
+Every KPI table here is keyed by race, so a new race only adds rows, and only the season and constructor averages
+the race belongs to can change. update_kpi_state() takes the new raceId(s) and touches nothing else.
+
+Stored tables (parquet, one file each in cache/kpi-state/):
+- grid_to_finish       driver rows, as processed_data/grid-to-finish.csv (sql/1-grid-to-finish.sql, rebuilt from raw_data)
+- constructor_races    per race and constructor - 'avg_grid_delta', as get_constructor_delta_panel in src/kpi1.py
+- constructor_seasons  per constructor and year - mean of race averages, as get_average_delta_by_constructor(by_year=True)
+- constructor_averages per constructor - mean of race averages over every year, as get_average_delta_by_constructor
+- laptimes_std         per race and driver - lap time standard deviation, as processed_data/laptimes_std.csv (KPI 3, src/analysis3.py)
+- consistency_seasons  per year and experience level - mean lap time standard deviation
+
+Steps:
+1. Build the race-level rows for the new races only - from raw_data for KPI 1, from their laps for KPI 3. The Ergast
+    tables are cut down to the new races before any join, and can be loaded once (load_raw_tables) and passed to every update.
+2. Replace any stored rows of those races (so re-running a race mid-weekend is safe) and insert the new rows. Race-level
+    tables are kept sorted by race_id first, so a race is one contiguous block - found by binary search, never re-sorted.
+3. Recompute only the season and constructor averages whose groups contain one of the new races.
+4. Save the tables. Rows are kept sorted by their keys, so the state matches a full rebuild exactly, whatever order races arrive in.
+
+Limitations:
+- An update has a fixed cost of a few tens of milliseconds (pandas setup per call), about what a full rebuild of the
+    2015-2019 scope costs. It only pays off once the stored history reaches a few hundred races.
+
+Run from the project root: python -m src.incremental (replays 2015-2019 race by race and checks it against a full rebuild)
+"""
+
+STATE_DIR = 'cache/kpi-state'
+
+STATE_TABLES = ['grid_to_finish', 'constructor_races', 'constructor_seasons', 'constructor_averages',
+                'laptimes_std', 'consistency_seasons']
+
+# the filters in sql/1-grid-to-finish.sql, apart from the year range - races are picked by raceId instead
+GRID_TO_FINISH_CONSTRUCTORS = MIDFIELD_CONSTRUCTORS
+GRID_TO_FINISH_GPS = list(circuit_type.keys())
+
+# -------------------------------------------------------------------------------------------------------- #
+
+# step 1 - race-level rows for a set of races
+
+def load_raw_tables(raw_dir: str = 'raw_data') -> dict[str, pd.DataFrame]:
+    """
+    The Ergast tables get_grid_to_finish_rows() reads, trimmed to the columns and rows of sql/1-grid-to-finish.sql that do
+    not depend on the race. Load once and pass to every update, rather than re-reading them per race.
+
+    Returns:
+    dict[str, pd.DataFrame]: 'races', 'results', 'constructors' and 'drivers'. results is sorted by raceId, the other
+    three are indexed by their id, so a race's rows are looked up rather than joined.
+    """
+    from src.loader import load_table
+
+    races = load_table('races', raw_dir)[['raceId', 'year', 'name', 'round']]
+    races = races[races['name'].isin(GRID_TO_FINISH_GPS)].set_index('raceId')
+
+    results = load_table('results', raw_dir)[['raceId', 'driverId', 'constructorId', 'grid', 'position']]
+    results = results[results['position'].notna() & (results['grid'] > 0)].sort_values('raceId', kind='stable')
+
+    constructors = load_table('constructors', raw_dir)[['constructorId', 'constructorRef', 'name']]
+    constructors = constructors[constructors['constructorRef'].isin(GRID_TO_FINISH_CONSTRUCTORS)].set_index('constructorId')
+
+    drivers = load_table('drivers', raw_dir)[['driverId', 'forename', 'surname']].set_index('driverId')
+
+    return {'races': races, 'results': results, 'constructors': constructors, 'drivers': drivers}
+
+
+def get_grid_to_finish_rows(race_ids: list[int], raw_dir: str = 'raw_data', raw_tables: dict[str, pd.DataFrame] = None) -> pd.DataFrame:
+    """
+    The rows of sql/1-grid-to-finish.sql for the given races, built from the Ergast tables in raw_data.
+
+    Arguments:
+    race_ids (list[int]): The raceIds to build.
+    raw_dir (str): Directory of the Ergast tables - results, drivers, constructors and races. Default is 'raw_data'.
+    raw_tables (dict[str, pd.DataFrame]): The tables from load_raw_tables() (optional - loaded from raw_dir if not given).
+
+    Returns:
+    pd.DataFrame: Same columns as processed_data/grid-to-finish.csv, sorted by race_id then driver_name.
+    """
+    if raw_tables is None:
+        raw_tables = load_raw_tables(raw_dir)
+
+    races = raw_tables['races']
+    kept_ids = np.sort(races.index.intersection(pd.Index(race_ids)).to_numpy(dtype='int64'))
+
+    # results is sorted by raceId - each race's rows are one slice, found by binary search rather than a scan
+    results = raw_tables['results']
+    starts = results['raceId'].to_numpy(dtype='int64').searchsorted(kept_ids, side='left')
+    stops = results['raceId'].to_numpy(dtype='int64').searchsorted(kept_ids, side='right')
+    results = pd.concat([results.iloc[start:stop] for start, stop in zip(starts, stops)]) if len(kept_ids) else results.iloc[:0]
+    results = results[results['constructorId'].isin(raw_tables['constructors'].index)]
+
+    # the few dozen rows left look up their race, constructor and driver by id - no join over the full tables
+    race = races.loc[results['raceId']]
+    constructor = raw_tables['constructors'].loc[results['constructorId']]
+    driver = raw_tables['drivers'].loc[results['driverId']]
+
+    rows = pd.DataFrame({
+        'race_id': results['raceId'].to_numpy(dtype='int64'),
+        'gp_year': race['year'].to_numpy(dtype='int64'),
+        'gp_name': race['name'].astype(str).to_numpy(),
+        'gp_round': race['round'].to_numpy(dtype='int64'),
+        'driver_name': (driver['forename'].astype(str) + ' ' + driver['surname'].astype(str)).to_numpy(),
+        'constructor': constructor['name'].astype(str).to_numpy(),
+        'constructor_ref': constructor['constructorRef'].astype(str).to_numpy(),
+        'is_williams': (constructor['constructorRef'] == 'williams').to_numpy(),
+        'start_position': results['grid'].to_numpy(dtype='int64'),
+        'final_position': results['position'].to_numpy(dtype='int64'),
+    })
+    rows['grid_delta'] = rows['start_position'] - rows['final_position']
+
+    return rows.sort_values(['race_id', 'driver_name']).reset_index(drop=True)
+
+
+def _group_rows(df: pd.DataFrame, keys: list[str]) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Number the groups of df by keys, in sorted key order - the same numbering groupby(keys) would give.
+    Works on factorised numpy codes, so grouping the few dozen rows of one race costs microseconds rather than the
+    fixed setup of a pandas groupby.
+
+    Returns:
+    tuple[np.ndarray, np.ndarray]: The group number of every row, and the position of each group's first row.
+    """
+    codes = np.zeros(len(df), dtype='int64')
+    for key in keys:
+        key_codes, uniques = pd.factorize(df[key], sort=True)
+        codes = codes * len(uniques) + key_codes
+    _, first_rows, codes = np.unique(codes, return_index=True, return_inverse=True)
+    return codes.reshape(-1), first_rows
+
+
+def _group_mean(codes: np.ndarray, values: pd.Series) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Returns:
+    tuple[np.ndarray, np.ndarray]: The row count and the mean of values per group number in codes. Each group is summed
+    in row order, so the same rows always give the same mean to the last bit.
+    """
+    counts = np.bincount(codes)
+    return counts, np.bincount(codes, weights=values.to_numpy(dtype='float64')) / counts
+
+
+def get_constructor_race_rows(grid_to_finish: pd.DataFrame) -> pd.DataFrame:
+    """
+    Returns:
+    pd.DataFrame: Average grid delta per race and constructor - 'race_id', 'constructor_ref', 'gp_year', 'gp_name',
+    'n_drivers', 'avg_grid_delta'.
+    """
+    # grouped on the two keys only - gp_year and gp_name follow from race_id, and are taken from each group's first row
+    codes, first_rows = _group_rows(grid_to_finish, ['race_id', 'constructor_ref'])
+    rows = grid_to_finish[['race_id', 'constructor_ref', 'gp_year', 'gp_name']].iloc[first_rows].reset_index(drop=True)
+    rows['n_drivers'], rows['avg_grid_delta'] = _group_mean(codes, grid_to_finish['grid_delta'])
+    return rows
+
+
+def get_laptimes_std_rows(laps: pd.DataFrame) -> pd.DataFrame:
+    """
+    Lap time standard deviation per race and driver, as processed_data/laptimes_std.csv.
+
+    Arguments:
+    laps (pd.DataFrame): Laps in the format of processed_data/driver-lap-times-validated.csv.
+
+    Returns:
+    pd.DataFrame: 'race_id', 'driver_id', 'gp_year', 'gp_name', 'gp_round', 'driver_name', 'rookie_or_experienced',
+    'n_laps', 'laptime_std', 'laptime_std_ms'.
+    """
+    from src.kpi3 import format_ms
+
+    # grouped on the two ids only - the other columns follow from them, and are taken from each group's first row
+    codes, first_rows = _group_rows(laps, ['race_id', 'driver_id'])
+    rows = laps[['race_id', 'driver_id', 'gp_year', 'gp_name', 'gp_round', 'driver_name',
+                 'rookie_or_experienced']].iloc[first_rows].reset_index(drop=True)
+
+    # sample standard deviation (ddof=1, as pandas), from each lap's deviation to its group mean
+    n_laps, mean_ms = _group_mean(codes, laps['lap_time_ms'])
+    deviations = laps['lap_time_ms'].to_numpy(dtype='float64') - mean_ms[codes]
+    with np.errstate(invalid='ignore', divide='ignore'): # a single lap has no spread - NaN, as pandas
+        rows['laptime_std_ms'] = np.sqrt(np.bincount(codes, weights=deviations ** 2) / (n_laps - 1))
+    rows['n_laps'] = n_laps
+    rows['laptime_std'] = format_ms(rows['laptime_std_ms'])
+
+    return rows[['race_id', 'driver_id', 'gp_year', 'gp_name', 'gp_round', 'driver_name', 'rookie_or_experienced',
+                 'n_laps', 'laptime_std', 'laptime_std_ms']]
+
+# -------------------------------------------------------------------------------------------------------- #
+
+# steps 2 & 3 - replace race rows, then refresh only the aggregates they feed
+
+def _replace_races(table: pd.DataFrame, rows: pd.DataFrame, race_ids: list[int], keys: list[str]) -> pd.DataFrame:
+    """
+    Drop the stored rows of race_ids and insert rows in their place, keeping the table sorted by keys.
+    keys starts with 'race_id', so each race is one contiguous block of the table - located by binary search on race_id,
+    and only the new rows are sorted. Adding a race after every stored one is a plain append.
+    """
+    rows = rows.sort_values(keys)
+    if table is None or table.empty:
+        return rows.reset_index(drop=True)
+
+    stored_ids = table['race_id'].to_numpy()
+    race_ids = np.unique(np.concatenate([np.asarray(race_ids, dtype=stored_ids.dtype), rows['race_id'].to_numpy(dtype=stored_ids.dtype)]))
+    starts, stops = stored_ids.searchsorted(race_ids, side='left'), stored_ids.searchsorted(race_ids, side='right')
+    new_starts = rows['race_id'].to_numpy().searchsorted(race_ids, side='left')
+    new_stops = rows['race_id'].to_numpy().searchsorted(race_ids, side='right')
+
+    # stored rows up to each race, then that race's new rows - skipping its stored block
+    pieces, cursor = [], 0
+    for start, stop, new_start, new_stop in zip(starts, stops, new_starts, new_stops):
+        pieces += [table.iloc[cursor:start], rows.iloc[new_start:new_stop]]
+        cursor = stop
+    pieces.append(table.iloc[cursor:])
+
+    # an empty piece could change column dtypes on concat, e.g. a race with no laps yet
+    return pd.concat([piece for piece in pieces if not piece.empty] or [table.iloc[:0]], ignore_index=True)
+
+
+def _refresh_groups(aggregate: pd.DataFrame, rows: pd.DataFrame, changed: pd.DataFrame,
+                    keys: list[str], value: str, name: str) -> pd.DataFrame:
+    """
+    Recompute the mean of rows[value] (and its count) for the groups in changed, and keep every other group of aggregate as stored.
+
+    Arguments:
+    aggregate (pd.DataFrame): The stored aggregate - keys, 'n_races' and name. None if nothing is stored yet.
+    rows (pd.DataFrame): The full race-level table the aggregate is computed from.
+    changed (pd.DataFrame): Race-level rows added or removed by this update - only their groups are recomputed.
+    keys (list[str]): The group columns.
+    value (str): The race-level column to average.
+    name (str): The name of the averaged column in the aggregate.
+    """
+    def group_means(rows: pd.DataFrame) -> pd.DataFrame:
+        codes, first_rows = _group_rows(rows, keys)
+        groups = rows[keys].iloc[first_rows].reset_index(drop=True)
+        groups['n_races'], groups[name] = _group_mean(codes, rows[value])
+        return groups
+
+    if aggregate is None or aggregate.empty: # nothing stored yet - every group is new
+        return group_means(rows)
+
+    touched = changed[keys].drop_duplicates()
+
+    # a boolean mask per touched group, over plain numpy columns - an update touches a handful of groups, and this avoids
+    # indexing or joining on every stored row
+    def in_touched(df: pd.DataFrame) -> np.ndarray:
+        columns = [df[key].to_numpy() for key in keys]
+        mask = np.zeros(len(df), dtype=bool)
+        for group in touched.itertuples(index=False):
+            match = np.ones(len(df), dtype=bool)
+            for column, key_value in zip(columns, group):
+                match &= column == key_value
+            mask |= match
+        return mask
+
+    recomputed = pd.concat([aggregate[~in_touched(aggregate)], group_means(rows[in_touched(rows)])], ignore_index=True)
+
+    return recomputed.sort_values(keys).reset_index(drop=True) # one row per group - small, whatever the number of races
+
+
+def update_kpi_state(state: dict[str, pd.DataFrame],
+                     race_ids: list[int],
+                     laps: pd.DataFrame = None,
+                     raw_dir: str = 'raw_data',
+                     raw_tables: dict[str, pd.DataFrame] = None) -> dict[str, pd.DataFrame]:
+    """
+    Add (or replace) races in the KPI tables, recomputing only the aggregates those races belong to.
+
+    Arguments:
+    state (dict[str, pd.DataFrame]): The current tables, by name (see STATE_TABLES) - an empty dict to start from nothing.
+    race_ids (list[int]): The raceIds to add.
+    laps (pd.DataFrame): Laps for the new races, in the format of driver-lap-times-validated.csv - rows of other races are ignored.
+        None leaves the KPI 3 tables unchanged.
+    raw_dir (str): Directory of the Ergast tables. Default is 'raw_data'.
+    raw_tables (dict[str, pd.DataFrame]): From load_raw_tables() - pass when adding races one after another (optional).
+
+    Returns:
+    dict[str, pd.DataFrame]: The updated tables. state itself is not modified.
+    """
+    state = dict(state)
+    race_ids = list(race_ids)
+
+    # ---------- KPI 1 - grid-to-finish rows and constructor averages ----------
+    grid_to_finish = get_grid_to_finish_rows(race_ids, raw_dir, raw_tables)
+    new_races = get_constructor_race_rows(grid_to_finish)
+
+    old_races = state.get('constructor_races')
+    changed = new_races if old_races is None else pd.concat([old_races[old_races['race_id'].isin(race_ids)], new_races])
+
+    state['grid_to_finish'] = _replace_races(state.get('grid_to_finish'), grid_to_finish, race_ids, ['race_id', 'driver_name'])
+    state['constructor_races'] = _replace_races(old_races, new_races, race_ids, ['race_id', 'constructor_ref'])
+
+    state['constructor_seasons'] = _refresh_groups(state.get('constructor_seasons'), state['constructor_races'], changed,
+                                                   ['constructor_ref', 'gp_year'], 'avg_grid_delta', 'avg_grid_delta_year')
+    state['constructor_averages'] = _refresh_groups(state.get('constructor_averages'), state['constructor_races'], changed,
+                                                    ['constructor_ref'], 'avg_grid_delta', 'avg_grid_delta_year')
+
+    # ---------- KPI 3 - lap time consistency per driver and per season ----------
+    if laps is not None:
+        new_std = get_laptimes_std_rows(laps[laps['race_id'].isin(race_ids)])
+
+        old_std = state.get('laptimes_std')
+        changed = new_std if old_std is None else pd.concat([old_std[old_std['race_id'].isin(race_ids)], new_std])
+
+        state['laptimes_std'] = _replace_races(old_std, new_std, race_ids, ['race_id', 'driver_id'])
+        state['consistency_seasons'] = _refresh_groups(state.get('consistency_seasons'), state['laptimes_std'], changed,
+                                                       ['gp_year', 'rookie_or_experienced'], 'laptime_std_ms', 'mean_laptime_std_ms')
+
+    return state
+
+# -------------------------------------------------------------------------------------------------------- #
+
+# step 4 - the stored state
+
+def load_kpi_state(state_dir: str = STATE_DIR) -> dict[str, pd.DataFrame]:
+    """
+    Returns:
+    dict[str, pd.DataFrame]: Every stored table in state_dir, by name - empty if nothing has been stored yet.
+    """
+    state = {}
+    for name in STATE_TABLES:
+        path = os.path.join(state_dir, f'{name}.parquet')
+        if os.path.exists(path):
+            state[name] = pd.read_parquet(path)
+    return state
+
+
+def save_kpi_state(state: dict[str, pd.DataFrame], state_dir: str = STATE_DIR) -> None:
+    # each table is written under a temporary name first, so an interrupted save never leaves a partial table behind
+    os.makedirs(state_dir, exist_ok=True)
+    for name, table in state.items():
+        path = os.path.join(state_dir, f'{name}.parquet')
+        table.to_parquet(path + '.tmp', index=False)
+        os.replace(path + '.tmp', path)
+
+
+def add_races(race_ids: list[int],
+              laps: pd.DataFrame = None,
+              state_dir: str = STATE_DIR,
+              raw_dir: str = 'raw_data') -> dict[str, pd.DataFrame]:
+    """
+    Load the stored KPI tables, add race_ids (see update_kpi_state) and save them again.
+
+    Returns:
+    dict[str, pd.DataFrame]: The updated tables.
+    """
+    state = update_kpi_state(load_kpi_state(state_dir), race_ids, laps=laps, raw_dir=raw_dir)
+    save_kpi_state(state, state_dir)
+    return state
+
+
+if __name__ == '__main__':
+    from src.kpi1 import get_average_delta_by_constructor, get_constructor_delta_panel
+    from src.kpi3 import LAP_TIMES_PATH
+    from src.loader import load_table
+
+    laps = pd.read_csv(LAP_TIMES_PATH)
+    races = load_table('races')
+    race_ids = races.loc[races['year'].between(2015, 2019), ['raceId', 'date']].sort_values('date')['raceId'].tolist()
+    raw_tables = load_raw_tables()
+
+    # full rebuild - every race at once
+    rebuilt = update_kpi_state({}, race_ids, laps=laps, raw_tables=raw_tables)
+
+    # incremental - one race at a time, in calendar order, as during a season
+    incremental = {}
+    for race_id in race_ids:
+        incremental = update_kpi_state(incremental, [race_id], laps=laps, raw_tables=raw_tables)
+
+    # re-adding a race already stored replaces it rather than double counting
+    incremental = update_kpi_state(incremental, race_ids[-1:], laps=laps, raw_tables=raw_tables)
+
+    for name in STATE_TABLES:
+        pd.testing.assert_frame_equal(incremental[name], rebuilt[name], check_exact=True)
+    print(f"Incremental state matches a full rebuild for all {len(STATE_TABLES)} tables ({len(race_ids)} races added one by one).")
+
+    # and the full rebuild matches the existing KPI 1 and KPI 3 outputs
+    grid_to_finish = pd.read_csv('processed_data/grid-to-finish-validated.csv')
+    panel = get_constructor_delta_panel(grid_to_finish).sort_values(['constructor_ref', 'gp_year', 'gp_name']).reset_index(drop=True)
+    constructor_races = rebuilt['constructor_races'].sort_values(['constructor_ref', 'gp_year', 'gp_name']).reset_index(drop=True)
+    pd.testing.assert_frame_equal(constructor_races[['constructor_ref', 'gp_year', 'gp_name', 'avg_grid_delta']],
+                                  panel[['constructor_ref', 'gp_year', 'gp_name', 'avg_grid_delta']])
+
+    seasons = get_average_delta_by_constructor(grid_to_finish, by_year=True).sort_values(['constructor_ref', 'year']).reset_index(drop=True)
+    pd.testing.assert_series_equal(rebuilt['constructor_seasons']['avg_grid_delta_year'], seasons['avg_grid_delta_year'])
+
+    laptimes_std = pd.read_csv('processed_data/laptimes_std.csv', index_col=0)
+    rebuilt_std = rebuilt['laptimes_std'].sort_values(['gp_year', 'gp_name', 'gp_round', 'driver_name']).reset_index(drop=True)
+    pd.testing.assert_frame_equal(rebuilt_std[laptimes_std.columns], laptimes_std)
+    print("Full rebuild matches grid-to-finish-validated.csv (constructor panel and season averages) and laptimes_std.csv.")
+
+    # cost of a refresh against the number of races already stored - a full rebuild grows with the history, adding the
+    # latest race should not
+    all_race_ids = races.sort_values('date')['raceId'].tolist()
+    latest = max(race_ids, key=all_race_ids.index) # the latest race the KPI tables cover, so there are rows to insert
+    history = [race_id for race_id in all_race_ids if race_id != latest]
+
+    def best_ms(run, repeats: int = 5) -> float:
+        timings = []
+        for _ in range(repeats):
+            start = time.perf_counter()
+            run()
+            timings.append((time.perf_counter() - start) * 1000)
+        return min(timings)
+
+    print("\nRaces stored | full rebuild (ms) | adding the latest race (ms)")
+    for n_stored in [len(history) // 8, len(history) // 2, len(history)]:
+        stored = update_kpi_state({}, history[-n_stored:], laps=laps, raw_tables=raw_tables)
+        rebuild_ms = best_ms(lambda: update_kpi_state({}, history[-n_stored:] + [latest], laps=laps, raw_tables=raw_tables))
+        update_ms = best_ms(lambda: update_kpi_state(stored, [latest], laps=laps[laps['race_id'] == latest], raw_tables=raw_tables))
+        print(f"{n_stored:12d} | {rebuild_ms:17.1f} | {update_ms:27.1f}")
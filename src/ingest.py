@@ -0,0 +1,233 @@
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+import pandas as pd
+
+"""
+FastF1 Session Ingestion - parallel, cached loading of session laps
+
+KPI 2 originally loaded its 20 qualifying sessions one at a time and concatenated them into processed_data/all-laps.csv.
+This stage loads sessions across a process pool and stores each session's laps in its own parquet file,
+keyed by (year, event, session type), so a re-run only fetches the sessions missing from the store.
+
+Steps:
+1. Work out which requested sessions already have a file in the store - these are skipped.
+2. Load the missing sessions in parallel. Each worker loads one session and writes its laps straight to the store,
+    returning only timing stats, so laps are never pickled back to the parent process.
+3. Report per-session status, rows, load time and rows per second.
+4. read_session_store() concatenates stored sessions back into one all-laps style DataFrame.
+
+Offline use: pass fastf1_cache_dir (a local FastF1 cache) with offline=True, or swap the loader for a stand-in,
+e.g. load_laps=partial(load_session_laps_from_csv, csv_path='processed_data/all-laps.csv').
+
+Run from the project root: python -m src.ingest
+"""
+
+SESSION_STORE_DIR = 'cache/sessions'
+FASTF1_CACHE_DIR = 'cache/fastf1'
+
+# -------------------------------------------------------------------------------------------------------- #
+
+# session loaders - each takes (year, event, session_type) and returns that session's laps
+
+def load_session_laps(year: int, event: str, session_type: str,
+                      fastf1_cache_dir: str = FASTF1_CACHE_DIR,
+                      offline: bool = False) -> pd.DataFrame:
+    """
+    Load one session's laps with FastF1 (laps only, no telemetry).
+
+    Arguments:
+    year (int): The season, e.g. 2019.
+    event (str): The GP name, e.g. 'Monaco Grand Prix'.
+    session_type (str): The FastF1 session identifier, e.g. 'Q'.
+    fastf1_cache_dir (str): The FastF1 cache directory. Default is 'cache/fastf1'. None disables the cache.
+    offline (bool): If True, only use data already in the FastF1 cache - never download. Default is False.
+
+    Returns:
+    pd.DataFrame: The session's laps, with added 'Year' and 'Race' columns.
+    """
+    import fastf1 # imported lazily - heavy, and each worker process imports it once
+
+    if fastf1_cache_dir is not None:
+        os.makedirs(fastf1_cache_dir, exist_ok=True)
+        fastf1.Cache.enable_cache(fastf1_cache_dir)
+        fastf1.Cache.offline_mode(offline)
+
+    session = fastf1.get_session(year, event, session_type)
+    session.load(laps=True, telemetry=False, weather=False, messages=False)
+
+    laps = pd.DataFrame(session.laps)
+    laps['Year'] = year
+    laps['Race'] = event
+    return laps
+
+
+def load_session_laps_from_csv(year: int, event: str, session_type: str,
+                               csv_path: str = 'processed_data/all-laps.csv') -> pd.DataFrame:
+    """
+    Stand-in loader serving sessions from an existing all-laps style CSV, for offline runs and checks.
+    The CSV has no session type column, so session_type is not used for filtering.
+
+    Returns:
+    pd.DataFrame: The laps for (year, event) in the CSV - empty if the session is not in it.
+    """
+    df = pd.read_csv(csv_path, index_col=0)
+    return df[(df['Year'] == year) & (df['Race'] == event)].reset_index(drop=True)
+
+# -------------------------------------------------------------------------------------------------------- #
+
+# step 1 - session store layout
+
+def get_session_path(year: int, event: str, session_type: str, store_dir: str = SESSION_STORE_DIR) -> str:
+    """
+    Returns:
+    str: The parquet path for a session, e.g. cache/sessions/2019/monaco-grand-prix_Q.parquet
+    """
+    event_slug = event.lower().replace(' ', '-')
+    return os.path.join(store_dir, str(year), f'{event_slug}_{session_type}.parquet')
+
+
+def _ingest_session(year: int, event: str, session_type: str, store_dir: str, load_laps) -> dict:
+    """
+    Worker task: load one session, write its laps to the store, and return timing stats.
+    The file is written under a temporary name first, so an interrupted run never leaves a partial session behind.
+    """
+    path = get_session_path(year, event, session_type, store_dir)
+    start = time.perf_counter()
+
+    try:
+        laps = load_laps(year, event, session_type)
+    except Exception as error: # one bad session should not stop the rest of the batch
+        return {'status': 'failed', 'rows': 0, 'load_s': time.perf_counter() - start, 'error': repr(error)}
+
+    load_s = time.perf_counter() - start
+    if laps.empty: # nothing stored, so the session is retried on the next run
+        return {'status': 'empty', 'rows': 0, 'load_s': load_s, 'error': None}
+
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    laps.to_parquet(path + '.tmp', compression='zstd', index=False)
+    os.replace(path + '.tmp', path)
+
+    return {'status': 'loaded', 'rows': len(laps), 'load_s': load_s, 'error': None}
+
+# -------------------------------------------------------------------------------------------------------- #
+
+# steps 2 & 3 - parallel ingestion with a per-session report
+
+def ingest_sessions(sessions: list[tuple[int, str, str]],
+                    store_dir: str = SESSION_STORE_DIR,
+                    load_laps = None,
+                    max_workers: int = None,
+                    refresh: bool = False,
+                    verbose: bool = True) -> pd.DataFrame:
+    """
+    Load every session missing from the store across a process pool, and report on each.
+
+    Arguments:
+    sessions (list[tuple[int, str, str]]): (year, event, session_type) for each session, e.g. (2019, 'Monaco Grand Prix', 'Q').
+    store_dir (str): The session store directory. Default is 'cache/sessions'.
+    load_laps (callable): Loader taking (year, event, session_type) and returning laps. Must be picklable
+        (a module-level function or functools.partial). Default is load_session_laps with the FastF1 cache in cache/fastf1.
+    max_workers (int): Number of worker processes - 1 loads sessions in this process. Default is one per CPU.
+    refresh (bool): If True, reload sessions even if they are already in the store. Default is False.
+    verbose (bool): If True, print a line per session as it finishes. Default is True.
+
+    Returns:
+    pd.DataFrame: One row per session with columns 'year', 'event', 'session_type', 'status' ('loaded', 'skipped', 'empty' or 'failed'),
+    'rows', 'load_s', 'rows_per_s', 'error' and 'path'.
+    """
+    if load_laps is None:
+        load_laps = load_session_laps
+
+    report = []
+    to_load = []
+
+    # 1. ---------- skip sessions already in the store ----------
+    for year, event, session_type in sessions:
+        row = {'year': year, 'event': event, 'session_type': session_type,
+               'path': get_session_path(year, event, session_type, store_dir)}
+        if not refresh and os.path.exists(row['path']):
+            row.update({'status': 'skipped', 'rows': pd.read_parquet(row['path'], columns=['Year']).shape[0],
+                        'load_s': 0.0, 'error': None})
+        else:
+            to_load.append(row)
+        report.append(row)
+
+    # 2. ---------- load the rest in parallel ----------
+    task = partial(_ingest_session, store_dir=store_dir, load_laps=load_laps)
+    args = [(row['year'], row['event'], row['session_type']) for row in to_load]
+
+    if max_workers == 1 or len(to_load) <= 1:
+        results = (task(*arg) for arg in args)
+        executor = None
+    else:
+        executor = ProcessPoolExecutor(max_workers=max_workers)
+        results = executor.map(task, *zip(*args)) if args else iter([])
+
+    try:
+        for row, stats in zip(to_load, results):
+            row.update(stats)
+            if verbose:
+                print(f"{row['year']} {row['event']} {row['session_type']}: {row['status']}, "
+                      f"{row['rows']} laps in {row['load_s']:.2f}s")
+    finally:
+        if executor is not None:
+            executor.shutdown()
+
+    # 3. ---------- report ----------
+    df_report = pd.DataFrame(report)[['year', 'event', 'session_type', 'status', 'rows', 'load_s', 'error', 'path']]
+    df_report['rows_per_s'] = (df_report['rows'] / df_report['load_s']).where(df_report['load_s'] > 0).round(1)
+    df_report['load_s'] = df_report['load_s'].round(3)
+
+    return df_report[['year', 'event', 'session_type', 'status', 'rows', 'load_s', 'rows_per_s', 'error', 'path']]
+
+# -------------------------------------------------------------------------------------------------------- #
+
+# step 4 - read stored sessions back as a single DataFrame
+
+def read_session_store(store_dir: str = SESSION_STORE_DIR,
+                       years: list[int] = None,
+                       session_type: str = None,
+                       events: list[str] = None) -> pd.DataFrame:
+    """
+    Concatenate stored sessions into one DataFrame, equivalent to processed_data/all-laps.csv.
+
+    Arguments:
+    store_dir (str): The session store directory. Default is 'cache/sessions'.
+    years (list[int]): Seasons to read (optional - default is every season in the store).
+    session_type (str): Only read sessions of this type, e.g. 'Q' (optional).
+    events (list[str]): Only read sessions of these GPs, e.g. ['Monaco Grand Prix'] (optional - default is every GP).
+
+    Returns:
+    pd.DataFrame: Laps of every matching session, in year then file name order.
+    """
+    event_slugs = None if events is None else {event.lower().replace(' ', '-') for event in events}
+
+    paths = []
+    if os.path.isdir(store_dir):
+        for year_dir in sorted(os.listdir(store_dir)):
+            if years is not None and int(year_dir) not in years:
+                continue
+            for file_name in sorted(os.listdir(os.path.join(store_dir, year_dir))):
+                if not file_name.endswith('.parquet'):
+                    continue
+                event_slug, _, file_session_type = file_name[:-len('.parquet')].rpartition('_')
+                if (session_type is None or file_session_type == session_type) and (event_slugs is None or event_slug in event_slugs):
+                    paths.append(os.path.join(store_dir, year_dir, file_name))
+
+    if not paths:
+        return pd.DataFrame()
+    return pd.concat([pd.read_parquet(path) for path in paths], ignore_index=True)
+
+
+if __name__ == '__main__':
+    from src.kpi2 import circuit_type
+
+    # the 20 KPI 2 qualifying sessions - a second run skips everything already in the store
+    kpi2_sessions = [(year, race, 'Q') for year in [2018, 2019] for race in circuit_type.keys()]
+
+    df_report = ingest_sessions(kpi2_sessions)
+    print("\n")
+    print(df_report.drop(columns=['path', 'error']).to_string(index=False))
+    print(f"\nTotal laps in store: {len(read_session_store(session_type='Q'))}")
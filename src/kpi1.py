@@ -1,3 +1,4 @@
+import sqlite3
 import pandas as pd
 
 """
@@ -30,7 +31,13 @@ Rest of hypothesis 1: dealing with high-downforce tracks, *Monaco, Singapore and
 Next steps, in stage 4 - hypothesis testing using ttest_ind() and similar methods.
 """
 
-df = pd.read_csv('processed_data/grid-to-finish-validated.csv') # load the data
+GRID_TO_FINISH_PATH = 'processed_data/grid-to-finish-validated.csv'
+
+# the three high-downforce, technical circuits used in steps 4 and 5
+HIGH_DOWNFORCE_GPS = ['Monaco Grand Prix', 'Singapore Grand Prix', 'Hungarian Grand Prix']
+
+# nothing below runs at import time - the data is loaded and the demo output printed under __main__ at the bottom.
+# run from the project root with: python -m src.kpi1
 
 # -------------------------------------------------------------------------------------------------------- # 
 
@@ -96,10 +103,86 @@ def get_constructor_level_delta(df: pd.DataFrame, constructor_ref: str = 'willia
 
 # print(get_constructor_level_delta(df).head()) # test on williams, it being the default constructor for the function
 
-for constructor in df['constructor_ref'].unique().tolist():
-    print(f"Constructor: {constructor}")
-    print(get_constructor_level_delta(df, constructor_ref=constructor).head(5)) # test on all constructors, preview head of each dataframe
-    print("\n")  # add a newline for better readability
+# -------------------------------------------------------------------------------------------------------- #
+
+# step 2b - constructor x year x circuit panel in a single grouped pass
+# get_constructor_level_delta re-filters the whole dataframe once per constructor - fine for 5 midfield teams,
+# but quadratic once pointed at every constructor since 1950. The panel below groups everything at once.
+
+def get_constructor_delta_panel(
+        df: pd.DataFrame | sqlite3.Connection,
+        year: int | list[int] = None,
+        gp_name: str | list[str] = None) -> pd.DataFrame:
+    """
+    Average grid-to-finish delta for every constructor, year and circuit, computed in one groupby.
+    Each constructor's rows are identical to get_constructor_level_delta(df, constructor_ref).
+
+    Arguments:
+    df (pd.DataFrame | sqlite3.Connection): The dataframe containing the grid-to-finish data - or a connection from
+        src.sql_backend.connect(), to filter and average in SQL instead.
+    year (int | list[int]): Single year or list of years to filter (optional).
+    gp_name (str | list[str]): Single GP name or list of GP names to filter (optional).
+
+    Returns:
+    pd.DataFrame: A dataframe with one row per constructor, year and GP.
+    columns are 'constructor_ref', 'gp_year', 'gp_name', 'avg_grid_delta', 'gained_or_lost', 'num_places'.
+    Constructors keep their order of first appearance in df, races are sorted by year then GP name.
+    """
+
+    if isinstance(df, sqlite3.Connection):
+        from src.sql_backend import sql_constructor_delta_panel
+        return sql_constructor_delta_panel(df, year=year, gp_name=gp_name)
+
+    # filter once, up front, rather than once per constructor
+    if year is not None:
+        df = df[df['gp_year'].isin([year] if isinstance(year, int) else year)]
+    if gp_name is not None:
+        df = df[df['gp_name'].isin([gp_name] if isinstance(gp_name, str) else gp_name)]
+
+    panel = df.groupby(['constructor_ref', 'gp_year', 'gp_name'], observed=True).agg(
+        avg_grid_delta=('grid_delta', 'mean')
+    ).reset_index()
+
+    # keep constructors in order of first appearance, matching the loops over df['constructor_ref'].unique()
+    constructor_order = {ref: i for i, ref in enumerate(df['constructor_ref'].unique())}
+    panel = panel.sort_values(
+        by=['constructor_ref', 'gp_year', 'gp_name'],
+        key=lambda col: col.map(constructor_order) if col.name == 'constructor_ref' else col,
+        kind='stable'
+    ).reset_index(drop=True)
+
+    panel['gained_or_lost'] = ['lost' if x < 0 else 'gained' for x in panel['avg_grid_delta']]
+    panel['num_places'] = panel['avg_grid_delta'].abs()
+
+    return panel[['constructor_ref', 'gp_year', 'gp_name', 'avg_grid_delta', 'gained_or_lost', 'num_places']]
+
+
+def get_average_delta_by_constructor(
+        df: pd.DataFrame | sqlite3.Connection,
+        year: int | list[int] = None,
+        gp_name: str | list[str] = None,
+        by_year: bool = False) -> pd.DataFrame:
+    """
+    Average of the per-race avg_grid_delta for each constructor (and optionally each year),
+    reduced from get_constructor_delta_panel - the same "mean of race means" as the step 3 functions below.
+
+    Arguments:
+    df (pd.DataFrame | sqlite3.Connection): The dataframe containing the grid-to-finish data, or a src.sql_backend connection.
+    year (int | list[int]): Single year or list of years to filter (optional).
+    gp_name (str | list[str]): Single GP name or list of GP names to filter (optional).
+    by_year (bool): If True, return one row per constructor and year instead of per constructor. Default is False.
+
+    Returns:
+    pd.DataFrame: Columns are 'constructor_ref', ('year',) 'avg_grid_delta_year'.
+    """
+    panel = get_constructor_delta_panel(df, year=year, gp_name=gp_name)
+    keys = ['constructor_ref', 'gp_year'] if by_year else ['constructor_ref']
+
+    averages = panel.groupby(keys, sort=False, observed=True).agg(
+        avg_grid_delta_year=('avg_grid_delta', 'mean')
+    ).reset_index()
+
+    return averages.rename(columns={'gp_year': 'year'})
 
 # -------------------------------------------------------------------------------------------------------- #
 
@@ -110,8 +193,8 @@ def get_average_delta_all_tracks(df: pd.DataFrame) -> pd.DataFrame:
     Using the function get_constructor_level_delta, which calculates the average grid-to-finish delta for a constructor and returns a dataframe,
     this function will calculate the average grid-to-finish delta for all constructors on all tracks.
 
-    We need to loop through a list of midfield constructors, and apply the get_constructor_level_delta function to each constructor.
-    Then we will extract and concatenate the results into a single dataframe.
+    Originally this looped through the constructors, applying get_constructor_level_delta to each and concatenating the results.
+    It now reduces the single-pass panel from get_constructor_delta_panel, giving the same numbers in linear time.
 
     Arguments:
     df (pd.DataFrame): The dataframe containing the grid-to-finish data.
@@ -123,20 +206,8 @@ def get_average_delta_all_tracks(df: pd.DataFrame) -> pd.DataFrame:
     This is negative, indicating lost positions, or positive, indicating gained ones)
     """
 
-    # initalise a new dataframe to store the results and to return
-    df_all_constructors = pd.DataFrame(columns=['constructor_ref', 'avg_grid_delta_year'])
-
-    # get all constructor reference names from the dataframe
-    constructor_refs = df['constructor_ref'].unique().tolist()
-
-    for constructor in constructor_refs:
-        df_constructor = get_constructor_level_delta(df, constructor) # gets constructor level deltas by race
-        avg_grid_delta_year = df_constructor['avg_grid_delta'].mean() # get year-long average of avg_grid_delta for each constructor across all tracks
-        df_all_constructors = pd.concat(
-            [df_all_constructors, pd.DataFrame({'constructor_ref': [constructor], 'avg_grid_delta_year': [avg_grid_delta_year]})], ignore_index=True
-            ) # add the results to the dataframe
-        
-    return df_all_constructors
+    # one grouped pass over df (see step 2b) instead of re-filtering df for every constructor
+    return get_average_delta_by_constructor(df)
 
 
 #print(get_average_delta_all_tracks(df)) # test the function
@@ -163,31 +234,13 @@ def get_average_constructor_delta_by_year(df: pd.DataFrame, year: int) -> pd.Dat
     This is negative, indicating lost positions, or positive, indicating gained ones)
     """
 
-    results = [] # list to store each row's dict - passed into pd.DataFrame on function return
-
-    # get a list of constructor reference names from the main dataframe
-    constructor_refs = df['constructor_ref'].unique().tolist()
-
-    for constructor in constructor_refs:
-        df_constructor = get_constructor_level_delta(df, constructor)  # gets constructor level deltas by race
-        df_constructor_year = df_constructor[df_constructor["gp_year"] == year]  # filter for race deltas of the year specified
-        avg_grid_delta_year = df_constructor_year["avg_grid_delta"].mean() # get the mean delta throughout the entire year
-
-        if not pd.isna(avg_grid_delta_year): # prevent NaN rows - as at least one constructor did not exist in each given year 2015-2019
-            results.append({
-                "constructor_ref": constructor,
-                "year": year,
-                "avg_grid_delta_year": avg_grid_delta_year
-            })
-
-    return pd.DataFrame(results).sort_values(by = 'avg_grid_delta_year', ascending=False).reset_index(drop=True) # sort by avg delta, and reset index
+    # per-constructor, per-year averages from one grouped pass, then keep the year requested.
+    # constructors with no races in that year simply have no row - no NaN rows to drop
+    averages = get_average_delta_by_constructor(df, by_year=True)
+    averages = averages[averages['year'] == year]
 
+    return averages.sort_values(by = 'avg_grid_delta_year', ascending=False).reset_index(drop=True) # sort by avg delta, and reset index
 
-# view average constructor deltas between 2015-2019
-for year in range(2015, 2020):
-    print(f"Year: {year}")
-    print(get_average_constructor_delta_by_year(df, year))
-    print("\n") # new line for better legibility
 
 
 # -------------------------------------------------------------------------------------------------------- # 
@@ -197,29 +250,56 @@ for year in range(2015, 2020):
     #['Monaco Grand Prix', 'Singapore Grand Prix', 'Hungarian Grand Prix'].
 #5. Calculate the average delta for Williams and rival constructors on these tracks.
 
-df_high_downforce = df[df['gp_name'].isin(['Monaco Grand Prix', 'Singapore Grand Prix', 'Hungarian Grand Prix'])].reset_index(drop=True)
+def get_high_downforce_deltas(df: pd.DataFrame, gp_names: list[str] = HIGH_DOWNFORCE_GPS) -> pd.DataFrame:
+    """
+    Filter the grid-to-finish data for the high-downforce, technical tracks in HIGH_DOWNFORCE_GPS.
+
+    Arguments:
+    df (pd.DataFrame): The dataframe containing the grid-to-finish data.
+    gp_names (list[str]): The GPs to keep - default is HIGH_DOWNFORCE_GPS. Pass e.g. the 'technical' circuits
+        from src.track_types.get_circuit_type_lookup to go beyond the hand-picked three.
+
+    Returns:
+    pd.DataFrame: The rows for Monaco, Singapore and Hungary only (by default), with a fresh index.
+    """
+    return df[df['gp_name'].isin(gp_names)].reset_index(drop=True)
+
+# -------------------------------------------------------------------------------------------------------- #
+
+if __name__ == '__main__':
+    df = pd.read_csv(GRID_TO_FINISH_PATH) # load the data
+
+    for constructor in df['constructor_ref'].unique().tolist():
+        print(f"Constructor: {constructor}")
+        print(get_constructor_level_delta(df, constructor_ref=constructor).head(5)) # test on all constructors, preview head of each dataframe
+        print("\n")  # add a newline for better readability
 
-df_high_downforce.to_csv('processed_data/delta-high-downforce.csv') # for observation
+    # view average constructor deltas between 2015-2019
+    for year in range(2015, 2020):
+        print(f"Year: {year}")
+        print(get_average_constructor_delta_by_year(df, year))
+        print("\n") # new line for better legibility
 
-# print(df_high_downforce)
+    df_high_downforce = get_high_downforce_deltas(df)
 
-# quick sanity checks before analysis
-# 1. checking team-level row counts:
-#print(df_high_downforce.groupby("constructor")["grid_delta"].count().sort_values(ascending=False))
+    df_high_downforce.to_csv('processed_data/delta-high-downforce.csv') # for observation
 
-# 2. per-circuit distribution - checking for over-representation
-#rint(df_high_downforce['gp_name'].value_counts())
+    # quick sanity checks before analysis
+    # 1. checking team-level row counts:
+    #print(df_high_downforce.groupby("constructor")["grid_delta"].count().sort_values(ascending=False))
 
-# Focusing on the three high-downforce, technical tracks, run get_average_constructor_delta_by_year function
-# on df_high_downforce
+    # 2. per-circuit distribution - checking for over-representation
+    #print(df_high_downforce['gp_name'].value_counts())
 
-print("Constructor-level grid-to-finish position delta, by year, on high-downforce & technical tracks.")
-print("2015-2019. Monaco, Singapore, Hungarian GPs. Williams, Renault, Haas, Racing Point/Force India")
-print("Note: 'avg_grid_delta_year'")
-print("'+' means a constructor, on average, gained positions in-race compared to their starting position.")
-print("'-' means a constructor typically lost positions compared to their starting position.\n")
-for year in range(2015, 2020):
-    print(f"Year: {year}")
-    print(get_average_constructor_delta_by_year(df_high_downforce, year))
-    print("\n") # new line for better legibility
+    # Focusing on the three high-downforce, technical tracks, run get_average_constructor_delta_by_year function
+    # on df_high_downforce
 
+    print("Constructor-level grid-to-finish position delta, by year, on high-downforce & technical tracks.")
+    print("2015-2019. Monaco, Singapore, Hungarian GPs. Williams, Renault, Haas, Racing Point/Force India")
+    print("Note: 'avg_grid_delta_year'")
+    print("'+' means a constructor, on average, gained positions in-race compared to their starting position.")
+    print("'-' means a constructor typically lost positions compared to their starting position.\n")
+    for year in range(2015, 2020):
+        print(f"Year: {year}")
+        print(get_average_constructor_delta_by_year(df_high_downforce, year))
+        print("\n") # new line for better legibility
@@ -1,6 +1,7 @@
-import fastf1
 import pandas as pd
 
+from src.fastf1_times import FASTF1_TIME_COLUMNS, to_timedelta_columns
+
 """
 KPI 2 - Relative Racecraft Performance
 
@@ -71,46 +72,56 @@ sector_type = {
 	("Japanese Grand Prix", 3): "balanced"
 }
 
-# test code, to see if we can load multiple sessions and concatenate them into a single DataFrame.
-# below code already executed and stored in processed_data/all_laps_df.csv
-"""
-races = list(circuit_type.keys()) # the 10 circuits
-years = [2018, 2019] # fast-f1 telemetry data only available 2018 onwards
-session_type = 'Q'  # qualifying sessions only
+MIDFIELD_TEAMS = ['Williams', 'Racing Point', 'Force India', 'Haas F1 Team', 'Renault']
 
-all_sessions = []
+# the same teams as Ergast constructorRefs - the constructor filter of sql/1-grid-to-finish.sql, for KPI 1
+MIDFIELD_CONSTRUCTORS = ['williams', 'renault', 'haas', 'force_india', 'racing_point']
 
-for year in years:
-	for race in races:
-		session = fastf1.get_session(year, race, session_type)
-		session.load(laps=True, telemetry=False)
-		laps = session.laps
-		laps['Year'] = year
-		laps['Race'] = race
-		all_sessions.append(laps)
+ALL_LAPS_PATH = "processed_data/all-laps.csv"
 
+time_columns = FASTF1_TIME_COLUMNS # Time, LapTime, PitOut/InTime, Sector1-3Time, Sector1-3SessionTime, LapStartTime
 
-all_laps_df = pd.concat(all_sessions, ignore_index=True)
-all_laps_df.to_csv("processed_data/all-laps.csv") # store loaded data to a new csv
-print(f"Loaded {len(all_sessions)} sessions successfully.") # print success message
-"""
+# nothing below runs at import time - fastf1, matplotlib, seaborn and scipy are only imported inside the functions needing them.
+# run the full KPI 2 pipeline from the project root with: python -m src.kpi2
 
-# -------------------- DATA FORMATTING AND VALIDATION --------------------
+# -------------------- SESSION LOADING --------------------
+
+# originally test code, to see if we can load multiple sessions and concatenate them into a single DataFrame.
+# already executed and stored in processed_data/all-laps.csv - only needed to refresh that file.
 
-# Set up a MultiIndex DataFrame for sector_type 
-index = pd.MultiIndex.from_tuples(list(sector_type.keys()), names = ['race', 'sector'])
-df_sector_type = pd.Series(list(sector_type.values()), index = index, name = 'sector_type')
+def load_qualifying_sessions(races: list[str] = None, years: list[int] = [2018, 2019], session_type: str = 'Q', max_workers: int = None) -> pd.DataFrame:
+	"""
+	Load the laps of each FastF1 session and concatenate them into a single DataFrame.
+	Sessions are loaded in parallel and stored per session by src/ingest.py - sessions already stored are not fetched again.
 
-#print(df_sector_type) # works
+	Arguments:
+	races -- list of GP names to load (default: the 10 circuits in circuit_type)
+	years -- list of seasons to load (default: [2018, 2019] - fast-f1 telemetry data only available 2018 onwards)
+	session_type -- FastF1 session identifier (default: 'Q', qualifying sessions only)
+	max_workers -- number of worker processes (default: one per CPU)
 
-# Remove all '0 days' tags from all time columns in all_laps_df.csv
+	Return:
+	A DataFrame of every lap from every session, with added 'Year' and 'Race' columns.
+	"""
+	from src.ingest import ingest_sessions, read_session_store
 
-df = pd.read_csv("processed_data/all-laps.csv") # load the csv
+	if races is None:
+		races = list(circuit_type.keys()) # the 10 circuits
 
-time_columns = "Time,LapTime,PitOutTime,PitInTime,Sector1Time,Sector2Time,Sector3Time,Sector1SessionTime,Sector2SessionTime,Sector3SessionTime,LapStartTime".split(",")
-# print(time_columns) # works
+	sessions = [(year, race, session_type) for year in years for race in races]
+	df_report = ingest_sessions(sessions, max_workers=max_workers)
 
-df.to_csv("processed_data/all-laps-cleaned.csv", index = False)
+	print(f"Loaded {df_report['status'].isin(['loaded', 'skipped']).sum()} sessions successfully.") # print success message
+	return read_session_store(years=years, session_type=session_type, events=races) # only the requested GPs, not the whole store
+
+# -------------------- DATA FORMATTING AND VALIDATION --------------------
+
+def get_sector_type_series() -> pd.Series:
+	"""
+	Set up a MultiIndex Series for sector_type, indexed by (race, sector).
+	"""
+	index = pd.MultiIndex.from_tuples(list(sector_type.keys()), names = ['race', 'sector'])
+	return pd.Series(list(sector_type.values()), index = index, name = 'sector_type')
 
 # -------------------- FURTHER STEPS REQUIRED --------------------
 
@@ -118,73 +129,81 @@ df.to_csv("processed_data/all-laps-cleaned.csv", index = False)
 1. Load processed data "all_laps_df_cleaned.csv" as DataFrame
 	Ensure sector and lap time columns are clean and parseable (e.g. convert str to time data)
 2. Filter by teams, valid laps, and each driver's fastest lap.
-	Remember: filter accurate, fastest laps only - avoids external noise. 
-3. Feature Engineering: 
+	Remember: filter accurate, fastest laps only - avoids external noise.
+3. Feature Engineering:
 	3.1. Generate comparison baseline - for each session, find the best/lowest sector times.
 		Forms session-specific baseline for each sector.
 	3.2 Calculate Williams' delta to the fastest midfield team, if Williams' isn't the fastest.
-		E.g. delta = Williams sector time - fastest midfield sector time. Repeat for S1, S2, S3. 
+		E.g. delta = Williams sector time - fastest midfield sector time. Repeat for S1, S2, S3.
 			Store as s1_delta, s2_delta, s3_delta in seconds.
 
 			Code needed for comparison: pd.to_timedelta(df['Sector1Time']).dt.total_seconds()
 
 	3.3 Attach circuit & sector type - use mapping to add a circuit_type column and label each circuit/sector as power, technical or balanced
-4. Aggregation & Grouping: 
+4. Aggregation & Grouping:
 	4.1 Melt data to long or MultiIndex format - each row should represent one sector per lap e.g. index1 = lap, index2 = sector (3 index2s for 1 index1)
 		Could store as 'Year', 'Race', 'Driver', 'Sector', 'Sector_Delta', 'Sector_Type'
 		Helpful for groupby(), visualisation, hypothesis tests.
 	4.2. Aggregate by type - calculate average (mean/median) and spread (std/MAD/IQR) with sector delta for Williams through circuit_type/sector_type.
 	4.3. Aggregate for other midfield rivals for broader comparison/sanity checks.
 5. Identify and treat any outliers, if present. Label carefully if needed, or consider removing them.
-6. Prepare for visualisation and hypothesis testing. 
+6. Prepare for visualisation and hypothesis testing.
 	6.1 Export to CSV if needed. e.g each row: `Year`, `Race`, `Driver`, `Sector`, `Sector_Delta`, `Sector_Type`, `Circuit_Type`.
 	6.2 For hypothesis testing: group sector deltas by sector type or use t-tests for statistical significance.
 	6.3 For visualisation: use boxplots, heatmaps, or barplots.
 """
 
 # ------------------- STEPS 1 & 2 - LOAD AND FURTHER PROCESS DATA -------------------
-df = df[[
-	'Unnamed: 0', 'Year', 'Race', 'Driver', 'DriverNumber', 'Team',
-	'LapTime', 'Sector1Time', 'Sector2Time', 'Sector3Time', 
-	'IsPersonalBest', 'Deleted', 'IsAccurate'
-]] # keep relevant columns only
 
-df.rename(columns = {"Unnamed: 0" : "Id"}, inplace = True) # rename first column to Id
+def get_best_midfield_laps(df: pd.DataFrame, teams: list[str] = MIDFIELD_TEAMS) -> pd.DataFrame:
+	"""
+	Steps:
+	1. Keep relevant columns only, and rename the first column to Id.
+	2. Filter for just Williams, Racing Point, Force India, Haas, and Renault.
+	3. Keep personal best and accurate laps only (accurate in Fast-F1 means non-deleted).
+	4. Convert the lap and sector time strings to dtype Timedelta (see src/fastf1_times.py).
 
-# filter for just Williams, Racing Point, Force India, Haas, and Renault
-df_midfield = df[df['Team'].isin(['Williams', 'Racing Point', 'Force India', 'Haas F1 Team', 'Renault'])] 
+	Arguments:
+	df -- DataFrame of all laps, as stored in processed_data/all-laps.csv
+	teams -- teams to keep (default: MIDFIELD_TEAMS). None keeps every team.
 
-# ensures best and accurate laps (accurate in Fast-F1 means non-deleted).
-df_best_midfield = df_midfield[(df_midfield['IsPersonalBest']) & (df_midfield['IsAccurate'] == True)] 
+	Return:
+	A DataFrame of the best, accurate midfield laps, indexed by Id.
+	"""
+	df = df[[
+		'Unnamed: 0', 'Year', 'Race', 'Driver', 'DriverNumber', 'Team',
+		'LapTime', 'Sector1Time', 'Sector2Time', 'Sector3Time',
+		'IsPersonalBest', 'Deleted', 'IsAccurate'
+	]] # keep relevant columns only
 
-# reset index - df is now complete for further analysis
-df_best_midfield = df_best_midfield.set_index('Id')
+	df = df.rename(columns = {"Unnamed: 0" : "Id"}) # rename first column to Id
 
-# time values - ensure these are of dtype Timedelta
-#print(df_best_midfield['LapTime'].dtype) # object - we need to convert
+	# filter for just Williams, Racing Point, Force India, Haas, and Renault
+	df_midfield = df[df['Team'].isin(teams)] if teams is not None else df
 
-time_columns_2 = "LapTime,Sector1Time,Sector2Time,Sector3Time".split(",") # all time cols used
-for col in time_columns_2:
-		df_best_midfield[col] = pd.to_timedelta(df_best_midfield[col]) # convert time string to pd.timedelta dtype
+	# ensures best and accurate laps (accurate in Fast-F1 means non-deleted).
+	df_best_midfield = df_midfield[(df_midfield['IsPersonalBest']) & (df_midfield['IsAccurate'] == True)]
 
-#print(df_best_midfield.info()) # four time values are all timedelta64s - above code works
-#print(df_best_midfield.head(10)) # peek first ten rows
+	# reset index - df is now complete for further analysis
+	df_best_midfield = df_best_midfield.set_index('Id')
 
-# export to a csv
-df_best_midfield.to_csv("processed_data/all-laps-best-midfield.csv")
+	# time values - ensure these are of dtype Timedelta
+	time_columns_2 = "LapTime,Sector1Time,Sector2Time,Sector3Time".split(",") # all time cols used
+	df_best_midfield = to_timedelta_columns(df_best_midfield, time_columns_2) # decode time strings to pd.timedelta dtype in one vectorised pass
 
-# This approach provides all personal best times, which is ok, because
-# more lap/sector time data can be used and aggregated for comparing and benchmarking averages
+	# This approach provides all personal best times, which is ok, because
+	# more lap/sector time data can be used and aggregated for comparing and benchmarking averages
+	return df_best_midfield
 
 # ------------------- STEP 3: FEATURE ENGINEERING -------------------
 
 """
-3. Feature Engineering: 
+3. Feature Engineering:
 	3.1. Generate comparison baseline - for each session, find the best/lowest sector times.
 		Forms session-specific baseline for each sector.
 
 	3.2 Calculate Williams' delta to the fastest midfield team, if Williams' isn't the fastest.
-		E.g. delta = Williams sector time - fastest midfield sector time. Repeat for S1, S2, S3. 
+		E.g. delta = Williams sector time - fastest midfield sector time. Repeat for S1, S2, S3.
 			Store as s1_delta, s2_delta, s3_delta in seconds.
 
 			Code needed for comparison: pd.to_timedelta(df['Sector1Time']).dt.total_seconds()
@@ -194,62 +213,62 @@ df_best_midfield.to_csv("processed_data/all-laps-best-midfield.csv")
 
 # 3.1 - generate comparison baseline.
 
-# retrieve sectors and FL, going by year then by the 10 GPs. 
-fastest_s1s = {}
-fastest_s2s = {}
-fastest_s3s = {}
-fastest_laps = {} # a secondary stat to have - not essential
+def get_fastest_by_session(df_best: pd.DataFrame, years: list[int] = [2018, 2019], races: list[str] = None, verbose: bool = True) -> tuple[dict, dict, dict, dict]:
+	"""
+	Retrieve the fastest sectors and FL, going by year then by GP.
+	Applied twice - once for all of the midfield, once for Williams' laps only.
 
-for year in [2018, 2019]:
-	for race in circuit_type.keys(): # list of 10 chosen GPs
+	Arguments:
+	df_best -- DataFrame of best laps, as returned by get_best_midfield_laps
+	years -- list of seasons (default: [2018, 2019])
+	races -- list of GP names (default: the 10 circuits in circuit_type)
+	verbose -- If True, print a message for each session without lap data (default: True)
 
-		# filter the df in each case for given year and race
-		filtered_df = df_best_midfield[(df_best_midfield['Year'] == year) & (df_best_midfield['Race'] == race)]
+	Return:
+	Four dicts - fastest S1s, S2s, S3s and laps - each using tuple (year, race) as a key,
+	and a list [driver, team, fastest lap/sector time] as a value.
+	Sessions without any valid and accurate laps are skipped.
+	"""
+	if races is None:
+		races = list(circuit_type.keys()) # list of 10 chosen GPs
 
-		# Find fastest S1 row
-		idx_fastest_s1 = filtered_df['Sector1Time'].idxmin()
-		fastest_s1_row = filtered_df.loc[idx_fastest_s1]
-		
-		# Similarly for sectors 2 & 3:
-		idx_fastest_s2 = filtered_df['Sector2Time'].idxmin()
-		fastest_s2_row = filtered_df.loc[idx_fastest_s2]
-		
-		idx_fastest_s3 = filtered_df['Sector3Time'].idxmin()
-		fastest_s3_row = filtered_df.loc[idx_fastest_s3]
+	fastest_s1s = {}
+	fastest_s2s = {}
+	fastest_s3s = {}
+	fastest_laps = {} # a secondary stat to have - not essential
 
-		# find fastest lap row - a nice to have.
-		idx_fastest_lap = filtered_df['LapTime'].idxmin()
-		fastest_lap_row = filtered_df.loc[idx_fastest_lap]
+	for year in years:
+		for race in races:
 
-		# use tuple (year, race) as a key, and a list driver, team, fastest lap/sector time as a value. 
-		fastest_s1s[(year, race)] = [fastest_s1_row['Driver'], fastest_s1_row['Team'], fastest_s1_row['Sector1Time']]
-		fastest_s2s[(year, race)] = [fastest_s2_row['Driver'], fastest_s2_row['Team'], fastest_s2_row['Sector2Time']]
-		fastest_s3s[(year, race)] = [fastest_s3_row['Driver'], fastest_s3_row['Team'], fastest_s3_row['Sector3Time']]
-		fastest_laps[(year, race)] = [fastest_lap_row['Driver'], fastest_lap_row['Team'], fastest_lap_row['LapTime']]
+			# filter the df in each case for given year and race
+			filtered_df = df_best[(df_best['Year'] == year) & (df_best['Race'] == race)]
+			if filtered_df.empty:
+				if verbose:
+					print(f"\nNo valid and accurate lap data for {year} {race} is available. Skipping.\n")
+				continue
 
+			# Find fastest S1 row
+			idx_fastest_s1 = filtered_df['Sector1Time'].idxmin()
+			fastest_s1_row = filtered_df.loc[idx_fastest_s1]
 
+			# Similarly for sectors 2 & 3:
+			idx_fastest_s2 = filtered_df['Sector2Time'].idxmin()
+			fastest_s2_row = filtered_df.loc[idx_fastest_s2]
 
-# print out results - midfield fastest S1s
-"""
-print("\nFastest midfield qualifying S1 times across 10 selected circuits, 2018 and 2019.\n")
-for race, details in fastest_s1s.items():
-	print(f"{race[0]} {race[1]}: DRIVER: {details[0]}. TEAM: {details[1]}. FASTEST S1 TIME: {details[2]}.")
-
-# midfield fastest S2s
-print("\nFastest midfield qualifying S2 times across 10 selected circuits, 2018 and 2019.\n")
-for race, details in fastest_s2s.items():
-	print(f"{race[0]} {race[1]}: DRIVER: {details[0]}. TEAM: {details[1]}. FASTEST S2 TIME: {details[2]}.")
-
-# midfield fastest S3s
-print("\nFastest midfield qualifying S3 times across 10 selected circuits, 2018 and 2019.\n")
-for race, details in fastest_s3s.items():
-	print(f"{race[0]} {race[1]}: DRIVER: {details[0]}. TEAM: {details[1]}. FASTEST S3 TIME: {details[2]}.")
-
-# midfield FLs
-print("\nFastest midfield qualifying lap times across 10 selected circuits, 2018 and 2019.\n")
-for race, details in fastest_laps.items():
-	print(f"{race[0]} {race[1]}: DRIVER: {details[0]}. TEAM: {details[1]}. FASTEST LAP TIME: {details[2]}.")
-"""
+			idx_fastest_s3 = filtered_df['Sector3Time'].idxmin()
+			fastest_s3_row = filtered_df.loc[idx_fastest_s3]
+
+			# find fastest lap row - a nice to have.
+			idx_fastest_lap = filtered_df['LapTime'].idxmin()
+			fastest_lap_row = filtered_df.loc[idx_fastest_lap]
+
+			# use tuple (year, race) as a key, and a list driver, team, fastest lap/sector time as a value.
+			fastest_s1s[(year, race)] = [fastest_s1_row['Driver'], fastest_s1_row['Team'], fastest_s1_row['Sector1Time']]
+			fastest_s2s[(year, race)] = [fastest_s2_row['Driver'], fastest_s2_row['Team'], fastest_s2_row['Sector2Time']]
+			fastest_s3s[(year, race)] = [fastest_s3_row['Driver'], fastest_s3_row['Team'], fastest_s3_row['Sector3Time']]
+			fastest_laps[(year, race)] = [fastest_lap_row['Driver'], fastest_lap_row['Team'], fastest_lap_row['LapTime']]
+
+	return fastest_s1s, fastest_s2s, fastest_s3s, fastest_laps
 
 
 # 3.2 - calculate williams' delta to the fastest midfield team
@@ -258,184 +277,223 @@ for race, details in fastest_laps.items():
 NB: In our sample of fastest sector (and lap) times, Williams never achieved the fastest qualifying sector or lap
 in any of the 10 selected circuits across 2018-2019.
 
-This mean there's no need to account for edge cases where Williams 
+This mean there's no need to account for edge cases where Williams
 sets the baseline for sector/lap delta calculations in the Fast-F1 derived dataset.
 All team deltas represent a deficit to one of Haas, Renault, Force India, or Racing Point.
 
-For my retrospective project, Williams will always be benchmarked against 
+For my retrospective project, Williams will always be benchmarked against
 the session's best-performing rival, never themselves.
 
 In all cases, delta = Williams' sector time - fastest midfield sector time.
 """
 
-# filter Williams' fastest laps from df_best_midfield dataframe.
-df_best_williams = df_best_midfield[df_best_midfield["Team"] == "Williams"]
-
-df_best_williams.to_csv("processed_data/williams-best-laps.csv")
-
-williams_fastest_s1s = {}
-williams_fastest_s2s = {}
-williams_fastest_s3s = {}
-williams_fastest_laps = {}
-
-for year in [2018, 2019]: # get years
-	for race in circuit_type.keys(): # get all circuits
-
-		# filter for just williams' times
-		filtered_df_williams = df_best_williams[(df_best_williams['Year'] == year) & (df_best_williams['Race'] == race)]
-		if filtered_df_williams.empty:
-			print(f"\nNo valid and accurate Williams lap data for {year} {race} is available. Skipping.\n")
-			continue
+"""
+CODE CAME ACROSS AN ISSUE:
+Stroll and Sirtokin's quali hotlaps from Spain & Hungary GP 2018 were filtered out by 'is_accurate == False'.
+This may be due to changing weather conditions, exceeding track limits, penalised laps - so we are leaving out these sessions.
+"""
 
-		# Find fastest S1 row
-		idx_fastest_s1 = filtered_df_williams['Sector1Time'].idxmin()
-		fastest_s1_row = filtered_df_williams.loc[idx_fastest_s1]
+def get_williams_deltas(fastest: tuple[dict, dict, dict, dict], williams_fastest: tuple[dict, dict, dict, dict]) -> tuple[dict, dict, dict]:
+	"""
+	Calculate Williams' deltas to the fastest midfield team, for every session Williams has lap data for.
+
+	Arguments:
+	fastest -- the four midfield dicts (S1s, S2s, S3s, laps) from get_fastest_by_session
+	williams_fastest -- the four Williams-only dicts from get_fastest_by_session
+
+	Return:
+	Three dicts keyed by (year, race):
+	deltas -- [s1_delta, s2_delta, s3_delta, lap_delta] in seconds
+	fastest_team -- [S1 team, S2 team, S3 team, lap team]
+	pct_slower -- [s1, s2, s3, lap] percent slower than the fastest time
+	"""
+	fastest_s1s, fastest_s2s, fastest_s3s, fastest_laps = fastest
+	williams_fastest_s1s, williams_fastest_s2s, williams_fastest_s3s, williams_fastest_laps = williams_fastest
+
+	deltas = {} # intialise a dictionary for storing sector and lap deltas
+	fastest_team = {}
+	pct_slower = {}
+
+	# extract each (year, race) key from fastest_s1s
+	for (year, race) in williams_fastest_laps.keys(): # any williams dict works here, as it will have 18 observations instead of the 20 in fastest_laps
+		# year, race are repeated across all dicts - you can use them on all.
+		overall_fastest_s1 = fastest_s1s[(year, race)][2].total_seconds() # retrieve time, and convert to seconds
+		overall_fastest_s2 = fastest_s2s[(year, race)][2].total_seconds()
+		overall_fastest_s3 = fastest_s3s[(year, race)][2].total_seconds()
+		overall_fastest_lap = fastest_laps[(year, race)][2].total_seconds()
+
+		s1_fastest = fastest_s1s[(year, race)][1] # accesses fastest_team
+		s2_fastest = fastest_s2s[(year, race)][1] # accesses fastest_team
+		s3_fastest = fastest_s3s[(year, race)][1] # accesses fastest_team
+		s4_fastest = fastest_laps[(year, race)][1] # accesses fastest_team
+
+		williams_fastest_s1 = williams_fastest_s1s[(year, race)][2].total_seconds() # do same for williams
+		williams_fastest_s2 = williams_fastest_s2s[(year, race)][2].total_seconds() # do same for williams
+		williams_fastest_s3 = williams_fastest_s3s[(year, race)][2].total_seconds() # do same for williams
+		williams_fastest_lap = williams_fastest_laps[(year, race)][2].total_seconds() # do same for williams
+
+		s1_delta = round(williams_fastest_s1 - overall_fastest_s1, 3) # calculate deltas
+		s2_delta = round(williams_fastest_s2 - overall_fastest_s2, 3)
+		s3_delta = round(williams_fastest_s3 - overall_fastest_s3, 3)
+		lap_delta = round(williams_fastest_lap - overall_fastest_lap, 3)
+
+		# percent slower = (delta / fastest_time) * 100
+		s1_pct_slower = round((s1_delta / overall_fastest_s1) * 100, 3)
+		s2_pct_slower = round((s2_delta / overall_fastest_s2) * 100, 3)
+		s3_pct_slower = round((s3_delta / overall_fastest_s3) * 100, 3)
+		lap_pct_slower = round((lap_delta / overall_fastest_lap) * 100, 3)
+
+		deltas[(year, race)] = [s1_delta, s2_delta, s3_delta, lap_delta] # append result to deltas dict
+		fastest_team[(year, race)] = [s1_fastest, s2_fastest, s3_fastest, s4_fastest]
+		pct_slower[(year, race)] = [s1_pct_slower, s2_pct_slower, s3_pct_slower, lap_pct_slower]
+
+	return deltas, fastest_team, pct_slower
 
-		# Similarly for sectors 2 & 3:
-		idx_fastest_s2 = filtered_df_williams['Sector2Time'].idxmin()
-		fastest_s2_row = filtered_df_williams.loc[idx_fastest_s2]
-		
-		idx_fastest_s3 = filtered_df_williams['Sector3Time'].idxmin()
-		fastest_s3_row = filtered_df_williams.loc[idx_fastest_s3]
+"""
+In every analysed event, Williams set the slowest, or near-slowest times in qualifying.
+The general trend is that Williams was consistently off the pace in all types of sectors.
+Sessions with unreliable, unrepresentative, or weather-impacted data were excluded to ensure analysis only compares standard dry-qualifying performance.
+(e.g. 2018 Spanish GP, 2018 Hungarian GP)
+"""
 
-		# find fastest lap row - a nice to have.
-		idx_fastest_lap = filtered_df_williams['LapTime'].idxmin()
-		fastest_lap_row = filtered_df_williams.loc[idx_fastest_lap]
 
-		# use tuple (year, race) as a key, and a list driver, team, fastest lap/sector time as a value. 
-		williams_fastest_s1s[(year, race)] = [fastest_s1_row['Driver'], fastest_s1_row['Team'], fastest_s1_row['Sector1Time']]
-		williams_fastest_s2s[(year, race)] = [fastest_s2_row['Driver'], fastest_s2_row['Team'], fastest_s2_row['Sector2Time']]
-		williams_fastest_s3s[(year, race)] = [fastest_s3_row['Driver'], fastest_s3_row['Team'], fastest_s3_row['Sector3Time']]
-		williams_fastest_laps[(year, race)] = [fastest_lap_row['Driver'], fastest_lap_row['Team'], fastest_lap_row['LapTime']]
+# 3.3 - form a dataframe with sectors, deltas and their labelled sector types
 
+def get_labelled_sectors(deltas: dict, fastest_team: dict, pct_slower: dict) -> pd.DataFrame:
+	"""
+	Form a long DataFrame with one row per session and sector, storing deltas, sector types, and fastest team information.
+
+	Arguments:
+	deltas, fastest_team, pct_slower -- the three dicts returned by get_williams_deltas
+
+	Return:
+	A DataFrame with columns 'year', 'race', 'sector', 'sector_delta', 'pct_slower', 'fastest_team', 'sector_type', 'circuit_type'.
+	"""
+	records = [] # form a new list, to be made into a dataframe
+
+	for (year, race), sector_deltas in deltas.items():
+		# form a list to get [S1 team, S2 team, S3 team, S4 team]
+		fastest_teams_for_session = fastest_team.get((year, race), [None, None, None, None])
+		pct_slower_values = pct_slower.get((year, race), [None, None, None, None])
+
+		# for each of the three sectors
+		for sector_no, sector_delta in enumerate(sector_deltas[:3], start=1):
+			fastest_team_for_sector = fastest_teams_for_session[sector_no - 1] # due to 0-based indexing
+			pct_slower_val = pct_slower_values[sector_no - 1] # 0-based indexing
+
+			record = {
+				'year': year,
+				'race': race,
+				'sector': sector_no,
+				'sector_delta': sector_delta,
+				'pct_slower': pct_slower_val,
+				'fastest_team': fastest_team_for_sector,
+				'sector_type': sector_type.get((race, sector_no)), # maps sector type
+				'circuit_type': circuit_type.get(race) # maps circuit type
+			}
+			records.append(record)
+
+	return pd.DataFrame(records)
+
+# 3.4 - grouped engine: the fastest sectors of every team in every session, in one pass
+# the loops above filter the laps once per (year, race) and again for Williams - fine for 2 years x 10 races of one team,
+# but not for every team and every session since 2018. Both steps are replaced by a grouped reduction and a join.
+
+SECTOR_TIME_COLUMNS = {1: 'Sector1Time', 2: 'Sector2Time', 3: 'Sector3Time', 4: 'LapTime'} # 4 = full lap, as s4_fastest above
+
+def get_fastest_by_team(df_best: pd.DataFrame, keys: list[str] = ['Year', 'Race', 'Team']) -> pd.DataFrame:
+	"""
+	Fastest S1, S2, S3 and lap for every (year, race, team), as a tidy DataFrame.
+	Ties keep the earliest lap, as idxmin does in get_fastest_by_session.
+
+	Arguments:
+	df_best -- DataFrame of best laps, as returned by get_best_midfield_laps
+	keys -- columns identifying one team in one session (default: ['Year', 'Race', 'Team'])
+
+	Return:
+	A DataFrame with one row per session, team and sector - columns are keys + 'sector' (1-3, 4 = lap), 'Driver', 'time_s'.
+	"""
+	fastest = []
+	for sector_no, col in SECTOR_TIME_COLUMNS.items():
+		# a stable sort on the time puts every group's fastest lap first - dropping duplicates keeps just that lap
+		timed = df_best[keys + ['Driver', col]].dropna(subset=[col])
+		fastest_rows = timed.sort_values(col, kind='stable').drop_duplicates(keys)
+
+		fastest.append(pd.DataFrame({
+			**{key: fastest_rows[key] for key in keys},
+			'sector': sector_no,
+			'Driver': fastest_rows['Driver'],
+			'time_s': fastest_rows[col].dt.total_seconds(),
+		}))
 
-# print out results - midfield fastest S1s
-"""
-print("\nWilliams' fastest midfield qualifying S1 times across 10 selected circuits, 2018 and 2019.\n")
-for race, details in williams_fastest_s1s.items():
-	print(f"{race[0]} {race[1]}: DRIVER: {details[0]}. TEAM: {details[1]}. FASTEST S1 TIME: {details[2]}.")
-
-# midfield fastest S2s
-print("\nWilliams' fastest midfield qualifying S2 times across 10 selected circuits, 2018 and 2019.\n")
-for race, details in williams_fastest_s2s.items():
-	print(f"{race[0]} {race[1]}: DRIVER: {details[0]}. TEAM: {details[1]}. FASTEST S2 TIME: {details[2]}.")
-
-# midfield fastest S3s
-print("\nWilliams' fastest midfield qualifying S3 times across 10 selected circuits, 2018 and 2019.\n")
-for race, details in williams_fastest_s3s.items():
-	print(f"{race[0]} {race[1]}: DRIVER: {details[0]}. TEAM: {details[1]}. FASTEST S3 TIME: {details[2]}.")
-
-# midfield FLs
-print("\nWilliams' fastest midfield qualifying lap times across 10 selected circuits, 2018 and 2019.\n")
-for race, details in williams_fastest_laps.items():
-	print(f"{race[0]} {race[1]}: DRIVER: {details[0]}. TEAM: {details[1]}. FASTEST LAP TIME: {details[2]}.")
-
-# maybe refine the above section to make it into a function? applied twice already. 
-"""
+	df_fastest = pd.concat(fastest, ignore_index=True)
 
-"""
-CODE CAME ACROSS AN ISSUE: 
-Stroll and Sirtokin's quali hotlaps from Spain & Hungary GP 2018 were filtered out by 'is_accurate == False'.
-This may be due to changing weather conditions, exceeding track limits, penalised laps - so we are leaving out these sessions. 
-"""
+	# keep sessions in order of first appearance in df_best, as the loops above do
+	session_order = {session: i for i, session in enumerate(df_best[keys[:-1]].drop_duplicates().itertuples(index=False, name=None))}
+	df_fastest['session_order'] = [session_order[session] for session in df_fastest[keys[:-1]].itertuples(index=False, name=None)]
 
+	return df_fastest.sort_values(['session_order', 'sector', 'time_s'], kind='stable').drop(columns='session_order').reset_index(drop=True)
 
-deltas = {} # intialise a dictionary for storing sector and lap deltas
-fastest_team = {}
-pct_slower = {}
-
-# extract each (year, race) key from fastest_s1s
-for (year, race) in williams_fastest_laps.keys(): # any williams dict works here, as it will have 18 observations instead of the 20 in fastest_laps
-	# year, race are repeated across all dicts - you can use them on all. 
-	overall_fastest_s1 = fastest_s1s[(year, race)][2].total_seconds() # retrieve time, and convert to seconds
-	overall_fastest_s2 = fastest_s2s[(year, race)][2].total_seconds()
-	overall_fastest_s3 = fastest_s3s[(year, race)][2].total_seconds()
-	overall_fastest_lap = fastest_laps[(year, race)][2].total_seconds()
-
-	s1_fastest = fastest_s1s[(year, race)][1] # accesses fastest_team
-	s2_fastest = fastest_s2s[(year, race)][1] # accesses fastest_team
-	s3_fastest = fastest_s3s[(year, race)][1] # accesses fastest_team
-	s4_fastest = fastest_laps[(year, race)][1] # accesses fastest_team
-
-	williams_fastest_s1 = williams_fastest_s1s[(year, race)][2].total_seconds() # do same for williams
-	williams_fastest_s2 = williams_fastest_s2s[(year, race)][2].total_seconds() # do same for williams
-	williams_fastest_s3 = williams_fastest_s3s[(year, race)][2].total_seconds() # do same for williams
-	williams_fastest_lap = williams_fastest_laps[(year, race)][2].total_seconds() # do same for williams
-
-	s1_delta = round(williams_fastest_s1 - overall_fastest_s1, 3) # calculate deltas
-	s2_delta = round(williams_fastest_s2 - overall_fastest_s2, 3)
-	s3_delta = round(williams_fastest_s3 - overall_fastest_s3, 3)
-	lap_delta = round(williams_fastest_lap - overall_fastest_lap, 3)
-
-	# percent slower = (delta / fastest_time) * 100
-	s1_pct_slower = round((s1_delta / overall_fastest_s1) * 100, 3)
-	s2_pct_slower = round((s2_delta / overall_fastest_s2) * 100, 3)
-	s3_pct_slower = round((s3_delta / overall_fastest_s3) * 100, 3)
-	lap_pct_slower = round((lap_delta / overall_fastest_lap) * 100, 3)
-	
-	# print(f"Williams' fastest S2 for {year} {race}: {williams_fastest_s2}; Overall fastest S2: {overall_fastest_s2}") # test line
 
-	deltas[(year, race)] = [s1_delta, s2_delta, s3_delta, lap_delta] # append result to deltas dict
-	fastest_team[(year, race)] = [s1_fastest, s2_fastest, s3_fastest, s4_fastest]
-	pct_slower[(year, race)] = [s1_pct_slower, s2_pct_slower, s3_pct_slower, lap_pct_slower]
+def get_team_deficits(df_fastest: pd.DataFrame, team: str = 'Williams') -> pd.DataFrame:
+	"""
+	Deficit of a reference team's fastest sectors and lap to the session's best rival team, via a join.
+	Sessions where the reference team has no valid laps are left out.
+	For Williams this matches get_williams_deltas - Williams never set the midfield's fastest sector or lap.
 
+	Arguments:
+	df_fastest -- DataFrame returned by get_fastest_by_team
+	team -- the reference team (default: 'Williams')
 
-# display deltas and fastest teams
-for key in deltas.keys():
-    year, race = key
-    s1_delta, s2_delta, s3_delta, lap_delta = deltas[key]
-    team1, team2, team3, team4 = fastest_team[key]
+	Return:
+	A DataFrame with one row per session and sector - columns are 'year', 'race', 'sector' (1-3, 4 = lap),
+	'time_s', 'rival_time_s', 'delta', 'pct_slower', 'fastest_team'.
+	"""
+	session_keys = ['Year', 'Race', 'sector']
 
-    print(f"{year} {race}")
-    print(f"S1 Delta: {s1_delta}; S2 Delta: {s2_delta}; S3 Delta: {s3_delta}; Lap Delta: {lap_delta}")
-    print(f"S1 Fastest: {team1}; S2 Fastest: {team2}; S3 Fastest: {team3}; Lap Fastest: {team4}\n")
+	df_team = df_fastest[df_fastest['Team'] == team]
 
-"""
-In every analysed event, Williams set the slowest, or near-slowest times in qualifying.
-The general trend is that Williams was consistently off the pace in all types of sectors.
-Sessions with unreliable, unrepresentative, or weather-impacted data were excluded to ensure analysis only compares standard dry-qualifying performance.
-(e.g. 2018 Spanish GP, 2018 Hungarian GP)
-"""
+	# best rival per session and sector - df_fastest is sorted by time within each, so the first rival row is the fastest
+	df_best_rival = df_fastest[df_fastest['Team'] != team].drop_duplicates(session_keys)
 
+	df_deficits = df_team.merge(df_best_rival[session_keys + ['Team', 'time_s']], on=session_keys, suffixes=('', '_rival'))
 
-# 3.3 - form a dataframe with sectors, deltas and their labelled sector types
+	df_deficits['delta'] = (df_deficits['time_s'] - df_deficits['time_s_rival']).round(3)
+	df_deficits['pct_slower'] = (df_deficits['delta'] / df_deficits['time_s_rival'] * 100).round(3)
 
-records = [] # form a new list, to be made into a dataframe, to store data on deltas, sectors, sector types, fastest team information.
+	df_deficits = df_deficits.rename(columns={
+		'Year': 'year', 'Race': 'race', 'time_s_rival': 'rival_time_s', 'Team_rival': 'fastest_team'
+	})
+	return df_deficits[['year', 'race', 'sector', 'time_s', 'rival_time_s', 'delta', 'pct_slower', 'fastest_team']]
 
-for (year, race), sector_deltas in deltas.items():
-	# form a list to get [S1 team, S2 team, S3 team, S4 team]
-	fastest_teams_for_session = fastest_team.get((year, race), [None, None, None, None]) 
-	pct_slower_values = pct_slower.get((year, race), [None, None, None, None])
 
-    # for each of the three sectors
-	for sector_no, sector_delta in enumerate(sector_deltas[:3], start=1):
-		fastest_team_for_sector = fastest_teams_for_session[sector_no - 1] # due to 0-based indexing
-		pct_slower_val = pct_slower_values[sector_no - 1] # 0-based indeig
+def get_labelled_sector_deficits(df_deficits: pd.DataFrame, sector_types: dict = None, circuit_types: dict = None) -> pd.DataFrame:
+	"""
+	Sector rows only (no full lap), labelled with sector and circuit type - same columns as get_labelled_sectors.
+	Circuits missing from the sector_type/circuit_type mappings are labelled None.
 
-		record = {
-			'year': year,
-			'race': race,
-			'sector': sector_no,
-			'sector_delta': sector_delta,
-			'pct_slower': pct_slower_val,
-			'fastest_team': fastest_team_for_sector, 
-			'sector_type': sector_type.get((race, sector_no)), # maps sector type
-			'circuit_type': circuit_type.get(race) # maps circuit type
-		}
-		records.append(record)
+	Arguments:
+	df_deficits -- output of get_team_deficits
+	sector_types -- (race, sector) -> type mapping (default: the hand-labelled sector_type).
+		src.track_types.get_sector_type_lookup derives one for any circuit in all-laps.csv
+	circuit_types -- race -> type mapping (default: the hand-labelled circuit_type), e.g. from src.track_types.get_circuit_type_lookup
+	"""
+	if sector_types is None:
+		sector_types = sector_type
+	if circuit_types is None:
+		circuit_types = circuit_type
 
-# Optionally, convert to DataFrame for easier manipulation
-df_labelled_sectors = pd.DataFrame(records)
+	df_labelled = df_deficits[df_deficits['sector'] <= 3].rename(columns={'delta': 'sector_delta'}).reset_index(drop=True)
 
-print(df_labelled_sectors.info())
-print(df_labelled_sectors)
+	df_labelled['sector_type'] = [sector_types.get((race, sector_no)) for race, sector_no in zip(df_labelled['race'], df_labelled['sector'])] # maps sector type
+	df_labelled['circuit_type'] = df_labelled['race'].map(circuit_types) # maps circuit type
 
-# data now stored in df_labelled_sectors
+	return df_labelled[['year', 'race', 'sector', 'sector_delta', 'pct_slower', 'fastest_team', 'sector_type', 'circuit_type']]
 
 # -------------------- 4. AGGREGATION AND GROUPING -----------------
 
 """
-4. Aggregation & Grouping: 
+4. Aggregation & Grouping:
 	4.1 Melt data to long or MultiIndex format - each row should represent one sector per lap e.g. index1 = lap, index2 = sector (3 index2s for 1 index1)
 		Could store as 'Year', 'Race', 'Driver', 'Sector', 'Sector_Delta', 'Sector_Type'
 		Helpful for groupby(), visualisation, hypothesis tests.
@@ -443,53 +501,54 @@ print(df_labelled_sectors)
 	4.3. Aggregate for other midfield rivals for broader comparison/sanity checks.
 """
 
-# 4.1, converting to a long format - is done already. 
-
-# 4.2 calculate mean and std dev of absolute time deltas by sector type
-mean_std_deltas = (
-    df_labelled_sectors
-    .groupby('sector_type')['sector_delta']
-    .agg(mean_delta='mean', std_delta='std')
-    .reset_index()
-    .round(3)
-)
-
-# calculate mean and std dev of percentage deltas by sector type
-mean_std_pcts = (
-    df_labelled_sectors
-    .groupby('sector_type')['pct_slower']
-    .agg(mean_pct_slower='mean', std_pct_slower='std')
-    .reset_index()
-    .round(3)
-)
-
-# print results clearly
-print("\nBenchmarking Williams' Sector Performance (Time Delta in Seconds):\n")
-print(mean_std_deltas.to_string(index=False))
-
-print("\nBenchmarking Williams' Sector Performance (Percent Slower vs. Fastest Team):\n")
-print(mean_std_pcts.to_string(index=False))
-
-# 4.3 - repeating process for other midfield teams might take too long
-# instead sanity check by counting fastest_team by sector/circuit type
-# create a multiindex table, sort by n_fastest within each sector type, descending.
-
-team_counts = df_labelled_sectors.groupby(['sector_type', 'fastest_team']).size().reset_index(name='n_fastest') # group by sector_type and fastest team
-
-team_counts_multi = team_counts.set_index(['sector_type', 'fastest_team'])
-team_counts_multi_sorted = team_counts_multi.groupby(level='sector_type', group_keys=False).apply(
-    lambda x: x.sort_values('n_fastest', ascending=False)
-)
-
-print("\nWhich of the midfield teams were the fastest in 2018 and 2019 in which sector types?\n")
-print(team_counts_multi_sorted)
-
+# 4.1, converting to a long format - is done already by get_labelled_sectors.
+
+def get_sector_type_summary(df_labelled_sectors: pd.DataFrame) -> tuple[pd.DataFrame, pd.DataFrame]:
+	"""
+	4.2 calculate mean and std dev of absolute time deltas, and of percentage deltas, by sector type.
+
+	Return:
+	Two DataFrames - mean_std_deltas (seconds) and mean_std_pcts (percent slower).
+	"""
+	mean_std_deltas = (
+		df_labelled_sectors
+		.groupby('sector_type')['sector_delta']
+		.agg(mean_delta='mean', std_delta='std')
+		.reset_index()
+		.round(3)
+	)
+
+	mean_std_pcts = (
+		df_labelled_sectors
+		.groupby('sector_type')['pct_slower']
+		.agg(mean_pct_slower='mean', std_pct_slower='std')
+		.reset_index()
+		.round(3)
+	)
+
+	return mean_std_deltas, mean_std_pcts
+
+
+def get_fastest_team_counts(df_labelled_sectors: pd.DataFrame) -> pd.DataFrame:
+	"""
+	4.3 - repeating process for other midfield teams might take too long
+	instead sanity check by counting fastest_team by sector/circuit type.
+
+	Return:
+	A MultiIndex (sector_type, fastest_team) DataFrame, sorted by n_fastest within each sector type, descending.
+	"""
+	team_counts = df_labelled_sectors.groupby(['sector_type', 'fastest_team']).size().reset_index(name='n_fastest') # group by sector_type and fastest team
+
+	team_counts_multi = team_counts.set_index(['sector_type', 'fastest_team'])
+	return team_counts_multi.groupby(level='sector_type', group_keys=False).apply(
+		lambda x: x.sort_values('n_fastest', ascending=False)
+	)
 
 # ---------------- 5 & 6. FINAL STEPS ---------------
 
 """
 5. Identify and treat any outliers, if present. Label carefully if needed, or consider removing them.
-6. Prepare for visualisation and hypothesis testing. 
+6. Prepare for visualisation and hypothesis testing.
 	6.1 Export to CSV if needed. e.g each row: `Year`, `Race`, `Driver`, `Sector`, `Sector_Delta`, `Sector_Type`, `Circuit_Type`.
 	6.2 For hypothesis testing: group sector deltas by sector type or use t-tests for statistical significance.
 	6.3 For visualisation: use boxplots, heatmaps, or barplots.
@@ -497,32 +556,92 @@ print(team_counts_multi_sorted)
 
 # 5. z-score and visual (boxplot) checks for outliers
 
-import matplotlib.pyplot as plt 
-import seaborn as sns
-from scipy.stats import zscore 
+def add_zscores(df_labelled_sectors: pd.DataFrame) -> pd.DataFrame:
+	"""
+	Add a 'zscore' column for sector_delta - values over +3 or under -3 are treated as outliers.
+	"""
+	from scipy.stats import zscore # imported lazily - only needed for the outlier check
 
-# z-score check (over +3 or under -3)
-df_labelled_sectors['zscore'] = zscore(df_labelled_sectors['sector_delta'])
+	df_labelled_sectors['zscore'] = zscore(df_labelled_sectors['sector_delta'])
+	return df_labelled_sectors
 
-print("\nZ-score check for outliers - results:\n")
-print(df_labelled_sectors[df_labelled_sectors['zscore'].abs() > 3])
 
-# create a boxplot to spot outliers visually
-sns.boxplot(
-	x = 'sector_type', 
-	y = 'sector_delta', 
-	data = df_labelled_sectors
-)
-plt.title("Williams Sector Delta by Sector Type")
-plt.show()
+def plot_sector_deltas(df_labelled_sectors: pd.DataFrame) -> None:
+	"""
+	Create a boxplot of Williams' sector delta by sector type, to spot outliers visually.
+	"""
+	import matplotlib.pyplot as plt # imported lazily - plotting is never needed in library use
+	import seaborn as sns
+
+	sns.boxplot(
+		x = 'sector_type',
+		y = 'sector_delta',
+		data = df_labelled_sectors
+	)
+	plt.title("Williams Sector Delta by Sector Type")
+	plt.show()
 
 """
 Empty DataFrame from z-score check confirms no outlier values (using |zscore| > 3 test)
 'is_accurate == True', non-deleted laps and manual session curation yielded a dataset free of extreme values.
-No evidence of values that could distort summary statistics or bias hypothesis testing. 
+No evidence of values that could distort summary statistics or bias hypothesis testing.
 Results reflect genuine and representative Williams versus midfield gaps.
 """
 
-# 6. Export final labelled sectors dataframe to CSV.
+# -------------------------------------------------------------------------------------------------------- #
+
+if __name__ == '__main__':
+	df = pd.read_csv(ALL_LAPS_PATH) # load the csv
+
+	df.to_csv("processed_data/all-laps-cleaned.csv", index = False)
+
+	# steps 1 & 2
+	df_best_midfield = get_best_midfield_laps(df)
+	df_best_midfield.to_csv("processed_data/all-laps-best-midfield.csv") # export to a csv
+
+	# filter Williams' fastest laps from df_best_midfield dataframe.
+	df_best_williams = df_best_midfield[df_best_midfield["Team"] == "Williams"]
+	df_best_williams.to_csv("processed_data/williams-best-laps.csv")
+
+	# 3.1 & 3.2 - fastest sectors and laps of every team, then williams' deltas to the fastest midfield team
+	df_deficits = get_team_deficits(get_fastest_by_team(df_best_midfield), team="Williams")
+
+	# display deltas and fastest teams
+	for (year, race), session in df_deficits.groupby(['year', 'race'], sort=False):
+		s1_delta, s2_delta, s3_delta, lap_delta = session['delta']
+		team1, team2, team3, team4 = session['fastest_team']
+
+		print(f"{year} {race}")
+		print(f"S1 Delta: {s1_delta}; S2 Delta: {s2_delta}; S3 Delta: {s3_delta}; Lap Delta: {lap_delta}")
+		print(f"S1 Fastest: {team1}; S2 Fastest: {team2}; S3 Fastest: {team3}; Lap Fastest: {team4}\n")
+
+	# 3.3 - labelled sectors
+	df_labelled_sectors = get_labelled_sector_deficits(df_deficits)
+
+	print(df_labelled_sectors.info())
+	print(df_labelled_sectors)
+
+	# 4.2 - mean and std dev by sector type
+	mean_std_deltas, mean_std_pcts = get_sector_type_summary(df_labelled_sectors)
+
+	# print results clearly
+	print("\nBenchmarking Williams' Sector Performance (Time Delta in Seconds):\n")
+	print(mean_std_deltas.to_string(index=False))
+
+	print("\nBenchmarking Williams' Sector Performance (Percent Slower vs. Fastest Team):\n")
+	print(mean_std_pcts.to_string(index=False))
+
+	# 4.3 - fastest team counts
+	print("\nWhich of the midfield teams were the fastest in 2018 and 2019 in which sector types?\n")
+	print(get_fastest_team_counts(df_labelled_sectors))
+
+	# 5. z-score check (over +3 or under -3), then boxplot
+	df_labelled_sectors = add_zscores(df_labelled_sectors)
+
+	print("\nZ-score check for outliers - results:\n")
+	print(df_labelled_sectors[df_labelled_sectors['zscore'].abs() > 3])
+
+	plot_sector_deltas(df_labelled_sectors)
 
-df_labelled_sectors.to_csv("processed_data/williams-deltas-by-sector-type.csv") 
\ No newline at end of file
+	# 6. Export final labelled sectors dataframe to CSV.
+	df_labelled_sectors.to_csv("processed_data/williams-deltas-by-sector-type.csv")
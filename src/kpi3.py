@@ -1,3 +1,6 @@
+import os
+import sqlite3
+import numpy as np
 import pandas as pd
 
 """
@@ -20,13 +23,16 @@ Steps:
 Next steps, in stage 4 - visualisation, with filters, and hypothesis testing using ttest_ind() and similar methods.
 """
 
-df = pd.read_csv('processed_data/driver-lap-times-validated.csv') # load the data
+LAP_TIMES_PATH = 'processed_data/driver-lap-times-validated.csv'
+
+# nothing below runs at import time - the data is loaded and the example printed under __main__ at the bottom.
+# run from the project root with: python -m src.kpi3
 
 # -------------------------------------------------------------------------------------------------------- # 
 # 1. Aggregation function
 
 def get_laptime_consistency(
-        df: pd.DataFrame, 
+        df: pd.DataFrame | sqlite3.Connection, 
         experience_level: str = None,
         year: int | list[int] = None, 
         gp_name: str | list[str] = None, 
@@ -41,7 +47,7 @@ def get_laptime_consistency(
     6. Merge results into a summary DataFrame and rename columns for clarity.
 
     Arguments:
-    df -- DataFrame containing lap time data
+    df -- DataFrame containing lap time data, or a connection from src.sql_backend.connect() to filter and aggregate in SQL
     experience_level -- 'rookie' or 'experienced' to filter by experience level (optional)
     year -- Single year or list of years to filter (optional)
     gp_name -- Single GP name or list of GP names to filter (optional)
@@ -52,6 +58,10 @@ def get_laptime_consistency(
     along with lap counts for each experience level, considering optional filters.
     """
 
+    if isinstance(df, sqlite3.Connection): # pushed down - only the per-level sums come back
+        from src.sql_backend import sql_laptime_consistency
+        return sql_laptime_consistency(df, experience_level=experience_level, year=year, gp_name=gp_name)
+
     # 1. ---------- filter the data if parameters are provided ---------- 
     if experience_level is not None: 
         df = df[df['rookie_or_experienced'] == experience_level]
@@ -104,9 +114,251 @@ def get_laptime_consistency(
     })
     return grouped_by_experience[['experience_level', 'mean_ms', 'mean_formatted', 'std_dev_ms', 'std_dev_formatted', 'n_laps']]
 
-print("\n")
-print(get_laptime_consistency(df, 
-                              year = [2017, 2018, 2019], 
-                              gp_name = ['Monaco Grand Prix', 'Hungarian Grand Prix', 'Singapore Grand Prix']
-                              ))  # Example usage of the function
-print("\n")
\ No newline at end of file
+# -------------------------------------------------------------------------------------------------------- # 
+# 2. Sufficient-statistics index
+# get_laptime_consistency rescans the full lap table on every call. For repeated filter combinations, build an index once:
+# per (race, driver) lap count, sum and sum of squares (plus min/max). Any filter then only sums index rows -
+#   mean = sum / n,  variance = (sum_sq - sum^2 / n) / (n - 1)
+
+def build_laptime_index(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Build the per (race, driver) sufficient statistics of lap_time_ms, dropping invalid (non-positive) lap times.
+
+    Arguments:
+    df -- DataFrame containing lap time data, e.g. driver-lap-times-validated.csv
+
+    Return:
+    A DataFrame with one row per race and driver: 'race_id', 'driver_id', 'gp_year', 'gp_name', 'rookie_or_experienced',
+    'n_laps', 'sum_ms', 'sum_sq_ms', 'min_ms', 'max_ms'.
+    """
+    df = df[df['lap_time_ms'] > 0]
+    lap_times = df['lap_time_ms'].astype('float64')
+
+    return df.assign(lap_time_sq_ms=lap_times ** 2).groupby(
+        ['race_id', 'driver_id', 'gp_year', 'gp_name', 'rookie_or_experienced'], observed=True
+    ).agg(
+        n_laps=('lap_time_ms', 'size'),
+        sum_ms=('lap_time_ms', 'sum'),
+        sum_sq_ms=('lap_time_sq_ms', 'sum'),
+        min_ms=('lap_time_ms', 'min'),
+        max_ms=('lap_time_ms', 'max')
+    ).reset_index()
+
+
+def format_ms(times_ms) -> list[str]:
+    """
+    Convert milliseconds to mm:ss.ms strings, e.g. 95272 -> '01:35.272'.
+    """
+    return [f"{int(ms // 60000):02}:{int((ms % 60000) // 1000):02}.{int(ms % 1000):03}" if pd.notna(ms) else None for ms in times_ms]
+
+
+def query_laptime_consistency(
+        index: pd.DataFrame,
+        experience_level: str = None,
+        year: int | list[int] = None,
+        gp_name: str | list[str] = None) -> pd.DataFrame:
+    """
+    Same result as get_laptime_consistency, computed from the index built by build_laptime_index.
+
+    Arguments:
+    index -- DataFrame returned by build_laptime_index
+    experience_level -- 'rookie' or 'experienced' to filter by experience level (optional)
+    year -- Single year or list of years to filter (optional)
+    gp_name -- Single GP name or list of GP names to filter (optional)
+
+    Return:
+    A DataFrame with columns 'experience_level', 'mean_ms', 'mean_formatted', 'std_dev_ms', 'std_dev_formatted', 'n_laps'.
+    """
+    # 1. ---------- filter index rows - a few hundred rows rather than every lap ----------
+    keep = np.ones(len(index), dtype=bool)
+    if experience_level is not None:
+        keep &= index['rookie_or_experienced'].to_numpy() == experience_level
+    if year is not None:
+        keep &= np.isin(index['gp_year'].to_numpy(), [year] if isinstance(year, int) else year)
+    if gp_name is not None:
+        keep &= np.isin(index['gp_name'].to_numpy(), [gp_name] if isinstance(gp_name, str) else gp_name)
+
+    # 2. ---------- combine the sufficient statistics, per experience level ----------
+    levels, level_codes = np.unique(index['rookie_or_experienced'].to_numpy()[keep].astype(str), return_inverse=True)
+    n = np.bincount(level_codes, weights=index['n_laps'].to_numpy()[keep], minlength=len(levels))
+    sum_ms = np.bincount(level_codes, weights=index['sum_ms'].to_numpy()[keep], minlength=len(levels))
+    sum_sq_ms = np.bincount(level_codes, weights=index['sum_sq_ms'].to_numpy()[keep], minlength=len(levels))
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        variance = np.where(n > 1, (sum_sq_ms - sum_ms ** 2 / n) / (n - 1), np.nan)
+
+    mean_ms = sum_ms / n
+    std_dev_ms = np.sqrt(np.clip(variance, 0, None))
+
+    # 3. ---------- convert ms to mm:ss:ms, built in one go as the frame is tiny ----------
+    return pd.DataFrame({
+        'experience_level': levels,
+        'mean_ms': mean_ms,
+        'mean_formatted': format_ms(mean_ms),
+        'std_dev_ms': std_dev_ms,
+        'std_dev_formatted': format_ms(std_dev_ms),
+        'n_laps': n.astype(int)
+    })
+
+
+def compare_query_latency(df: pd.DataFrame, n_queries: int = 200, seed: int = 0) -> pd.DataFrame:
+    """
+    Benchmark random filter combinations against get_laptime_consistency and query_laptime_consistency,
+    checking both give the same result for every query.
+
+    Return:
+    A DataFrame with one row per method: 'method', 'n_queries', 'total_ms', 'mean_query_ms'.
+    """
+    import random
+    import time
+
+    rng = random.Random(seed)
+    years = sorted(df['gp_year'].unique().tolist())
+    gp_names = sorted(df['gp_name'].unique().tolist())
+
+    queries = [{
+        'experience_level': rng.choice([None, 'rookie', 'experienced']),
+        'year': rng.choice([None, rng.choice(years), rng.sample(years, 2)]),
+        'gp_name': rng.choice([None, rng.choice(gp_names), rng.sample(gp_names, 3)])
+    } for _ in range(n_queries * 2)]
+
+    start = time.perf_counter()
+    index = build_laptime_index(df)
+    build_ms = (time.perf_counter() - start) * 1000
+
+    # get_laptime_consistency cannot format an empty result - only keep filter combinations matching some laps
+    queries = [query for query in queries if not query_laptime_consistency(index, **query).empty][:n_queries]
+    n_queries = len(queries)
+
+    start = time.perf_counter()
+    scan_results = [get_laptime_consistency(df, verbose=False, **query) for query in queries]
+    scan_ms = (time.perf_counter() - start) * 1000
+
+    start = time.perf_counter()
+    index_results = [query_laptime_consistency(index, **query) for query in queries]
+    index_ms = (time.perf_counter() - start) * 1000
+
+    for scanned, indexed in zip(scan_results, index_results):
+        pd.testing.assert_frame_equal(scanned, indexed, check_dtype=False, check_exact=False, rtol=1e-9)
+
+    return pd.DataFrame([
+        {'method': 'get_laptime_consistency (scan)', 'n_queries': n_queries, 'total_ms': scan_ms},
+        {'method': 'build_laptime_index (once)', 'n_queries': 0, 'total_ms': build_ms},
+        {'method': 'query_laptime_consistency (index)', 'n_queries': n_queries, 'total_ms': index_ms},
+    ]).assign(mean_query_ms=lambda x: (x['total_ms'] / x['n_queries']).where(x['n_queries'] > 0)).round(3)
+
+# -------------------------------------------------------------------------------------------------------- # 
+# 3. Streaming consistency over a full Ergast lap_times.csv
+# driver-lap-times.csv is a hand-filtered extract: 6 Williams drivers at 10 circuits. The full Ergast lap_times table
+# is read in chunks instead - each chunk's per (race, driver) count, mean and M2 (sum of squared deviations) are
+# merged into running totals with the parallel form of Welford's update (Chan et al.):
+#   n = n_a + n_b,  mean = mean_a + delta * n_b / n,  M2 = M2_a + M2_b + delta^2 * n_a * n_b / n,  delta = mean_b - mean_a
+# Memory is bounded by the number of (race, driver) pairs, never by the number of laps.
+
+ERGAST_LAP_TIMES_PATH = 'raw_data/lap_times.csv'
+
+# drivers count as rookies in their first ROOKIE_SEASONS seasons - matches the hand labels for 2015-2018 and russell 2019
+# (the SQL extract also labels stroll's third season, 2019, as rookie)
+ROOKIE_SEASONS = 2
+
+def merge_running_stats(state: pd.DataFrame, chunk: pd.DataFrame) -> pd.DataFrame:
+    """
+    Merge two sets of per-group (n, mean, m2) statistics, aligned on their index.
+    Groups present in only one of the two are carried over unchanged.
+    """
+    joined = state.join(chunk, how='outer', lsuffix='_a', rsuffix='_b').fillna(0)
+
+    n = joined['n_a'] + joined['n_b']
+    delta = joined['mean_b'] - joined['mean_a']
+
+    return pd.DataFrame({
+        'n': n,
+        'mean': joined['mean_a'] + delta * joined['n_b'] / n,
+        'm2': joined['m2_a'] + joined['m2_b'] + delta ** 2 * joined['n_a'] * joined['n_b'] / n
+    }, index=joined.index)
+
+
+def stream_laptime_consistency(
+        lap_times_path: str = ERGAST_LAP_TIMES_PATH,
+        chunksize: int = 250_000,
+        raw_dir: str = 'raw_data') -> pd.DataFrame:
+    """
+    Steps:
+    1. Read an Ergast-format lap_times.csv (raceId, driverId, lap, position, time, milliseconds) in chunks.
+    2. Reduce each chunk to per (race, driver) n, mean and M2, and merge into the running totals.
+    3. Label each race with year, name and round, each driver with name and rookie/experienced status.
+    4. Return one lap time standard deviation per driver per race.
+
+    Arguments:
+    lap_times_path -- path to the Ergast lap_times.csv (default: 'raw_data/lap_times.csv')
+    chunksize -- number of laps read per chunk (default: 250,000)
+    raw_dir -- directory of the other Ergast tables - races, drivers and results (default: 'raw_data')
+
+    Return:
+    A DataFrame with the same columns as laptimes_std.csv - 'gp_year', 'gp_name', 'gp_round', 'driver_name',
+    'rookie_or_experienced', 'laptime_std', 'laptime_std_ms' - plus 'race_id', 'driver_id' and 'n_laps', for every driver in every race.
+    """
+    from src.loader import load_table
+
+    # 1 & 2. ---------- stream the laps, keeping only running totals ----------
+    state = pd.DataFrame(columns=['n', 'mean', 'm2'], dtype='float64')
+
+    for chunk in pd.read_csv(lap_times_path, usecols=['raceId', 'driverId', 'milliseconds'],
+                             na_values=['\\N'], chunksize=chunksize):
+        chunk = chunk[chunk['milliseconds'] > 0]
+        grouped = chunk.groupby(['raceId', 'driverId'])['milliseconds']
+
+        chunk_stats = pd.DataFrame({'n': grouped.size().astype('float64'), 'mean': grouped.mean()})
+        chunk_stats['m2'] = grouped.var(ddof=0).fillna(0) * chunk_stats['n']
+
+        state = chunk_stats if state.empty else merge_running_stats(state, chunk_stats)
+
+    state.index.names = ['race_id', 'driver_id']
+    laptimes_std = state.reset_index()
+    laptimes_std['n_laps'] = laptimes_std['n'].astype(int)
+    laptimes_std['laptime_std_ms'] = (laptimes_std['m2'] / (laptimes_std['n'] - 1)).where(laptimes_std['n'] > 1) ** 0.5
+
+    # 3. ---------- attach race and driver labels ----------
+    races = load_table('races', raw_dir)[['raceId', 'year', 'name', 'round']].astype({'name': 'object'})
+    drivers = load_table('drivers', raw_dir)
+    drivers = pd.DataFrame({
+        'driver_id': drivers['driverId'],
+        'driver_name': drivers['forename'].astype(str) + ' ' + drivers['surname'].astype(str)
+    })
+
+    # a driver's first season is their first year with a race result
+    results = load_table('results', raw_dir)[['raceId', 'driverId']].merge(races[['raceId', 'year']], on='raceId')
+    first_season = results.groupby('driverId', observed=True)['year'].min().rename('first_season')
+
+    laptimes_std = laptimes_std.merge(
+        races.rename(columns={'raceId': 'race_id', 'year': 'gp_year', 'name': 'gp_name', 'round': 'gp_round'}), on='race_id'
+    ).merge(drivers, on='driver_id').merge(first_season, left_on='driver_id', right_index=True, how='left')
+
+    is_rookie = laptimes_std['gp_year'] - laptimes_std['first_season'].fillna(laptimes_std['gp_year']) < ROOKIE_SEASONS
+    laptimes_std['rookie_or_experienced'] = ['rookie' if rookie else 'experienced' for rookie in is_rookie]
+
+    # 4. ---------- format and return, in the same order as the groupby behind laptimes_std.csv ----------
+    laptimes_std['laptime_std'] = format_ms(laptimes_std['laptime_std_ms'])
+    laptimes_std = laptimes_std.sort_values(['gp_year', 'gp_name', 'gp_round', 'driver_name']).reset_index(drop=True)
+
+    return laptimes_std[['gp_year', 'gp_name', 'gp_round', 'driver_name', 'rookie_or_experienced',
+                         'laptime_std', 'laptime_std_ms', 'race_id', 'driver_id', 'n_laps']]
+
+if __name__ == '__main__':
+    df = pd.read_csv(LAP_TIMES_PATH) # load the data
+
+    print("\n")
+    print(get_laptime_consistency(df, 
+                                  year = [2017, 2018, 2019], 
+                                  gp_name = ['Monaco Grand Prix', 'Hungarian Grand Prix', 'Singapore Grand Prix']
+                                  ))  # Example usage of the function
+    print("\n")
+
+    print("Query latency - rescanning laps vs. the sufficient-statistics index (200 random filter combinations).\n")
+    print(compare_query_latency(df).to_string(index=False))
+    print("\n")
+
+    # full-history mode - only if the Ergast lap_times table has been downloaded into raw_data/
+    if os.path.exists(ERGAST_LAP_TIMES_PATH):
+        print("Lap time consistency for every driver in every race, streamed from raw_data/lap_times.csv.\n")
+        print(stream_laptime_consistency())
@@ -0,0 +1,178 @@
+import time
+import numpy as np
+import pandas as pd
+
+"""
+Lap Flags - in-laps, out-laps and lap 1 from a sorted join of pit stops onto lap times
+
+KPI 3's lap time standard deviation (processed_data/laptimes_std.csv) is taken over every lap under 2 minutes,
+including the standing start and the laps into and out of the pits. Those laps are slower by design, not by
+inconsistency, and inflate the std for every driver - which drowns the rookie vs experienced signal in src/analysis3.py.
+
+Steps:
+1. Encode (race, driver, lap) as one int64 key on both tables, so the join is a search over a single sorted array
+    instead of a multi-column merge or a loop over races.
+2. Sort the unique pit stop keys once, then searchsorted every lap key against them:
+    - in-lap: the lap's own key is a stop
+    - out-lap: the key of the lap before is a stop
+    - lap 1: the standing start
+    Every lap is clean if it is none of these.
+3. Recompute consistency in the same pass: one groupby over the flagged laps gives the std of every lap (as
+    laptimes_std.csv) and of clean laps only, side by side.
+
+Also a build stage: processed_data/laptimes_std_clean.csv (see src/build.py).
+
+Run from the project root: python -m src.lap_flags (KPI 3 on clean laps, plus a join benchmark on a full-history lap table)
+"""
+
+LAP_TIMES_PATH = 'processed_data/driver-lap-times-validated.csv'
+LAPTIMES_STD_CLEAN_PATH = 'processed_data/laptimes_std_clean.csv'
+
+# bits of the (race, driver, lap) key given to the driver id and the lap number
+DRIVER_BITS = 16
+LAP_BITS = 10
+
+LAPTIME_GROUPS = ['gp_year', 'gp_name', 'gp_round', 'driver_name', 'rookie_or_experienced']
+
+# -------------------------------------------------------------------------------------------------------- #
+
+# steps 1 & 2 - keys and the sorted join
+
+def get_lap_keys(race_ids, driver_ids, laps) -> np.ndarray:
+    """
+    Returns:
+    np.ndarray: One int64 key per (race, driver, lap) - ordered by race, then driver, then lap.
+    """
+    return ((np.asarray(race_ids, dtype='int64') << (DRIVER_BITS + LAP_BITS))
+            | (np.asarray(driver_ids, dtype='int64') << LAP_BITS)
+            | np.asarray(laps, dtype='int64'))
+
+
+def flag_pit_laps(laps: pd.DataFrame,
+                  stops: pd.DataFrame,
+                  lap_columns: tuple[str, str, str] = ('race_id', 'driver_id', 'lap_number'),
+                  stop_columns: tuple[str, str, str] = ('raceId', 'driverId', 'lap')) -> pd.DataFrame:
+    """
+    Flag the in-laps, out-laps and first laps of a lap times table.
+
+    Arguments:
+    laps (pd.DataFrame): Lap times, e.g. driver-lap-times-validated.csv or raw lap_times.
+    stops (pd.DataFrame): Pit stops, e.g. raw_data/pit_stops.csv.
+    lap_columns (tuple[str, str, str]): Race, driver and lap columns of laps. Default is ('race_id', 'driver_id', 'lap_number').
+    stop_columns (tuple[str, str, str]): Race, driver and lap columns of stops. Default is ('raceId', 'driverId', 'lap').
+
+    Returns:
+    pd.DataFrame: A copy of laps with boolean 'is_in_lap', 'is_out_lap', 'is_first_lap' and 'is_clean_lap' columns.
+    """
+    race, driver, lap = lap_columns
+    lap_keys = get_lap_keys(laps[race], laps[driver], laps[lap])
+    stop_keys = np.unique(get_lap_keys(*(stops[column] for column in stop_columns)))
+
+    def is_stop(keys: np.ndarray) -> np.ndarray:
+        # binary search of every key in the sorted stops - no hashing, no per-race work
+        position = np.searchsorted(stop_keys, keys).clip(max=max(len(stop_keys) - 1, 0))
+        return stop_keys[position] == keys if len(stop_keys) else np.zeros(len(keys), dtype=bool)
+
+    flagged = laps.copy()
+    flagged['is_in_lap'] = is_stop(lap_keys)
+    flagged['is_out_lap'] = is_stop(lap_keys - 1) & (laps[lap].to_numpy() > 1)
+    flagged['is_first_lap'] = laps[lap].to_numpy() == 1
+    flagged['is_clean_lap'] = ~(flagged['is_in_lap'] | flagged['is_out_lap'] | flagged['is_first_lap'])
+    return flagged
+
+# -------------------------------------------------------------------------------------------------------- #
+
+# step 3 - consistency on every lap and on clean laps, in one pass
+
+def get_clean_laptimes_std(flagged: pd.DataFrame) -> pd.DataFrame:
+    """
+    Per-driver, per-race lap time std over every lap and over clean laps only.
+
+    Arguments:
+    flagged (pd.DataFrame): Output of flag_pit_laps on driver-lap-times-validated.csv.
+
+    Returns:
+    pd.DataFrame: The laptimes_std.csv columns, plus 'n_laps', 'n_clean_laps', 'clean_laptime_std' and 'clean_laptime_std_ms'.
+    """
+    from src.kpi3 import format_ms
+
+    laps = flagged[LAPTIME_GROUPS + ['lap_time_ms']].assign(
+        clean_lap_time_ms=flagged['lap_time_ms'].where(flagged['is_clean_lap']).astype('float64'),
+        is_clean_lap=flagged['is_clean_lap'],
+    )
+    df_std = laps.groupby(LAPTIME_GROUPS).agg(
+        laptime_std_ms=('lap_time_ms', 'std'),
+        n_laps=('lap_time_ms', 'size'),
+        clean_laptime_std_ms=('clean_lap_time_ms', 'std'),
+        n_clean_laps=('is_clean_lap', 'sum'),
+    ).reset_index()
+
+    df_std['laptime_std'] = format_ms(df_std['laptime_std_ms'])
+    df_std['clean_laptime_std'] = format_ms(df_std['clean_laptime_std_ms'])
+    return df_std[LAPTIME_GROUPS + ['laptime_std', 'laptime_std_ms', 'n_laps', 'clean_laptime_std', 'clean_laptime_std_ms', 'n_clean_laps']]
+
+# -------------------------------------------------------------------------------------------------------- #
+
+# benchmark - a merge per race vs one sorted join, on a lap table the size of the full history
+
+def get_full_history_laps(raw_dir: str = 'raw_data') -> pd.DataFrame:
+    """
+    Returns:
+    pd.DataFrame: One row per lap each driver completed in every race since pit stops were recorded -
+    'race_id', 'driver_id' and 'lap_number', expanded from the laps column of raw_data/results.csv.
+    """
+    from src.loader import load_table
+
+    results = load_table('results', raw_dir)[['raceId', 'driverId', 'laps']].dropna().astype('int64')
+    results = results[results['raceId'] >= load_table('pit_stops', raw_dir)['raceId'].min()]
+    rows = np.repeat(np.arange(len(results)), results['laps'].to_numpy())
+    first = np.repeat(np.cumsum(results['laps'].to_numpy()) - results['laps'].to_numpy(), results['laps'].to_numpy())
+    return pd.DataFrame({
+        'race_id': results['raceId'].to_numpy()[rows],
+        'driver_id': results['driverId'].to_numpy()[rows],
+        'lap_number': np.arange(len(rows)) - first + 1,
+    })
+
+
+def flag_pit_laps_per_race(laps: pd.DataFrame, stops: pd.DataFrame) -> pd.DataFrame:
+    """
+    The same flags with a merge per race - the approach flag_pit_laps replaces.
+    """
+    flagged = []
+    for race_id, race_laps in laps.groupby('race_id'):
+        race_stops = stops[stops['raceId'] == race_id][['driverId', 'lap']].drop_duplicates().rename(columns={'driverId': 'driver_id'})
+        in_laps = race_laps.merge(race_stops.assign(is_in_lap=True), left_on=['driver_id', 'lap_number'],
+                                  right_on=['driver_id', 'lap'], how='left')
+        out_laps = race_laps.merge(race_stops.assign(lap=race_stops['lap'] + 1, is_out_lap=True), left_on=['driver_id', 'lap_number'],
+                                   right_on=['driver_id', 'lap'], how='left')
+        flagged.append(race_laps.assign(is_in_lap=in_laps['is_in_lap'].notna().to_numpy(),
+                                        is_out_lap=out_laps['is_out_lap'].notna().to_numpy()))
+    return pd.concat(flagged).sort_index()
+
+
+if __name__ == '__main__':
+    from src.loader import load_table
+
+    stops = load_table('pit_stops')[['raceId', 'driverId', 'lap']]
+    flagged = flag_pit_laps(pd.read_csv(LAP_TIMES_PATH), stops)
+    print(flagged[['is_in_lap', 'is_out_lap', 'is_first_lap', 'is_clean_lap']].sum().to_string())
+
+    df_std = get_clean_laptimes_std(flagged)
+    df_std_all = pd.read_csv('processed_data/laptimes_std.csv', index_col=0)
+    assert np.allclose(df_std['laptime_std_ms'], df_std_all['laptime_std_ms'])
+
+    print("\nKPI 3 - lap time std per driver and race (ms), every lap vs clean laps:\n")
+    print(df_std.groupby('rookie_or_experienced')[['laptime_std_ms', 'clean_laptime_std_ms']].agg(['mean', 'median']).round(0))
+
+    laps = get_full_history_laps()
+    start = time.perf_counter()
+    sorted_join = flag_pit_laps(laps, stops)
+    sorted_ms = (time.perf_counter() - start) * 1000
+
+    start = time.perf_counter()
+    per_race = flag_pit_laps_per_race(laps, stops)
+    per_race_ms = (time.perf_counter() - start) * 1000
+
+    assert np.array_equal(sorted_join['is_in_lap'], per_race['is_in_lap']) and np.array_equal(sorted_join['is_out_lap'], per_race['is_out_lap'])
+    print(f"\nFull-history lap table, {len(laps):,} laps over {laps['race_id'].nunique()} races - same flags:")
+    print(f"merge per race: {per_race_ms:.0f} ms, sorted join: {sorted_ms:.0f} ms ({per_race_ms / sorted_ms:.0f}x)")
@@ -0,0 +1,243 @@
+import os
+import time
+import pandas as pd
+
+"""
+Raw Data Loader - Typed Columnar Cache for the Ergast tables
+
+The Ergast tables in raw_data/ never change once downloaded, but every script and notebook
+re-parses them with pd.read_csv, re-inferring dtypes each time and leaving '\\N' nulls and
+lap time strings such as "1:26.572" untyped.
+
+Steps:
+1. Parse a raw_data/*.csv once with explicit typing:
+    - '\\N' becomes a proper null, integer columns become nullable ints (Int32/Int64)
+    - refs, names and other repeated labels become categoricals
+    - date columns become datetime64
+    - lap time strings (q1/q2/q3, fastestLapTime) gain an integer millisecond column, e.g. q1 -> q1_ms
+2. Store the typed table as a zstd-compressed parquet file under cache/raw_data/.
+3. Serve later loads from the parquet file, rebuilding it only if the CSV is newer than the cache.
+
+Run from the project root: python -m src.loader (prints a timing comparison against the CSV path)
+"""
+
+RAW_DATA_DIR = 'raw_data'
+CACHE_DIR = 'cache/raw_data'
+
+# lap time strings ("m:ss.sss") converted into integer milliseconds, by table
+LAP_TIME_COLUMNS = {
+    'qualifying': ['q1', 'q2', 'q3'],
+    'results': ['fastestLapTime'],
+    'sprint_results': ['fastestLapTime'],
+    'lap_times': ['time'],
+}
+
+# columns holding free text, links or clock times - never turned into categoricals
+TEXT_COLUMNS = ['url', 'time', 'duration']
+
+# a string column becomes categorical if its unique values are fewer than this share of its rows
+CATEGORY_MAX_UNIQUE_RATIO = 0.5
+
+# "h:mm:ss.sss", "m:ss.sss" or "ss.sss" - hours and minutes are optional
+LAP_TIME_PATTERN = r'^(?:(?:(\d+):)?(\d+):)?(\d+(?:\.\d+)?)$'
+
+# -------------------------------------------------------------------------------------------------------- #
+
+# step 1 - typed parsing of a single raw_data table
+
+def lap_time_to_ms(times: pd.Series) -> pd.Series:
+    """
+    Convert lap time strings into integer milliseconds, vectorised over the whole column.
+    Missing or unparseable values stay missing.
+
+    Arguments:
+    times (pd.Series): A series of lap time strings, e.g. "1:26.572".
+
+    Returns:
+    pd.Series: A nullable Int64 series of lap times in milliseconds, e.g. 86572.
+    """
+    parts = times.astype('string').str.extract(LAP_TIME_PATTERN) # columns 0, 1, 2 = hours, minutes, seconds
+    parts = parts.apply(pd.to_numeric, errors='coerce')
+
+    total_seconds = parts[0].fillna(0) * 3600 + parts[1].fillna(0) * 60 + parts[2]
+
+    return (total_seconds * 1000).round().astype('Int64')
+
+
+def read_raw_csv(table: str, raw_dir: str = RAW_DATA_DIR) -> pd.DataFrame:
+    """
+    Parse raw_data/<table>.csv directly, applying the typing rules described at the top of this module.
+    This is the slow path - load_table() calls it once and caches the result.
+
+    Arguments:
+    table (str): The Ergast table name without extension, e.g. 'results'.
+    raw_dir (str): The directory holding the raw CSV files. Default is 'raw_data'.
+
+    Returns:
+    pd.DataFrame: The typed table.
+    """
+    # '\N' is the only null marker in the Ergast dump - keep_default_na=False stops e.g. 'NA' being read as null
+    df = pd.read_csv(os.path.join(raw_dir, f'{table}.csv'), na_values=['\\N'], keep_default_na=False)
+
+    for col in df.columns:
+        values = df[col]
+
+        if pd.api.types.is_float_dtype(values) and values.dropna().mod(1).eq(0).all():
+            # float only because of '\N' nulls, e.g. results.position - restore to a nullable int
+            df[col] = values.astype('Int64')
+
+        if pd.api.types.is_integer_dtype(df[col]):
+            # ids, positions, laps all fit comfortably in 32 bits - milliseconds may not
+            too_big = df[col].abs().max() >= 2**31 if len(df) else False
+            df[col] = df[col].astype('Int64' if too_big else 'Int32')
+
+        elif col == 'date' or col == 'dob' or col.endswith('_date'):
+            df[col] = pd.to_datetime(values, errors='coerce')
+
+        elif (pd.api.types.is_object_dtype(values) or pd.api.types.is_string_dtype(values)) and col not in TEXT_COLUMNS:
+            if col not in LAP_TIME_COLUMNS.get(table, []) and values.nunique() < CATEGORY_MAX_UNIQUE_RATIO * len(values):
+                df[col] = values.astype('category')
+
+    # add integer millisecond columns next to their lap time strings, e.g. q1 -> q1_ms
+    for col in LAP_TIME_COLUMNS.get(table, []):
+        if col in df.columns:
+            df.insert(df.columns.get_loc(col) + 1, f'{col}_ms', lap_time_to_ms(df[col]))
+
+    return df
+
+# -------------------------------------------------------------------------------------------------------- #
+
+# steps 2 & 3 - build the parquet cache and serve loads from it
+
+def get_cache_path(table: str, cache_dir: str = CACHE_DIR) -> str:
+    """
+    Arguments:
+    table (str): The Ergast table name without extension, e.g. 'results'.
+    cache_dir (str): The directory holding the parquet cache. Default is 'cache/raw_data'.
+
+    Returns:
+    str: The path of the cached parquet file for the table.
+    """
+    return os.path.join(cache_dir, f'{table}.parquet')
+
+
+def is_cache_stale(table: str, raw_dir: str = RAW_DATA_DIR, cache_dir: str = CACHE_DIR) -> bool:
+    """
+    A cached table is stale if it does not exist yet, or if its CSV was modified after the cache was written.
+
+    Returns:
+    bool: True if the table needs to be (re)built from its CSV.
+    """
+    cache_path = get_cache_path(table, cache_dir)
+    if not os.path.exists(cache_path):
+        return True
+    return os.path.getmtime(os.path.join(raw_dir, f'{table}.csv')) > os.path.getmtime(cache_path)
+
+
+def load_table(table: str,
+               raw_dir: str = RAW_DATA_DIR,
+               cache_dir: str = CACHE_DIR,
+               refresh: bool = False) -> pd.DataFrame:
+    """
+    Load a typed Ergast table, from the parquet cache if possible.
+    The CSV is only parsed the first time, or when it is newer than the cache (or refresh=True).
+
+    Arguments:
+    table (str): The Ergast table name without extension, e.g. 'results'.
+    raw_dir (str): The directory holding the raw CSV files. Default is 'raw_data'.
+    cache_dir (str): The directory holding the parquet cache. Default is 'cache/raw_data'.
+    refresh (bool): If True, rebuild the cache from the CSV regardless of its age. Default is False.
+
+    Returns:
+    pd.DataFrame: The typed table.
+    """
+    cache_path = get_cache_path(table, cache_dir)
+
+    if refresh or is_cache_stale(table, raw_dir, cache_dir):
+        df = read_raw_csv(table, raw_dir)
+        os.makedirs(cache_dir, exist_ok=True)
+        # written under a per-process name and renamed into place - parallel loaders never read a half-written file
+        tmp_path = cache_path + f'.{os.getpid()}.tmp'
+        df.to_parquet(tmp_path, compression='zstd', index=False)
+        os.replace(tmp_path, cache_path)
+        return df
+
+    return pd.read_parquet(cache_path)
+
+
+def build_cache(raw_dir: str = RAW_DATA_DIR, cache_dir: str = CACHE_DIR, refresh: bool = False) -> list[str]:
+    """
+    Convert every raw_data/*.csv into the parquet cache. Up-to-date tables are skipped unless refresh=True.
+
+    Returns:
+    list[str]: The names of the tables that were (re)built.
+    """
+    built = []
+    for file_name in sorted(os.listdir(raw_dir)):
+        if not file_name.endswith('.csv'):
+            continue
+        table = file_name[:-len('.csv')]
+        if refresh or is_cache_stale(table, raw_dir, cache_dir):
+            load_table(table, raw_dir, cache_dir, refresh=True)
+            built.append(table)
+    return built
+
+# -------------------------------------------------------------------------------------------------------- #
+
+# timing comparison - plain pd.read_csv vs. typed CSV parse vs. parquet cache
+
+def compare_load_times(tables: list[str] = None,
+                       raw_dir: str = RAW_DATA_DIR,
+                       cache_dir: str = CACHE_DIR,
+                       repeats: int = 5) -> pd.DataFrame:
+    """
+    Time each way of loading the given tables, taking the best of several repeats.
+
+    Arguments:
+    tables (list[str]): Table names to time. Default is every CSV in raw_dir.
+    repeats (int): Number of timed loads per method. Default is 5.
+
+    Returns:
+    pd.DataFrame: One row per table with columns 'table', 'rows', 'csv_ms', 'typed_csv_ms',
+    'parquet_ms', 'csv_kb', 'parquet_kb' and 'speedup' (csv_ms / parquet_ms).
+    """
+    if tables is None:
+        tables = [f[:-len('.csv')] for f in sorted(os.listdir(raw_dir)) if f.endswith('.csv')]
+
+    build_cache(raw_dir, cache_dir)
+
+    def best_of(load) -> float:
+        timings = []
+        for _ in range(repeats):
+            start = time.perf_counter()
+            load()
+            timings.append((time.perf_counter() - start) * 1000)
+        return min(timings)
+
+    results = []
+    for table in tables:
+        csv_path = os.path.join(raw_dir, f'{table}.csv')
+        cache_path = get_cache_path(table, cache_dir)
+
+        results.append({
+            'table': table,
+            'rows': len(load_table(table, raw_dir, cache_dir)),
+            'csv_ms': best_of(lambda: pd.read_csv(csv_path)),
+            'typed_csv_ms': best_of(lambda: read_raw_csv(table, raw_dir)),
+            'parquet_ms': best_of(lambda: pd.read_parquet(cache_path)),
+            'csv_kb': os.path.getsize(csv_path) / 1024,
+            'parquet_kb': os.path.getsize(cache_path) / 1024,
+        })
+
+    df_times = pd.DataFrame(results)
+    df_times['speedup'] = df_times['csv_ms'] / df_times['parquet_ms']
+
+    return df_times.round(2)
+
+
+if __name__ == '__main__':
+    print("Load times for raw_data tables - plain pd.read_csv vs. typed CSV parse vs. parquet cache (best of 5).\n")
+    print(compare_load_times().to_string(index=False))
+    print("\n")
+    print(load_table('qualifying')[['raceId', 'driverId', 'q1', 'q1_ms', 'q2', 'q2_ms', 'q3', 'q3_ms']].head())
+    print(load_table('results').dtypes)
@@ -0,0 +1,364 @@
+import os
+import time
+from functools import partial
+import numpy as np
+import pandas as pd
+
+from src.ingest import FASTF1_CACHE_DIR, ingest_sessions, read_session_store
+from src.kpi2 import MIDFIELD_TEAMS, circuit_type, sector_type
+from src.telemetry import TEAM, interpolate_traces
+
+"""
+Mini-Sector Deficits - Williams vs the fastest midfield car over N equal-distance mini-sectors
+
+processed_data/williams-deltas-by-sector-type.csv (src/kpi2.py) gives Williams' deficit over three sectors per session -
+too coarse to say which corners the time went in. Splitting every lap into N equal-distance mini-sectors (25 or 50)
+narrows a sector deficit down to a few hundred metres of track.
+
+Steps:
+1. For each session, load car data for the fastest lap of every midfield driver (FastF1, with distance along the lap).
+2. Mini-sector boundaries at 0, 1/N, ..., 1 of each lap's own distance - so small differences in measured lap length
+    between cars do not shift the boundaries. Time at every boundary of every lap comes from one batched interpolation
+    (src.telemetry.interpolate_traces) and one np.diff gives all N mini-sector times - no loop per lap.
+3. Sessions are processed across a process pool through src.ingest and stored as parquet in cache/mini_sectors/<N>/,
+    mini-sector times in float32.
+4. The stored times form one (session x driver x mini-sector) float32 matrix - NaN where a driver has no lap in a session.
+    The fastest midfield time per mini-sector is a min over the driver axis, and Williams' deficit is the best Williams
+    time minus that, for every session and mini-sector at once.
+
+Limitations:
+- The sum of the mini-sector deficits over a sector is not the sector_delta of KPI 2: the fastest car is picked
+    per mini-sector here (an ideal midfield lap), and per sector there.
+- Mini-sector times come from car data sampled at roughly 4 Hz, so a 200 m mini-sector is covered by only ~15 samples.
+
+Run from the project root: python -m src.mini_sectors (the KPI 2 qualifying sessions - needs fastf1 and network access,
+or a populated FastF1 cache)
+"""
+
+MINI_SECTOR_STORE_DIR = 'cache/mini_sectors'
+
+# mini-sectors per lap
+N_MINI_SECTORS = 25
+
+# -------------------------------------------------------------------------------------------------------- #
+
+# step 1 - car data of every midfield driver's fastest lap
+
+def load_driver_lap_telemetry(year: int, event: str, session_type: str,
+                              teams: list[str] = MIDFIELD_TEAMS,
+                              fastf1_cache_dir: str = FASTF1_CACHE_DIR,
+                              offline: bool = False) -> pd.DataFrame:
+    """
+    Load car data for the fastest accurate lap of every driver of the given teams in one session.
+
+    Arguments:
+    year (int): The season, e.g. 2019.
+    event (str): The GP name, e.g. 'Monaco Grand Prix'.
+    session_type (str): The FastF1 session identifier, e.g. 'Q'.
+    teams (list[str]): Teams to load. Default is MIDFIELD_TEAMS.
+    fastf1_cache_dir (str): The FastF1 cache directory. Default is 'cache/fastf1'. None disables the cache.
+    offline (bool): If True, only use data already in the FastF1 cache - never download. Default is False.
+
+    Returns:
+    pd.DataFrame: One row per car data sample - 'Team', 'Driver', 'LapTime', 'Sector1Time', 'Sector2Time' (seconds),
+    'Distance' (metres) and 'Time' (seconds from the start of the lap).
+    """
+    import fastf1 # imported lazily - heavy, and each worker process imports it once
+
+    if fastf1_cache_dir is not None:
+        os.makedirs(fastf1_cache_dir, exist_ok=True)
+        fastf1.Cache.enable_cache(fastf1_cache_dir)
+        fastf1.Cache.offline_mode(offline)
+
+    session = fastf1.get_session(year, event, session_type)
+    session.load(laps=True, telemetry=True, weather=False, messages=False)
+
+    laps = session.laps
+    laps = laps[laps['Team'].isin(teams) & (laps['IsAccurate'] == True)] # accurate laps only, as KPI 2
+
+    traces = []
+    for driver in laps['Driver'].unique():
+        lap = laps[laps['Driver'] == driver].pick_fastest()
+        if lap is None or pd.isna(lap['LapTime']):
+            continue
+
+        car_data = lap.get_car_data().add_distance()
+        traces.append(pd.DataFrame({
+            'Team': lap['Team'],
+            'Driver': lap['Driver'],
+            'LapTime': lap['LapTime'].total_seconds(),
+            'Sector1Time': lap['Sector1Time'].total_seconds(),
+            'Sector2Time': lap['Sector2Time'].total_seconds(),
+            'Distance': car_data['Distance'].to_numpy(dtype='float64'),
+            'Time': car_data['Time'].dt.total_seconds().to_numpy(),
+        }))
+    return pd.concat(traces, ignore_index=True) if traces else pd.DataFrame()
+
+# -------------------------------------------------------------------------------------------------------- #
+
+# step 2 - every lap's mini-sector times, in one interpolation
+
+def get_mini_sector_times(telemetry: pd.DataFrame, n_mini_sectors: int = N_MINI_SECTORS) -> pd.DataFrame:
+    """
+    Split every lap of a session into n_mini_sectors equal-distance mini-sectors and time each one.
+
+    Arguments:
+    telemetry (pd.DataFrame): Output of load_driver_lap_telemetry - one lap per driver.
+    n_mini_sectors (int): Mini-sectors per lap. Default is N_MINI_SECTORS.
+
+    Returns:
+    pd.DataFrame: One row per driver and mini-sector - 'Team', 'Driver', 'LapTime', 'mini_sector' (1 to n_mini_sectors),
+    'sector' (the sector, by the driver's own sector times, that the mini-sector's midpoint falls in) and 'time_s' (float32).
+    """
+    telemetry = telemetry.sort_values(['Driver', 'Distance'], kind='stable')
+    trace = telemetry.groupby('Driver', sort=False).ngroup().to_numpy()
+    distance = telemetry['Distance'].to_numpy(dtype='float64')
+
+    # distance as a fraction of each lap's own length, so every lap shares the same boundaries
+    lap_length = np.maximum.reduceat(distance, np.flatnonzero(np.r_[True, trace[1:] != trace[:-1]]))
+    boundaries = np.linspace(0, 1, n_mini_sectors + 1)
+    elapsed = interpolate_traces(boundaries, distance / lap_length[trace], telemetry[['Time']].to_numpy(dtype='float64'), trace)[:, :, 0]
+    times = np.diff(elapsed, axis=1) # (drivers, n_mini_sectors)
+
+    laps = telemetry.drop_duplicates('Driver')
+    sector_ends = np.column_stack([laps['Sector1Time'], laps['Sector1Time'] + laps['Sector2Time']])
+    midpoints = (elapsed[:, :-1] + elapsed[:, 1:]) / 2
+    sectors = 1 + (midpoints[:, :, np.newaxis] >= sector_ends[:, np.newaxis, :]).sum(axis=2)
+
+    n_laps = len(laps)
+    return pd.DataFrame({
+        'Team': np.repeat(laps['Team'].to_numpy(), n_mini_sectors),
+        'Driver': np.repeat(laps['Driver'].to_numpy(), n_mini_sectors),
+        'LapTime': np.repeat(laps['LapTime'].to_numpy(), n_mini_sectors),
+        'mini_sector': np.tile(np.arange(1, n_mini_sectors + 1), n_laps),
+        'sector': sectors.ravel(),
+        'time_s': times.ravel().astype('float32'),
+    })
+
+
+def load_mini_sector_times(year: int, event: str, session_type: str,
+                           n_mini_sectors: int = N_MINI_SECTORS,
+                           load_telemetry = None) -> pd.DataFrame:
+    """
+    Session loader for src.ingest: load every driver's car data and time the mini-sectors.
+
+    Arguments:
+    year, event, session_type: The session, as in load_driver_lap_telemetry.
+    n_mini_sectors (int): Mini-sectors per lap. Default is N_MINI_SECTORS.
+    load_telemetry (callable): Loader taking (year, event, session_type) and returning car data in the shape of
+        load_driver_lap_telemetry. Default is load_driver_lap_telemetry.
+
+    Returns:
+    pd.DataFrame: get_mini_sector_times output with added 'Year' and 'Race' columns - empty if the session has no laps.
+    """
+    telemetry = (load_telemetry or load_driver_lap_telemetry)(year, event, session_type)
+    if telemetry.empty:
+        return pd.DataFrame()
+
+    mini_sectors = get_mini_sector_times(telemetry, n_mini_sectors)
+    mini_sectors.insert(0, 'Year', year)
+    mini_sectors.insert(1, 'Race', event)
+    return mini_sectors
+
+# -------------------------------------------------------------------------------------------------------- #
+
+# step 3 - batches of sessions, in parallel, stored on disk
+
+def get_store_dir(n_mini_sectors: int = N_MINI_SECTORS, store_dir: str = MINI_SECTOR_STORE_DIR) -> str:
+    """
+    Returns:
+    str: The store for one mini-sector count, e.g. cache/mini_sectors/25 - each count is stored separately.
+    """
+    return os.path.join(store_dir, str(n_mini_sectors))
+
+
+def time_mini_sectors(sessions: list[tuple[int, str, str]],
+                      n_mini_sectors: int = N_MINI_SECTORS,
+                      store_dir: str = MINI_SECTOR_STORE_DIR,
+                      load_telemetry = None,
+                      max_workers: int = None,
+                      refresh: bool = False) -> pd.DataFrame:
+    """
+    Time the mini-sectors of every session missing from the store across a process pool (src.ingest.ingest_sessions).
+
+    Arguments:
+    sessions (list[tuple[int, str, str]]): (year, event, session_type) for each session, e.g. (2019, 'Monaco Grand Prix', 'Q').
+    n_mini_sectors (int): Mini-sectors per lap. Default is N_MINI_SECTORS.
+    store_dir (str): The mini-sector store - one sub-directory per mini-sector count. Default is 'cache/mini_sectors'.
+    load_telemetry (callable): Car data loader, as in load_mini_sector_times - must be picklable. Default is load_driver_lap_telemetry.
+    max_workers (int): Number of worker processes - 1 processes sessions in this process. Default is one per CPU.
+    refresh (bool): If True, recompute sessions already in the store. Default is False.
+
+    Returns:
+    pd.DataFrame: The ingest_sessions report - one row per session, 'rows' being drivers x mini-sectors.
+    """
+    loader = partial(load_mini_sector_times, n_mini_sectors=n_mini_sectors, load_telemetry=load_telemetry)
+    return ingest_sessions(sessions, store_dir=get_store_dir(n_mini_sectors, store_dir), load_laps=loader,
+                           max_workers=max_workers, refresh=refresh, verbose=False)
+
+
+def read_mini_sector_times(n_mini_sectors: int = N_MINI_SECTORS,
+                           years: list[int] = None,
+                           session_type: str = 'Q',
+                           store_dir: str = MINI_SECTOR_STORE_DIR) -> pd.DataFrame:
+    """
+    Returns:
+    pd.DataFrame: Stored mini-sector times of every session of session_type (and of years, if given).
+    """
+    return read_session_store(get_store_dir(n_mini_sectors, store_dir), years=years, session_type=session_type)
+
+# -------------------------------------------------------------------------------------------------------- #
+
+# step 4 - the (session x driver x mini-sector) matrix and its reductions
+
+def get_mini_sector_matrix(mini_sectors: pd.DataFrame, team: str = TEAM) -> tuple[np.ndarray, pd.DataFrame, pd.Index, np.ndarray]:
+    """
+    Scatter long mini-sector times into a dense matrix.
+
+    Arguments:
+    mini_sectors (pd.DataFrame): Output of read_mini_sector_times - every session with the same mini-sector count.
+    team (str): Team whose drivers are flagged in the returned mask. Default is 'Williams'.
+
+    Returns:
+    tuple[np.ndarray, pd.DataFrame, pd.Index, np.ndarray]:
+    - (sessions, drivers, mini-sectors) float32 mini-sector times - NaN where a driver has no lap in a session
+    - the 'Year' and 'Race' of each session (first axis)
+    - the driver codes (second axis)
+    - (sessions, drivers) boolean mask of team's drivers in each session
+    """
+    session_codes = mini_sectors.groupby(['Year', 'Race'], sort=False).ngroup().to_numpy()
+    sessions = mini_sectors[['Year', 'Race']].drop_duplicates().reset_index(drop=True) # in ngroup order
+    driver_codes, drivers = pd.factorize(mini_sectors['Driver'], sort=True)
+    n_mini_sectors = mini_sectors['mini_sector'].max()
+
+    matrix = np.full((len(sessions), len(drivers), n_mini_sectors), np.nan, dtype='float32')
+    matrix[session_codes, driver_codes, mini_sectors['mini_sector'].to_numpy() - 1] = mini_sectors['time_s'].to_numpy()
+
+    is_team = np.zeros((len(sessions), len(drivers)), dtype=bool)
+    in_team = (mini_sectors['Team'] == team).to_numpy()
+    is_team[session_codes[in_team], driver_codes[in_team]] = True
+
+    return matrix, sessions, pd.Index(drivers, name='Driver'), is_team
+
+
+def get_mini_sector_deficits(matrix: np.ndarray, is_team: np.ndarray) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Fastest midfield time and the team's deficit to it, for every session and mini-sector.
+
+    Arguments:
+    matrix (np.ndarray): (sessions, drivers, mini-sectors) times, as returned by get_mini_sector_matrix.
+    is_team (np.ndarray): (sessions, drivers) mask of the team's drivers.
+
+    Returns:
+    tuple[np.ndarray, np.ndarray, np.ndarray]: (sessions, mini-sectors) arrays - the fastest time, the index of the
+    driver who set it (-1 if none did), and the team's best time minus the fastest (NaN if the team has no lap).
+    """
+    # fmin ignores NaN and returns NaN for an all-NaN slice, without nanmin's warning
+    fastest = np.fmin.reduce(matrix, axis=1)
+    fastest_driver = np.where(np.isnan(fastest), -1, np.nanargmin(np.where(np.isnan(matrix), np.inf, matrix), axis=1))
+    team_best = np.fmin.reduce(np.where(is_team[:, :, np.newaxis], matrix, np.float32(np.nan)), axis=1)
+    return fastest, fastest_driver, team_best - fastest
+
+
+def get_deficit_table(mini_sectors: pd.DataFrame, team: str = TEAM) -> pd.DataFrame:
+    """
+    Long table of the team's mini-sector deficits, labelled with KPI 2's sector and circuit types.
+
+    Arguments:
+    mini_sectors (pd.DataFrame): Output of read_mini_sector_times.
+    team (str): Team to compare. Default is 'Williams'.
+
+    Returns:
+    pd.DataFrame: One row per session and mini-sector - 'year', 'race', 'mini_sector', 'sector' (as timed on the
+    session's fastest lap), 'fastest_s', 'fastest_driver', 'fastest_team', 'deficit_s', 'pct_slower', 'sector_type'
+    and 'circuit_type'. Sessions where team has no lap are left out.
+    """
+    matrix, sessions, drivers, is_team = get_mini_sector_matrix(mini_sectors, team)
+    fastest, fastest_driver, deficit = get_mini_sector_deficits(matrix, is_team)
+    n_sessions, n_mini_sectors = fastest.shape
+
+    table = pd.DataFrame({
+        'year': np.repeat(sessions['Year'].to_numpy(), n_mini_sectors),
+        'race': np.repeat(sessions['Race'].to_numpy(), n_mini_sectors),
+        'mini_sector': np.tile(np.arange(1, n_mini_sectors + 1), n_sessions),
+        'fastest_s': fastest.ravel(),
+        'fastest_driver': np.append(drivers.to_numpy(), None)[fastest_driver.ravel()],
+        'deficit_s': deficit.ravel(),
+    })
+
+    # sector of each mini-sector on the session's fastest lap, and the team each fastest driver drove for
+    fastest_lap = mini_sectors.sort_values('LapTime', kind='stable').drop_duplicates(['Year', 'Race', 'mini_sector'])
+    teams = mini_sectors.drop_duplicates(['Year', 'Race', 'Driver'])
+    table = table.merge(fastest_lap[['Year', 'Race', 'mini_sector', 'sector']].rename(columns={'Year': 'year', 'Race': 'race'}),
+                        on=['year', 'race', 'mini_sector'], how='left')
+    table = table.merge(teams[['Year', 'Race', 'Driver', 'Team']].rename(columns={'Year': 'year', 'Race': 'race', 'Driver': 'fastest_driver', 'Team': 'fastest_team'}),
+                        on=['year', 'race', 'fastest_driver'], how='left')
+
+    table['pct_slower'] = table['deficit_s'] / table['fastest_s'] * 100
+    table['sector_type'] = [sector_type.get((race, sector)) for race, sector in zip(table['race'], table['sector'])]
+    table['circuit_type'] = table['race'].map(circuit_type)
+
+    table = table.dropna(subset=['deficit_s'])
+    return table[['year', 'race', 'mini_sector', 'sector', 'fastest_s', 'fastest_driver', 'fastest_team',
+                  'deficit_s', 'pct_slower', 'sector_type', 'circuit_type']].reset_index(drop=True)
+
+# -------------------------------------------------------------------------------------------------------- #
+
+# benchmark - the same mini-sector times with a loop per lap, as pandas code would do it
+
+def get_mini_sector_times_per_lap(telemetry: pd.DataFrame, n_mini_sectors: int = N_MINI_SECTORS) -> pd.DataFrame:
+    """
+    The mini-sector times of get_mini_sector_times, one lap at a time with np.interp - the approach it replaces.
+    """
+    rows = []
+    for driver, lap in telemetry.groupby('Driver'):
+        lap = lap.sort_values('Distance')
+        boundaries = np.linspace(0, lap['Distance'].max(), n_mini_sectors + 1)
+        elapsed = np.interp(boundaries, lap['Distance'], lap['Time'])
+        for mini_sector in range(n_mini_sectors):
+            rows.append({'Driver': driver, 'mini_sector': mini_sector + 1, 'time_s': elapsed[mini_sector + 1] - elapsed[mini_sector]})
+    return pd.DataFrame(rows)
+
+
+if __name__ == '__main__':
+    kpi2_sessions = [(year, race, 'Q') for year in [2018, 2019] for race in circuit_type.keys()]
+
+    start = time.perf_counter()
+    df_report = time_mini_sectors(kpi2_sessions)
+    print(df_report.drop(columns=['path', 'error']).to_string(index=False))
+    print(f"\n{len(kpi2_sessions)} sessions in {time.perf_counter() - start:.1f}s (stored sessions are skipped)\n")
+
+    mini_sectors = read_mini_sector_times()
+    matrix, sessions, drivers, is_team = get_mini_sector_matrix(mini_sectors)
+    print(f"Mini-sector matrix: {matrix.shape} (sessions x drivers x mini-sectors), {matrix.nbytes / 1024:.0f} KiB as float32\n")
+
+    df_deficits = get_deficit_table(mini_sectors)
+    print("Williams' deficit per mini-sector to the fastest midfield car, by sector type (s):\n")
+    print(df_deficits.groupby('sector_type')['deficit_s'].agg(['mean', 'median', 'std', 'size']).round(3))
+
+    print("\nThe five mini-sectors where Williams lost the most, per session:\n")
+    worst = df_deficits.sort_values('deficit_s', ascending=False).groupby(['year', 'race']).head(5)
+    print(worst.sort_values(['year', 'race', 'deficit_s'], ascending=[True, True, False]).round(3).to_string(index=False))
+
+    # against KPI 2's three sectors - the ideal midfield lap over mini-sectors is at least as fast as over sectors
+    df_sectors = pd.read_csv('processed_data/williams-deltas-by-sector-type.csv', index_col=0)
+    by_sector = df_deficits.groupby(['year', 'race', 'sector'])['deficit_s'].sum().rename('mini_sector_deficit').reset_index()
+    print("\nKPI 2 sector deltas vs the sum of mini-sector deficits (s):\n")
+    print(df_sectors.merge(by_sector, on=['year', 'race', 'sector'])[['year', 'race', 'sector', 'sector_delta', 'mini_sector_deficit']].round(3).to_string(index=False))
+
+    # one session's laps tiled as 400 laps - one interpolation vs a loop per lap
+    year, race, session_type = kpi2_sessions[0]
+    telemetry = load_driver_lap_telemetry(year, race, session_type)
+    tiled = pd.concat([telemetry.assign(Driver=telemetry['Driver'] + f'_{copy}') for copy in range(400 // telemetry['Driver'].nunique())], ignore_index=True)
+
+    start = time.perf_counter()
+    batched = get_mini_sector_times(tiled)
+    batched_ms = (time.perf_counter() - start) * 1000
+
+    start = time.perf_counter()
+    per_lap = get_mini_sector_times_per_lap(tiled)
+    per_lap_ms = (time.perf_counter() - start) * 1000
+
+    assert np.allclose(batched.sort_values(['Driver', 'mini_sector'])['time_s'], per_lap['time_s'], atol=1e-3)
+    print(f"\n{tiled['Driver'].nunique()} laps x {N_MINI_SECTORS} mini-sectors - loop per lap: {per_lap_ms:.0f} ms, "
+          f"one interpolation: {batched_ms:.1f} ms (same times)")
@@ -0,0 +1,227 @@
+import os
+import time
+import numpy as np
+import pandas as pd
+
+"""
+Overtaking Difficulty Index - grid vs finish rank correlation for every race, in one batch
+
+src/analysis1.py runs a single pearsonr on Williams' start position vs grid delta. A circuit where the finishing order
+mirrors the grid is one where passing is hard, and a grid delta of +2 there is worth more than +2 at a circuit where
+the order is shuffled every race. This module measures that per race, for every race in raw_data/results.csv.
+
+Steps:
+1. One row per starter: grid slot and positionOrder. Pit lane starts (grid 0) count as starting behind the whole grid.
+2. Spearman's rho for every race at once: average ranks within each race from one groupby, then the Pearson correlation
+    of those ranks from per-race sums (n, sum x, sum y, sum x^2, sum y^2, sum xy).
+3. Kendall's tau-b for every race at once: races are padded into one (races x max starters) array and every pair within
+    every race is compared in a single (races x starters x starters) sign computation.
+4. Average per circuit and season (a few circuits held two races in one season), cache as parquet, and refresh
+    only when raw_data/results.csv or races.csv changes.
+5. normalise_grid_deltas() scales KPI 1 grid deltas by how easy passing was in that race.
+
+Run from the project root: python -m src.overtaking
+"""
+
+OVERTAKING_CACHE_PATH = 'cache/overtaking-index.parquet'
+
+# floor on passing ease (1 - rho) when normalising, so near-processional races do not blow deltas up
+MIN_PASSING_EASE = 0.05
+
+# -------------------------------------------------------------------------------------------------------- #
+
+# step 1 - starters per race
+
+def get_race_starters(raw_dir: str = 'raw_data') -> pd.DataFrame:
+    """
+    Returns:
+    pd.DataFrame: One row per starter - 'race_id', 'circuit_id', 'year', 'grid' and 'finish' (positionOrder), sorted by race.
+    Grid 0 (pit lane start) is replaced by one place behind the last grid slot of that race.
+    """
+    from src.loader import load_table
+
+    results = load_table('results', raw_dir)[['raceId', 'grid', 'positionOrder']]
+    races = load_table('races', raw_dir)[['raceId', 'circuitId', 'year']]
+    df = results.merge(races, on='raceId')
+
+    starters = pd.DataFrame({
+        'race_id': df['raceId'].astype('int64'),
+        'circuit_id': df['circuitId'].astype('int64'),
+        'year': df['year'].astype('int64'),
+        'grid': df['grid'].astype('float64'),
+        'finish': df['positionOrder'].astype('float64'),
+    })
+    back_of_grid = starters.groupby('race_id')['grid'].transform('max') + 1
+    starters['grid'] = starters['grid'].where(starters['grid'] > 0, back_of_grid)
+
+    return starters.sort_values(['race_id', 'finish']).reset_index(drop=True)
+
+# -------------------------------------------------------------------------------------------------------- #
+
+# steps 2 & 3 - batched rank correlations
+
+def get_batched_spearman(starters: pd.DataFrame) -> pd.Series:
+    """
+    Spearman's rho between grid and finish for every race, from one groupby rank and per-race sums.
+
+    Returns:
+    pd.Series: rho indexed by race_id (NaN for races where grid or finish has no variation).
+    """
+    ranked = pd.DataFrame({
+        'race_id': starters['race_id'],
+        'x': starters.groupby('race_id')['grid'].rank(method='average'),
+        'y': starters.groupby('race_id')['finish'].rank(method='average'),
+    })
+    ranked['xx'] = ranked['x'] ** 2
+    ranked['yy'] = ranked['y'] ** 2
+    ranked['xy'] = ranked['x'] * ranked['y']
+
+    sums = ranked.groupby('race_id').agg(n=('x', 'size'), x=('x', 'sum'), y=('y', 'sum'),
+                                         xx=('xx', 'sum'), yy=('yy', 'sum'), xy=('xy', 'sum'))
+
+    covariance = sums['xy'] - sums['x'] * sums['y'] / sums['n']
+    variance_x = sums['xx'] - sums['x'] ** 2 / sums['n']
+    variance_y = sums['yy'] - sums['y'] ** 2 / sums['n']
+
+    denominator = np.sqrt(variance_x * variance_y)
+    return (covariance / denominator.where(denominator > 0)).rename('spearman')
+
+
+def get_batched_kendall(starters: pd.DataFrame) -> pd.Series:
+    """
+    Kendall's tau-b between grid and finish for every race, comparing every pair of starters in all races at once.
+
+    Returns:
+    pd.Series: tau-b indexed by race_id (NaN for races where grid or finish has no variation).
+    """
+    race_ids, race_index = np.unique(starters['race_id'].to_numpy(), return_inverse=True)
+    sizes = np.bincount(race_index)
+    position = np.arange(len(starters)) - np.repeat(np.cumsum(sizes) - sizes, sizes) # slot of each starter within its race
+
+    # pad every race to the largest field - padded slots are NaN and drop out of every comparison
+    grid = np.full((len(race_ids), sizes.max()), np.nan)
+    finish = np.full((len(race_ids), sizes.max()), np.nan)
+    grid[race_index, position] = starters['grid'].to_numpy()
+    finish[race_index, position] = starters['finish'].to_numpy()
+
+    grid_sign = np.sign(grid[:, :, np.newaxis] - grid[:, np.newaxis, :])
+    finish_sign = np.sign(finish[:, :, np.newaxis] - finish[:, np.newaxis, :])
+    is_pair = ~np.isnan(grid_sign) # both starters present - each unordered pair is counted twice below
+
+    concordant_minus_discordant = np.nansum(grid_sign * finish_sign, axis=(1, 2)) / 2
+    n_pairs = is_pair.sum(axis=(1, 2)) / 2 - sizes / 2 # drop the diagonal, which compares starters with themselves
+    grid_untied = n_pairs - ((grid_sign == 0) & is_pair).sum(axis=(1, 2)) / 2 + sizes / 2
+    finish_untied = n_pairs - ((finish_sign == 0) & is_pair).sum(axis=(1, 2)) / 2 + sizes / 2
+
+    denominator = np.sqrt(grid_untied * finish_untied)
+    tau = np.divide(concordant_minus_discordant, denominator, out=np.full(len(race_ids), np.nan), where=denominator > 0)
+    return pd.Series(tau, index=pd.Index(race_ids, name='race_id'), name='kendall')
+
+
+def get_race_correlations(starters: pd.DataFrame) -> pd.DataFrame:
+    """
+    Returns:
+    pd.DataFrame: One row per race - 'race_id', 'circuit_id', 'year', 'starters', 'spearman' and 'kendall'.
+    """
+    races = starters.groupby('race_id').agg(circuit_id=('circuit_id', 'first'), year=('year', 'first'), starters=('grid', 'size'))
+    return races.join(get_batched_spearman(starters)).join(get_batched_kendall(starters)).reset_index()
+
+# -------------------------------------------------------------------------------------------------------- #
+
+# step 4 - per circuit and season, cached
+
+def get_overtaking_index(raw_dir: str = 'raw_data', cache_path: str = OVERTAKING_CACHE_PATH, refresh: bool = False) -> pd.DataFrame:
+    """
+    Overtaking difficulty per circuit and season - the mean grid/finish rank correlation of its races.
+    Higher means the finishing order followed the grid more closely, i.e. passing was harder.
+
+    Arguments:
+    raw_dir (str): Directory of the Ergast tables. Default is 'raw_data'.
+    cache_path (str): Parquet cache of the index. Default is 'cache/overtaking-index.parquet'.
+    refresh (bool): If True, recompute even if the cache is up to date. Default is False.
+
+    Returns:
+    pd.DataFrame: 'circuit_id', 'year', 'races', 'starters', 'spearman', 'kendall' and 'passing_ease' (1 - spearman).
+    """
+    sources = [os.path.join(raw_dir, f'{table}.csv') for table in ['results', 'races']]
+    if not refresh and os.path.exists(cache_path) and all(os.path.getmtime(cache_path) >= os.path.getmtime(source) for source in sources):
+        return pd.read_parquet(cache_path)
+
+    index = get_race_correlations(get_race_starters(raw_dir)).groupby(['circuit_id', 'year']).agg(
+        races=('race_id', 'size'),
+        starters=('starters', 'sum'),
+        spearman=('spearman', 'mean'),
+        kendall=('kendall', 'mean'),
+    ).reset_index()
+    index['passing_ease'] = 1 - index['spearman']
+
+    os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+    index.to_parquet(cache_path + '.tmp', index=False)
+    os.replace(cache_path + '.tmp', cache_path)
+
+    return index
+
+# -------------------------------------------------------------------------------------------------------- #
+
+# step 5 - KPI 1 deltas relative to how hard passing was
+
+def normalise_grid_deltas(df: pd.DataFrame, index: pd.DataFrame, raw_dir: str = 'raw_data') -> pd.DataFrame:
+    """
+    Add the overtaking index to KPI 1 grid-to-finish rows, and a grid delta scaled by passing ease.
+
+    normalised_grid_delta = grid_delta * (median passing ease) / (passing ease of that circuit and season),
+    so a place gained where passing is twice as hard as usual counts as two.
+
+    Arguments:
+    df (pd.DataFrame): Grid-to-finish rows with 'race_id' and 'grid_delta', e.g. grid-to-finish-validated.csv.
+    index (pd.DataFrame): Output of get_overtaking_index.
+    raw_dir (str): Directory of the Ergast tables, to map races to circuits. Default is 'raw_data'.
+
+    Returns:
+    pd.DataFrame: A copy of df with added 'spearman', 'passing_ease' and 'normalised_grid_delta' columns.
+    """
+    from src.loader import load_table
+
+    races = load_table('races', raw_dir)[['raceId', 'circuitId']].astype('int64').rename(columns={'raceId': 'race_id', 'circuitId': 'circuit_id'})
+    df = df.merge(races, on='race_id', how='left').merge(
+        index[['circuit_id', 'year', 'spearman', 'passing_ease']].rename(columns={'year': 'gp_year'}),
+        on=['circuit_id', 'gp_year'], how='left'
+    ).drop(columns='circuit_id')
+
+    passing_ease = df['passing_ease'].clip(lower=MIN_PASSING_EASE)
+    df['normalised_grid_delta'] = df['grid_delta'] * index['passing_ease'].median() / passing_ease
+    return df
+
+
+if __name__ == '__main__':
+    from scipy.stats import kendalltau, spearmanr
+
+    starters = get_race_starters()
+
+    start = time.perf_counter()
+    correlations = get_race_correlations(starters)
+    batched_ms = (time.perf_counter() - start) * 1000
+
+    # the same correlations with one scipy call per race
+    start = time.perf_counter()
+    per_race = []
+    for race_id, race in starters.groupby('race_id'):
+        per_race.append({'race_id': race_id,
+                         'spearman': spearmanr(race['grid'], race['finish']).statistic,
+                         'kendall': kendalltau(race['grid'], race['finish']).statistic})
+    scipy_ms = (time.perf_counter() - start) * 1000
+    per_race = pd.DataFrame(per_race)
+
+    assert np.allclose(correlations['spearman'], per_race['spearman'], equal_nan=True)
+    assert np.allclose(correlations['kendall'], per_race['kendall'], equal_nan=True)
+    print(f"{len(correlations)} races: batched {batched_ms:.0f} ms vs scipy per race {scipy_ms:.0f} ms (same values).\n")
+
+    index = get_overtaking_index(refresh=True)
+    circuits = pd.read_csv('raw_data/circuits.csv')[['circuitId', 'circuitRef']].rename(columns={'circuitId': 'circuit_id'})
+    recent = index[index['year'].between(2015, 2019)].merge(circuits, on='circuit_id')
+    print("Hardest circuits to pass at, 2015-2019 (mean Spearman rho of grid vs finish):\n")
+    print(recent.groupby('circuitRef')[['spearman', 'kendall']].mean().sort_values('spearman', ascending=False).head(10).round(3))
+
+    df_grid = normalise_grid_deltas(pd.read_csv('processed_data/grid-to-finish-validated.csv'), index)
+    print("\nWilliams grid deltas by circuit, raw and normalised by passing ease, 2015-2019:\n")
+    print(df_grid[df_grid['is_williams']].groupby('gp_name')[['grid_delta', 'passing_ease', 'normalised_grid_delta']].mean().round(3))
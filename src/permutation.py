@@ -0,0 +1,264 @@
+import time
+from itertools import combinations
+from math import comb
+import numpy as np
+import pandas as pd
+
+"""
+Batched Permutation Tests - every circuit x season x constructor cell at once, with Benjamini-Hochberg correction
+
+Each hypothesis test in the analysis scripts is written by hand for one slice, e.g. williams_deltas vs rival_deltas
+at technical circuits (src/analysis1.py). This runner takes a grouping spec over any KPI table and tests every cell
+in one batch, so hundreds of circuit / season slices can be screened in seconds.
+
+Steps:
+1. Split the table into cells (the 'by' columns), and within each cell into group a and group b (e.g. Williams vs the rest).
+    With group_a=None every level of the group column is tested against the rest of its cell.
+2. Cells small enough to enumerate every relabelling are tested exactly - cells of the same size and group a size in
+    one array, sharing one matrix of relabellings; the rest share one Monte Carlo batch -
+    each permutation shuffles labels within every cell at once, by argsorting random keys offset by cell number.
+3. The statistic is the difference in group means - per cell sums come from one np.add.reduceat per batch.
+4. p-values across all cells are adjusted with Benjamini-Hochberg, and everything is returned as a single table.
+
+Run from the project root: python -m src.permutation
+"""
+
+# permutation matrix elements per Monte Carlo batch - bounds memory at roughly 64 MB per array
+BATCH_ELEMENTS = 1 << 23
+
+ALTERNATIVES = ['two-sided', 'less', 'greater']
+
+# -------------------------------------------------------------------------------------------------------- #
+
+# step 1 - cells and groups
+
+def get_cells(df: pd.DataFrame, value: str, group: str, by: list[str], group_a=None) -> pd.DataFrame:
+    """
+    Label each row with its cell and group.
+
+    Arguments:
+    df (pd.DataFrame): A KPI table, e.g. delta-all-circuits.csv.
+    value (str): The column compared between groups, e.g. 'grid_delta'.
+    group (str): The column defining the groups, e.g. 'is_williams' or 'constructor_ref'.
+    by (list[str]): The columns defining the cells, e.g. ['gp_name', 'gp_year'].
+    group_a: Rows with df[group] == group_a form group a, the rest group b. None tests each level of group against the rest,
+        adding group to the cell columns.
+
+    Returns:
+    pd.DataFrame: The by columns (plus group if group_a is None), 'value' and 'is_a', sorted by cell, with a 'cell' number.
+    """
+    df = df[df[value].notna()]
+
+    if group_a is not None:
+        cells = df[by].assign(value=df[value].astype('float64'), is_a=(df[group] == group_a).to_numpy())
+        keys = by
+    else:
+        # one copy of each cell per level of group present in it - that level is group a, the rest group b
+        pieces = []
+        for level in df[group].dropna().unique():
+            piece = df.merge(df.loc[df[group] == level, by].drop_duplicates(), on=by)
+            pieces.append(piece[by].assign(**{group: level}, value=piece[value].astype('float64'), is_a=(piece[group] == level).to_numpy()))
+        cells = pd.concat(pieces, ignore_index=True)
+        keys = by + [group]
+
+    cells = cells.sort_values(keys, kind='stable').reset_index(drop=True)
+    cells['cell'] = cells.groupby(keys, sort=False, observed=True).ngroup()
+    return cells
+
+# -------------------------------------------------------------------------------------------------------- #
+
+# steps 2 & 3 - permutation distributions of the difference in means
+
+def _mean_differences(values: np.ndarray, is_a: np.ndarray, starts: np.ndarray, n_a: np.ndarray, n_b: np.ndarray) -> np.ndarray:
+    """
+    Difference in group means for every cell, for a (permutations x rows) label matrix or a single label row.
+    """
+    sum_a = np.add.reduceat(values * is_a, starts, axis=-1)
+    total = np.add.reduceat(np.broadcast_to(values, is_a.shape), starts, axis=-1)
+    return sum_a / n_a - (total - sum_a) / n_b
+
+
+def _count_extreme(null: np.ndarray, observed: np.ndarray, alternative: str) -> np.ndarray:
+    # small tolerance so permutations equal to the observed statistic always count, despite float rounding
+    tolerance = 1e-9 * np.maximum(1, np.abs(observed))
+    if alternative == 'less':
+        return (null <= observed + tolerance).sum(axis=0)
+    if alternative == 'greater':
+        return (null >= observed - tolerance).sum(axis=0)
+    return (np.abs(null) >= np.abs(observed) - tolerance).sum(axis=0)
+
+
+def _monte_carlo_p_values(cells: pd.DataFrame, alternative: str, n_permutations: int, rng: np.random.Generator) -> np.ndarray:
+    """
+    Monte Carlo p-values for every cell in cells, shuffling labels within all cells in the same batch.
+    """
+    values = cells['value'].to_numpy()
+    is_a = cells['is_a'].to_numpy()
+    cell = cells['cell'].to_numpy()
+    starts = np.flatnonzero(np.r_[True, cell[1:] != cell[:-1]])
+    n_a = np.add.reduceat(is_a.astype(int), starts)
+    n_b = np.diff(np.r_[starts, len(cell)]) - n_a
+
+    observed = _mean_differences(values, is_a, starts, n_a, n_b)
+    offsets = np.arange(len(starts)).repeat(np.diff(np.r_[starts, len(cell)])) # cell number, from 0, for every row
+
+    extreme = np.zeros(len(starts), dtype=np.int64)
+    batch_size = max(1, BATCH_ELEMENTS // len(values))
+    for start in range(0, n_permutations, batch_size):
+        size = min(batch_size, n_permutations - start)
+        # random keys in [0, 1) plus the cell number - sorting shuffles rows within each cell, never across cells
+        order = np.argsort(rng.random((size, len(values))) + offsets, axis=1)
+        extreme += _count_extreme(_mean_differences(values, is_a[order], starts, n_a, n_b), observed, alternative)
+
+    return (extreme + 1) / (n_permutations + 1)
+
+
+def _exact_p_values(cells: pd.DataFrame, alternative: str) -> np.ndarray:
+    """
+    Exact p-values for every cell in cells, over every way of choosing group a's rows. Cells with the same number of rows
+    and of group a rows share one matrix of choices, and are stacked into one (cells x rows) array and tested together.
+    """
+    values = cells['value'].to_numpy()
+    is_a = cells['is_a'].to_numpy()
+    cell = cells['cell'].to_numpy()
+    starts = np.flatnonzero(np.r_[True, cell[1:] != cell[:-1]])
+    sizes = np.diff(np.r_[starts, len(cell)])
+    n_a = np.add.reduceat(is_a.astype(int), starts)
+
+    p_values = np.empty(len(starts))
+    for size, k in np.unique(np.stack([sizes, n_a], axis=1), axis=0):
+        members = np.flatnonzero((sizes == size) & (n_a == k))
+        rows = starts[members, np.newaxis] + np.arange(size) # (cells, size) row numbers - rows are sorted by cell
+        cell_values = values[rows]
+        totals = cell_values.sum(axis=1)
+        observed_a = (cell_values * is_a[rows]).sum(axis=1)
+        observed = observed_a / k - (totals - observed_a) / (size - k)
+
+        chosen = np.array(list(combinations(range(size), k)), dtype=np.int64).reshape(-1, k)
+        batch_size = max(1, BATCH_ELEMENTS // chosen.size)
+        for start in range(0, len(members), batch_size):
+            batch = slice(start, start + batch_size)
+            sum_a = cell_values[batch][:, chosen].sum(axis=2) # (cells, choices)
+            null = sum_a / k - (totals[batch, np.newaxis] - sum_a) / (size - k)
+            p_values[members[batch]] = _count_extreme(null.T, observed[batch], alternative) / len(chosen)
+
+    return p_values
+
+# -------------------------------------------------------------------------------------------------------- #
+
+# step 4 - multiple testing correction and the runner
+
+def benjamini_hochberg(p_values) -> np.ndarray:
+    """
+    Benjamini-Hochberg adjusted p-values (q-values), controlling the false discovery rate across all tests.
+    NaN p-values are left as NaN and not counted as tests.
+    """
+    p_values = np.asarray(p_values, dtype='float64')
+    q_values = np.full(len(p_values), np.nan)
+
+    tested = np.flatnonzero(~np.isnan(p_values))
+    order = tested[np.argsort(p_values[tested], kind='stable')]
+    ranked = p_values[order] * len(order) / np.arange(1, len(order) + 1)
+    q_values[order] = np.minimum(np.minimum.accumulate(ranked[::-1])[::-1], 1)
+
+    return q_values
+
+
+def permutation_tests(df: pd.DataFrame,
+                      value: str,
+                      group: str,
+                      by: list[str],
+                      group_a=None,
+                      alternative: str = 'two-sided',
+                      n_permutations: int = 10_000,
+                      min_group_size: int = 1,
+                      fdr: float = 0.05,
+                      seed: int = 0) -> pd.DataFrame:
+    """
+    Permutation test of the difference in mean value between group a and group b, in every cell of by.
+
+    Arguments:
+    df (pd.DataFrame): A KPI table, e.g. delta-all-circuits.csv.
+    value (str): The column compared, e.g. 'grid_delta'.
+    group (str): The column defining the groups, e.g. 'is_williams'.
+    by (list[str]): The cell columns, e.g. ['gp_name', 'gp_year'].
+    group_a: The group column value of group a, e.g. True. None tests each level of group against the rest of its cell.
+    alternative (str): 'two-sided', 'less' (mean a < mean b) or 'greater'. Default is 'two-sided'.
+    n_permutations (int): Monte Carlo permutations per cell. Cells with at most this many distinct relabellings are tested exactly. Default is 10,000.
+    min_group_size (int): Cells where either group has fewer rows are not tested. Default is 1.
+    fdr (float): False discovery rate for the 'significant' column. Default is 0.05.
+    seed (int): Seed for the Monte Carlo permutations. Default is 0.
+
+    Returns:
+    pd.DataFrame: One row per cell - the cell columns, 'n_a', 'n_b', 'mean_a', 'mean_b', 'difference', 'method' ('exact' or 'monte carlo'),
+    'p_value', 'q_value' (Benjamini-Hochberg) and 'significant' (q_value < fdr). Untested cells have NaN p and q values.
+    """
+    if alternative not in ALTERNATIVES:
+        raise ValueError(f"alternative must be one of {ALTERNATIVES}, not '{alternative}'")
+
+    cells = get_cells(df, value, group, by, group_a)
+    keys = by if group_a is not None else by + [group]
+
+    summary = cells.groupby('cell', observed=True).agg(
+        **{key: (key, 'first') for key in keys},
+        n_a=('is_a', 'sum'),
+        n=('is_a', 'size'),
+    )
+    summary['n_b'] = summary['n'] - summary['n_a']
+    summary['mean_a'] = cells[cells['is_a']].groupby('cell')['value'].mean()
+    summary['mean_b'] = cells[~cells['is_a']].groupby('cell')['value'].mean()
+    summary['difference'] = summary['mean_a'] - summary['mean_b']
+
+    testable = (summary['n_a'] >= min_group_size) & (summary['n_b'] >= min_group_size)
+    n_relabellings = [comb(int(n), int(n_a)) for n, n_a in zip(summary['n'], summary['n_a'])]
+    summary['method'] = np.where(~testable, None, np.where(np.array(n_relabellings) <= n_permutations, 'exact', 'monte carlo'))
+    summary['p_value'] = np.nan
+
+    # 2. ---------- exact cells, batched by cell shape ----------
+    exact = summary.index[summary['method'] == 'exact']
+    if len(exact):
+        rows = cells[cells['cell'].isin(exact)]
+        summary.loc[exact, 'p_value'] = _exact_p_values(rows, alternative)
+
+    # 2 & 3. ---------- every other cell in one Monte Carlo batch ----------
+    monte_carlo = summary.index[summary['method'] == 'monte carlo']
+    if len(monte_carlo):
+        rows = cells[cells['cell'].isin(monte_carlo)]
+        summary.loc[monte_carlo, 'p_value'] = _monte_carlo_p_values(rows, alternative, n_permutations, np.random.default_rng(seed))
+
+    # 4. ---------- correct for the number of cells tested ----------
+    summary['q_value'] = benjamini_hochberg(summary['p_value'])
+    summary['significant'] = summary['q_value'] < fdr
+
+    return summary.reset_index(drop=True)[keys + ['n_a', 'n_b', 'mean_a', 'mean_b', 'difference', 'method',
+                                                  'p_value', 'q_value', 'significant']]
+
+
+if __name__ == '__main__':
+    df = pd.read_csv('processed_data/delta-all-circuits.csv', index_col=0)
+
+    # williams vs midfield rivals at every circuit in every season - did williams lose more places? (as src/analysis1.py)
+    start = time.perf_counter()
+    df_williams = permutation_tests(df, 'grid_delta', 'is_williams', by=['gp_name', 'gp_year'], group_a=True, alternative='less')
+    williams_s = time.perf_counter() - start
+
+    print(f"Williams vs rivals, {len(df_williams)} circuit x season cells in {williams_s:.2f}s.\n")
+    print(df_williams.sort_values('p_value').head(10).round(4).to_string(index=False))
+
+    # pooling seasons makes the cells too large to enumerate - these share one Monte Carlo batch
+    start = time.perf_counter()
+    df_circuits = permutation_tests(df, 'grid_delta', 'is_williams', by=['gp_name'], group_a=True, alternative='less')
+    circuits_s = time.perf_counter() - start
+
+    print(f"\n\nWilliams vs rivals, {len(df_circuits)} circuits (2015-2019 pooled) in {circuits_s:.2f}s.\n")
+    print(df_circuits.round(4).to_string(index=False))
+
+    # each constructor vs the rest of the midfield, in every circuit x season cell
+    start = time.perf_counter()
+    df_constructors = permutation_tests(df, 'grid_delta', 'constructor_ref', by=['gp_name', 'gp_year'])
+    constructors_s = time.perf_counter() - start
+
+    print(f"\n\nEach constructor vs the rest, {len(df_constructors)} circuit x season x constructor cells in {constructors_s:.2f}s "
+          f"({(df_constructors['method'] == 'exact').sum()} exact, {(df_constructors['method'] == 'monte carlo').sum()} Monte Carlo).\n")
+    print(df_constructors.sort_values('p_value').head(10).round(4).to_string(index=False))
+    print(f"\nSignificant at 5% FDR: {df_constructors['significant'].sum()} of {df_constructors['p_value'].notna().sum()} tested cells.")
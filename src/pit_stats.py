@@ -0,0 +1,289 @@
+import time
+import numpy as np
+import pandas as pd
+
+"""
+Pit Stop Statistics - grouped median, MAD, IQR and trimmed means with sort-based vectorised kernels
+
+get_pit_stats in archived/archived-pitstops.py computed median, mean, MAD and std per constructor with groupby().agg
+and Python lambdas, so every group ran interpreted code (MAD needed two nested np.median calls per group).
+That is fine for 5 constructors over 667 stops, but not for every team, season and circuit in raw_data/pit_stops.csv.
+
+Steps:
+1. One table of every pit stop: raw_data/pit_stops.csv joined to its season, Grand Prix, circuit and constructor.
+2. Number the groups of any grouping (constructor, season, circuit, stop number, or several at once) with one groupby,
+    and sort every value by (group, value) with a single lexsort.
+3. Read order statistics straight from the sorted array - a group's q-quantile sits at start + q * (n - 1):
+    - median and IQR (25th to 75th percentile), with numpy's linear interpolation
+    - MAD: absolute deviations from each group's median, sorted once more, and their median
+    - trimmed mean: ranks within each group from the sort, keeping ranks cut to n - cut (cut = floor(trim * n) per side)
+    - mean, std and counts from np.bincount
+4. get_pit_stats() keeps the archived filters and output (seconds, rounded to ms), and benchmark_against_best()
+    compares every group with the fastest (median) and most consistent (MAD) one, as in the archive.
+
+Run from the project root: python -m src.pit_stats (stats for every grouping, checked and timed against the lambda version)
+"""
+
+# share of each group's stops cut from each end for the trimmed mean
+TRIM_PROPORTION = 0.1
+
+# -------------------------------------------------------------------------------------------------------- #
+
+# step 1 - every pit stop, with season, circuit and constructor
+
+def get_pit_stops(raw_dir: str = 'raw_data') -> pd.DataFrame:
+    """
+    Returns:
+    pd.DataFrame: One row per pit stop in raw_data/pit_stops.csv - 'race_id', 'gp_year', 'gp_name', 'circuit_ref',
+    'driver_id', 'constructor_ref', 'stop_number', 'lap_number' and 'pit_duration_ms'.
+    """
+    from src.loader import load_table
+
+    stops = load_table('pit_stops', raw_dir)[['raceId', 'driverId', 'stop', 'lap', 'milliseconds']]
+    races = load_table('races', raw_dir)[['raceId', 'year', 'name', 'circuitId']]
+    circuits = load_table('circuits', raw_dir)[['circuitId', 'circuitRef']]
+    constructors = load_table('constructors', raw_dir)[['constructorId', 'constructorRef']]
+    entries = load_table('results', raw_dir)[['raceId', 'driverId', 'constructorId']].drop_duplicates(['raceId', 'driverId'])
+
+    df = (stops.merge(races, on='raceId').merge(circuits, on='circuitId')
+          .merge(entries, on=['raceId', 'driverId'], how='left').merge(constructors, on='constructorId', how='left'))
+
+    return pd.DataFrame({
+        'race_id': df['raceId'].astype('int64'),
+        'gp_year': df['year'].astype('int64'),
+        'gp_name': df['name'].astype(str),
+        'circuit_ref': df['circuitRef'].astype(str),
+        'driver_id': df['driverId'].astype('int64'),
+        'constructor_ref': df['constructorRef'].astype(str),
+        'stop_number': df['stop'].astype('int64'),
+        'lap_number': df['lap'].astype('int64'),
+        'pit_duration_ms': df['milliseconds'].astype('float64'),
+    }).sort_values(['race_id', 'driver_id', 'stop_number']).reset_index(drop=True)
+
+# -------------------------------------------------------------------------------------------------------- #
+
+# steps 2 & 3 - sort-based grouped kernels
+
+def sort_groups(codes: np.ndarray, values: np.ndarray, n_groups: int) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Sort values by (group, value) in one pass.
+
+    Arguments:
+    codes (np.ndarray): Group number of every value, 0 to n_groups - 1.
+    values (np.ndarray): Values to sort - no NaNs.
+    n_groups (int): Number of groups.
+
+    Returns:
+    tuple[np.ndarray, np.ndarray, np.ndarray]: The sorted values, and the start and size of each group within them.
+    """
+    sorted_values = values[np.lexsort((values, codes))]
+    sizes = np.bincount(codes, minlength=n_groups)
+    return sorted_values, np.cumsum(sizes) - sizes, sizes
+
+
+def group_quantile(sorted_values: np.ndarray, starts: np.ndarray, sizes: np.ndarray, q: float) -> np.ndarray:
+    """
+    q-quantile of every group from sort_groups output, with linear interpolation (numpy's default method).
+    Empty groups give NaN.
+    """
+    position = (sizes - 1).clip(min=0) * q
+    below = np.floor(position).astype('int64')
+    above = np.minimum(below + 1, (sizes - 1).clip(min=0))
+    low = sorted_values[np.minimum(starts + below, len(sorted_values) - 1)]
+    high = sorted_values[np.minimum(starts + above, len(sorted_values) - 1)]
+    return np.where(sizes > 0, low + (position - below) * (high - low), np.nan)
+
+
+def group_trimmed_mean(sorted_values: np.ndarray, starts: np.ndarray, sizes: np.ndarray, trim: float = TRIM_PROPORTION) -> np.ndarray:
+    """
+    Mean of every group without its floor(trim * n) lowest and highest values, as scipy.stats.trim_mean.
+    """
+    codes = np.repeat(np.arange(len(sizes)), sizes)
+    rank = np.arange(len(sorted_values)) - starts[codes]
+    cut = np.floor(trim * sizes).astype('int64')
+    kept = (rank >= cut[codes]) & (rank < (sizes - cut)[codes])
+
+    totals = np.bincount(codes[kept], weights=sorted_values[kept], minlength=len(sizes))
+    counts = np.bincount(codes[kept], minlength=len(sizes))
+    return np.divide(totals, counts, out=np.full(len(sizes), np.nan), where=counts > 0)
+
+
+def get_grouped_stats(df: pd.DataFrame, by: str | list[str], value: str = 'pit_duration_ms', trim: float = TRIM_PROPORTION) -> pd.DataFrame:
+    """
+    Median, mean, trimmed mean, MAD, IQR, std and count of value for every group of by, without a per-group Python call.
+
+    Arguments:
+    df (pd.DataFrame): Data with the grouping columns and value, e.g. get_pit_stops() output.
+    by (str | list[str]): Grouping column(s), e.g. 'constructor_ref' or ['gp_year', 'circuit_ref', 'stop_number'].
+    value (str): Column to summarise. Default is 'pit_duration_ms'.
+    trim (float): Share cut from each end of a group for the trimmed mean. Default is TRIM_PROPORTION.
+
+    Returns:
+    pd.DataFrame: One row per group, indexed by by - 'median', 'mean', 'trimmed_mean', 'mad', 'iqr', 'std' (ddof 1) and 'n',
+    in the units of value.
+    """
+    by = [by] if isinstance(by, str) else list(by)
+    df = df.dropna(subset=by + [value]) # groupby drops null keys - ngroup() would number their rows NaN
+
+    grouped = df.groupby(by, sort=True, observed=True)
+    codes = grouped.ngroup().to_numpy()
+    n_groups = grouped.ngroups
+    values = df[value].to_numpy(dtype='float64')
+
+    sorted_values, starts, sizes = sort_groups(codes, values, n_groups)
+    median = group_quantile(sorted_values, starts, sizes, 0.5)
+
+    # MAD - deviations from each group's own median, sorted once more
+    mad = group_quantile(*sort_groups(codes, np.abs(values - median[codes]), n_groups), 0.5)
+
+    mean = np.bincount(codes, weights=values, minlength=n_groups) / sizes
+    squares = np.bincount(codes, weights=(values - mean[codes]) ** 2, minlength=n_groups)
+    std = np.sqrt(np.divide(squares, sizes - 1, out=np.full(n_groups, np.nan), where=sizes > 1))
+
+    return pd.DataFrame({
+        'median': median,
+        'mean': mean,
+        'trimmed_mean': group_trimmed_mean(sorted_values, starts, sizes, trim),
+        'mad': mad,
+        'iqr': group_quantile(sorted_values, starts, sizes, 0.75) - group_quantile(sorted_values, starts, sizes, 0.25),
+        'std': std,
+        'n': sizes,
+    }, index=grouped.size().index)
+
+# -------------------------------------------------------------------------------------------------------- #
+
+# step 4 - the archived interface
+
+def get_pit_stats(df: pd.DataFrame,
+                  by: str | list[str] = 'constructor_ref',
+                  gp_year: int | list[int] = None,
+                  gp_name: str | list[str] = None,
+                  long_stop_flag: bool = None,
+                  chaotic_race_flag: bool = None,
+                  trim: float = TRIM_PROPORTION,
+                  verbose: bool = False) -> pd.DataFrame:
+    """
+    Pit stop statistics per group, in seconds - the archived get_pit_stats on the vectorised kernels.
+
+    Arguments:
+    df (pd.DataFrame): Pit stops with 'pit_duration_ms', e.g. get_pit_stops() or constructor-pit-stops-validated.csv.
+    by (str | list[str]): Grouping column(s). Default is 'constructor_ref'.
+    gp_year (int | list[int]): Season(s) to keep (optional).
+    gp_name (str | list[str]): Grand Prix name(s) to keep (optional).
+    long_stop_flag (bool): Keep only long stops (True) or only other stops (False) - validated data only (optional).
+    chaotic_race_flag (bool): Keep only chaotic races (True) or only clean ones (False) - validated data only (optional).
+    trim (float): Share cut from each end of a group for the trimmed mean. Default is TRIM_PROPORTION.
+    verbose (bool): If True, print the filters applied. Default is False.
+
+    Returns:
+    pd.DataFrame: 'median_s', 'mean_s', 'trimmed_mean_s', 'mad_s', 'iqr_s', 'std_s' and 'n_pitstops' per group,
+    ordered by median, MAD and count as in the archive.
+    """
+    # 1. ---------- filter the data if parameters are provided ----------
+    filters = {'gp_year': gp_year, 'gp_name': gp_name, 'long_stop_flag': long_stop_flag, 'chaotic_race_flag': chaotic_race_flag}
+    for column, keep in filters.items():
+        if keep is not None:
+            df = df[df[column].isin([keep] if isinstance(keep, (int, str, bool)) else keep)]
+            if verbose:
+                print(f"Filtering data for {column}: {keep}")
+
+    # 2. ---------- grouped statistics, in seconds ----------
+    stats = get_grouped_stats(df, by, 'pit_duration_ms', trim)
+    pit_stats = (stats.drop(columns='n') / 1000).round(3).add_suffix('_s')
+    pit_stats['n_pitstops'] = stats['n']
+
+    return pit_stats.sort_values(by=['median_s', 'mad_s', 'n_pitstops'])
+
+
+def benchmark_against_best(pit_stats: pd.DataFrame, verbose: bool = False) -> pd.DataFrame:
+    """
+    Compare every group with the fastest (lowest median) and most consistent (lowest MAD) group.
+
+    Arguments:
+    pit_stats (pd.DataFrame): Output of get_pit_stats.
+    verbose (bool): If True, print the fastest and most consistent groups. Default is False.
+
+    Returns:
+    pd.DataFrame: 'median_s', 'slower_by_s', 'percent_slower', 'mad_s', 'percent_less_consistent' and 'n_pitstops'
+    per group, fastest first.
+    """
+    fastest = pit_stats['median_s'].min()
+    most_consistent = pit_stats['mad_s'].min()
+
+    benchmark_stats = pit_stats[['median_s', 'mad_s', 'n_pitstops']].copy()
+    benchmark_stats['slower_by_s'] = (benchmark_stats['median_s'] - fastest).round(3)
+    benchmark_stats['percent_slower'] = (((benchmark_stats['median_s'] - fastest) / fastest) * 100).round(2)
+    benchmark_stats['percent_less_consistent'] = (((benchmark_stats['mad_s'] - most_consistent) / most_consistent) * 100).round(2)
+
+    if verbose:
+        print(f"Fastest (median): {pit_stats['median_s'].idxmin()}")
+        print(f"Most consistent (MAD): {pit_stats['mad_s'].idxmin()}")
+
+    benchmark_stats = benchmark_stats[['median_s', 'slower_by_s', 'percent_slower', 'mad_s', 'percent_less_consistent', 'n_pitstops']]
+    return benchmark_stats.sort_values(by=['percent_slower', 'percent_less_consistent'])
+
+# -------------------------------------------------------------------------------------------------------- #
+
+# benchmark - groupby().agg with lambdas, as archived, vs the sort-based kernels
+
+def get_pit_stats_lambda(df: pd.DataFrame, by: str | list[str] = 'constructor_ref', trim: float = TRIM_PROPORTION) -> pd.DataFrame:
+    """
+    The archived aggregation, extended with IQR and the trimmed mean - one Python call per group and statistic.
+    """
+    from scipy.stats import trim_mean
+
+    pit_stats = df.groupby(by, observed=True).agg(
+        median_s=('pit_duration_ms', lambda x: round(x.median() / 1000, 3)),
+        mean_s=('pit_duration_ms', lambda x: round(x.mean() / 1000, 3)),
+        trimmed_mean_s=('pit_duration_ms', lambda x: round(trim_mean(x, trim) / 1000, 3)),
+        mad_s=('pit_duration_ms', lambda x: round(np.median(np.abs(x - np.median(x))) / 1000, 3)),
+        iqr_s=('pit_duration_ms', lambda x: round((x.quantile(0.75) - x.quantile(0.25)) / 1000, 3)),
+        std_s=('pit_duration_ms', lambda x: round(x.std() / 1000, 3)),
+        n_pitstops=('pit_duration_ms', 'count'),
+    )
+    return pit_stats.sort_values(by=['median_s', 'mad_s', 'n_pitstops'])
+
+
+def compare_pit_stats_times(df: pd.DataFrame, groupings: list) -> pd.DataFrame:
+    """
+    Returns:
+    pd.DataFrame: One row per grouping - 'by', 'groups', 'lambda_ms', 'vectorised_ms', 'speedup' and 'same_values'.
+    """
+    rows = []
+    for by in groupings:
+        start = time.perf_counter()
+        expected = get_pit_stats_lambda(df, by)
+        lambda_ms = (time.perf_counter() - start) * 1000
+
+        start = time.perf_counter()
+        result = get_pit_stats(df, by)
+        vectorised_ms = (time.perf_counter() - start) * 1000
+
+        same_values = np.allclose(result.sort_index().to_numpy(dtype='float64'), expected.sort_index().to_numpy(dtype='float64'),
+                                  equal_nan=True, atol=1e-3)
+        rows.append({'by': by, 'groups': len(result), 'lambda_ms': round(lambda_ms, 1), 'vectorised_ms': round(vectorised_ms, 1),
+                     'speedup': round(lambda_ms / vectorised_ms, 1), 'same_values': same_values})
+    return pd.DataFrame(rows)
+
+
+if __name__ == '__main__':
+    df_validated = pd.read_csv('processed_data/constructor-pit-stops-validated.csv')
+
+    print("Midfield pit stops 2015-2019, without long stops or chaotic races (archived test 1):\n")
+    clean = get_pit_stats(df_validated, gp_year=[2015, 2016, 2017, 2018, 2019], long_stop_flag=False, chaotic_race_flag=False)
+    print(clean.to_string())
+    print()
+    print(benchmark_against_best(clean, verbose=True).to_string())
+
+    df_all = get_pit_stops()
+    print(f"\n\nEvery team, every season - {len(df_all):,} stops in raw_data/pit_stops.csv:\n")
+    print(benchmark_against_best(get_pit_stats(df_all, gp_year=[2015, 2016, 2017, 2018, 2019])).head(10).to_string())
+
+    print("\n\nBenchmark - lambda groupby().agg vs sort-based kernels:\n")
+    print(compare_pit_stats_times(df_all, [
+        'constructor_ref',
+        ['constructor_ref', 'gp_year'],
+        ['circuit_ref', 'gp_year'],
+        ['constructor_ref', 'gp_year', 'circuit_ref'],
+        ['constructor_ref', 'gp_year', 'circuit_ref', 'stop_number'],
+    ]).to_string(index=False))
@@ -0,0 +1,277 @@
+import time
+from itertools import combinations
+import numpy as np
+import pandas as pd
+
+from src.race_sim import LAP_TIMES_PATH, PIT_STOPS_PATH, fit_lap_model
+
+"""
+Pit Window Optimiser - optimal number of stops and stop laps for every race, by dynamic programming over stint lengths
+
+archived/archived-pitstops.py benchmarked how long each team's pit stops took, but never turned that into a decision.
+This module fits how much each race's tyres lost per lap of age, and solves for the plan that minimises race time
+given the team's own pit loss - the number of stops and the laps to stop on - for every race of a season in one batch.
+
+Steps:
+1. Fit a degradation curve per race on the laps in driver-lap-times-validated.csv (src.race_sim.fit_lap_model with a
+    quadratic tyre age term): lap time = driver base + fuel effect * (lap - 1) + d1 * tyre age + d2 * tyre age^2,
+    tyre age counted from 0 within each stint. d1 and d2 are fitted >= 0, so a set of tyres never gets faster with age.
+    A race whose fit is rejected - no tyre wear left once the terms are held >= 0 - is dropped rather than planned.
+2. Pit loss per season and Grand Prix - the median of the team's clean stops there (no long stops, no chaotic races),
+    as get_pit_stats in archived/archived-pitstops.py. A season without a clean stop falls back to the median over
+    every season at that Grand Prix.
+3. The fuel effect is the same whatever the plan, and a stint's tyre cost depends only on its length, so race time =
+    fixed part + sum of stint costs + stops * pit loss. Dynamic programming over laps covered and stops made:
+        best[k][n] = min over L of best[k - 1][n - L] + stint_cost[L]
+    solved for all races at once as (races x laps x stint lengths) arrays, with one pass per stop.
+4. Walk the choices back to stop laps, pick the best number of stops (at least one - two dry compounds are mandatory),
+    and report the expected race time, along with the time the Williams drivers' actual plans cost under the same curve.
+
+Limitations: one curve per race for every compound, no safety cars, and track position is ignored - the plan is the
+fastest in clear air. The lap file only holds the Williams drivers' laps, so each curve is fitted on two drivers (up to
+four with substitutes) and stays noisy - a 1-stop race fits d1 and the fuel effect from the same few laps.
+
+Run from the project root: python -m src.pit_window (optimal plans for every race, checked against brute force)
+"""
+
+# most stops considered per race
+MAX_STOPS = 3
+
+# dry races need both compounds used, so at least one stop
+MIN_STOPS = 1
+
+# shortest stint considered, in laps
+MIN_STINT_LAPS = 5
+
+# -------------------------------------------------------------------------------------------------------- #
+
+# steps 1 & 2 - degradation curves and pit loss per race
+
+def get_pit_loss(df_pits: pd.DataFrame, constructor_ref: str = 'williams') -> pd.Series:
+    """
+    Returns:
+    pd.Series: Median clean pit stop duration in ms per (gp_year, gp_name) of df_pits, for one constructor (or every
+    constructor if None). Seasons without a clean stop by the constructor get its median over every season at that GP.
+    """
+    clean = df_pits[~df_pits['long_stop_flag'] & ~df_pits['chaotic_race_flag']]
+    if constructor_ref is not None:
+        clean = clean[clean['constructor_ref'] == constructor_ref]
+
+    races = pd.MultiIndex.from_frame(df_pits[['gp_year', 'gp_name']].drop_duplicates().sort_values(['gp_year', 'gp_name']))
+    per_season = clean.groupby(['gp_year', 'gp_name'])['pit_duration_ms'].median().reindex(races)
+    all_seasons = clean.groupby('gp_name')['pit_duration_ms'].median()
+    fallback = pd.Series(races.get_level_values('gp_name').map(all_seasons), index=races)
+    return per_season.fillna(fallback).dropna().rename('pit_loss_ms')
+
+
+def get_degradation_curves(df_laps: pd.DataFrame, raw_dir: str = 'raw_data') -> pd.DataFrame:
+    """
+    Fit the lap model of step 1 for every race in a lap times table, dropping the races whose fit is rejected.
+
+    Arguments:
+    df_laps (pd.DataFrame): Lap times with 'race_id', 'gp_year', 'gp_name', 'driver_id', 'lap_number' and 'lap_time_ms'.
+    raw_dir (str): Directory of the Ergast tables, for race distances and stop laps. Default is 'raw_data'.
+
+    Returns:
+    pd.DataFrame: One row per race - 'race_id', 'gp_year', 'gp_name', 'n_laps', 'base_ms' (mean driver base),
+    'fuel_ms', 'd1_ms', 'd2_ms' and 'actual_stops' (driver_id -> stop laps of the drivers in df_laps).
+    """
+    from src.loader import load_table
+
+    results = load_table('results', raw_dir)
+    n_laps = results[results['raceId'].isin(df_laps['race_id'].unique())].groupby('raceId', observed=True)['laps'].max()
+
+    pit_stops = load_table('pit_stops', raw_dir)[['raceId', 'driverId', 'lap']].astype('int64')
+    pit_stops = pit_stops.rename(columns={'raceId': 'race_id', 'driverId': 'driver_id'})
+    pit_stops = pit_stops[pit_stops['race_id'].isin(df_laps['race_id'].unique())]
+
+    rows = []
+    for (race_id, gp_year, gp_name), laps in df_laps.groupby(['race_id', 'gp_year', 'gp_name']):
+        stops = pit_stops[(pit_stops['race_id'] == race_id) & pit_stops['driver_id'].isin(laps['driver_id'].unique())]
+        model = fit_lap_model(laps, stops, int(n_laps[race_id]), degree=2, non_negative=True)
+        if not model['degradation_coefficients'].any(): # no wear measured - any stop lap would look optimal
+            continue
+        rows.append({
+            'race_id': race_id, 'gp_year': gp_year, 'gp_name': gp_name, 'n_laps': int(n_laps[race_id]),
+            'base_ms': np.mean(list(model['base_ms'].values())), 'fuel_ms': model['fuel_ms'],
+            'd1_ms': model['degradation_coefficients'][0], 'd2_ms': model['degradation_coefficients'][1],
+            'actual_stops': stops.groupby('driver_id')['lap'].apply(sorted).to_dict(),
+        })
+    return pd.DataFrame(rows)
+
+
+def get_stint_costs(curves: pd.DataFrame, max_laps: int) -> np.ndarray:
+    """
+    Tyre cost of a stint of every length, for every race.
+
+    Returns:
+    np.ndarray: (races, max_laps + 1) cost in ms of a stint of L laps over the same laps on tyres of age 0 -
+    the sum of the degradation curve over tyre ages 0 to L - 1 (non-decreasing, as d1 and d2 are fitted >= 0).
+    """
+    age = np.arange(max_laps)
+    curve = curves['d1_ms'].to_numpy()[:, np.newaxis] * age + curves['d2_ms'].to_numpy()[:, np.newaxis] * age ** 2
+    return np.concatenate([np.zeros((len(curves), 1)), np.cumsum(curve, axis=1)], axis=1)
+
+# -------------------------------------------------------------------------------------------------------- #
+
+# step 3 - dynamic programming over stint lengths, every race at once
+
+def solve_stint_dp(stint_costs: np.ndarray, max_stops: int = MAX_STOPS, min_stint_laps: int = MIN_STINT_LAPS) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Cheapest way to cover n laps in k + 1 stints, for every race, lap count n and number of stops k.
+
+    Arguments:
+    stint_costs (np.ndarray): (races, max_laps + 1) output of get_stint_costs.
+    max_stops (int): Most stops considered. Default is MAX_STOPS.
+    min_stint_laps (int): Shortest stint allowed. Default is MIN_STINT_LAPS.
+
+    Returns:
+    tuple[np.ndarray, np.ndarray]: (races, max_stops + 1, max_laps + 1) best total stint cost (inf where impossible),
+    and the length of the last stint in that best plan.
+    """
+    n_races, width = stint_costs.shape
+    lengths = np.arange(width)
+    costs = np.where(lengths >= min_stint_laps, stint_costs, np.inf)
+
+    best = np.full((n_races, max_stops + 1, width), np.inf)
+    last_stint = np.zeros((n_races, max_stops + 1, width), dtype='int64')
+    best[:, 0] = costs # no stop - one stint of n laps
+    last_stint[:, 0] = lengths
+
+    # laps already covered before the last stint, for every (n, L) - negative where L > n
+    before = lengths[:, np.newaxis] - lengths[np.newaxis, :]
+    for k in range(1, max_stops + 1):
+        candidates = best[:, k - 1][:, np.clip(before, 0, None)] + costs[:, np.newaxis, :]
+        candidates[:, before < 0] = np.inf
+        last_stint[:, k] = candidates.argmin(axis=2)
+        best[:, k] = candidates.min(axis=2)
+
+    return best, last_stint
+
+
+def get_stop_laps(last_stint: np.ndarray, race: int, stops: int, n_laps: int) -> list[int]:
+    """
+    Walk the DP choices back from n_laps to the in-lap of every stop.
+    """
+    stop_laps, covered = [], n_laps
+    for k in range(stops, 0, -1):
+        covered -= last_stint[race, k, covered]
+        stop_laps.append(int(covered))
+    return stop_laps[::-1]
+
+
+def get_plan_cost(stint_costs: np.ndarray, n_laps: int, stop_laps: list[int], pit_loss_ms: float) -> float:
+    """
+    Returns:
+    float: Stint costs plus pit loss in ms of one plan, for one race's row of get_stint_costs.
+    """
+    edges = [0] + sorted(stop_laps) + [n_laps]
+    return sum(stint_costs[end - start] for start, end in zip(edges[:-1], edges[1:])) + len(stop_laps) * pit_loss_ms
+
+# -------------------------------------------------------------------------------------------------------- #
+
+# step 4 - optimal plans
+
+def optimise_pit_windows(gp_year: int | list[int] = None,
+                         constructor_ref: str = 'williams',
+                         max_stops: int = MAX_STOPS,
+                         min_stint_laps: int = MIN_STINT_LAPS,
+                         laps_path: str = LAP_TIMES_PATH,
+                         pit_stops_path: str = PIT_STOPS_PATH,
+                         raw_dir: str = 'raw_data') -> pd.DataFrame:
+    """
+    Optimal number of stops and stop laps for every race of the given season(s), solved in one batch.
+
+    Arguments:
+    gp_year (int | list[int]): Season(s) to solve. Default is every season in laps_path.
+    constructor_ref (str): Team whose median pit loss is used. Default is 'williams'.
+    max_stops (int): Most stops considered. Default is MAX_STOPS.
+    min_stint_laps (int): Shortest stint allowed. Default is MIN_STINT_LAPS.
+    laps_path (str): Lap times to fit degradation on. Default is processed_data/driver-lap-times-validated.csv.
+    pit_stops_path (str): Validated pit stops. Default is processed_data/constructor-pit-stops-validated.csv.
+    raw_dir (str): Directory of the Ergast tables. Default is 'raw_data'.
+
+    Returns:
+    pd.DataFrame: One row per race - 'gp_year', 'gp_name', 'n_laps', 'd1_ms', 'd2_ms', 'pit_loss_s', 'optimal_stops',
+    'stop_laps', 'expected_time_s', 'time_<k>_stop_s' (best time with k stops) and 'actual_time_lost_s'
+    (mean over the drivers in laps_path of how much slower their actual stops were than the optimal plan).
+    """
+    df_laps = pd.read_csv(laps_path)
+    if gp_year is not None:
+        df_laps = df_laps[df_laps['gp_year'].isin([gp_year] if isinstance(gp_year, int) else gp_year)]
+
+    curves = get_degradation_curves(df_laps, raw_dir)
+    pit_loss = get_pit_loss(pd.read_csv(pit_stops_path), constructor_ref)
+    curves = curves.join(pit_loss, on=['gp_year', 'gp_name'], how='inner').reset_index(drop=True)
+
+    n_laps = curves['n_laps'].to_numpy()
+    stint_costs = get_stint_costs(curves, n_laps.max())
+    best, last_stint = solve_stint_dp(stint_costs, max_stops, min_stint_laps)
+
+    # best stint cost at each race's distance, plus its pit loss - (races, stops)
+    stops = np.arange(max_stops + 1)
+    totals = best[np.arange(len(curves)), :, n_laps] + stops * curves['pit_loss_ms'].to_numpy()[:, np.newaxis]
+    totals[:, stops < MIN_STOPS] = np.inf
+    optimal_stops = totals.argmin(axis=1)
+
+    # plan-independent part - every lap at base pace, plus the fuel effect
+    fixed = n_laps * curves['base_ms'] + curves['fuel_ms'] * n_laps * (n_laps - 1) / 2
+
+    plans = pd.DataFrame({
+        'gp_year': curves['gp_year'],
+        'gp_name': curves['gp_name'],
+        'n_laps': n_laps,
+        'd1_ms': curves['d1_ms'],
+        'd2_ms': curves['d2_ms'],
+        'pit_loss_s': curves['pit_loss_ms'] / 1000,
+        'optimal_stops': optimal_stops,
+        'stop_laps': [get_stop_laps(last_stint, race, k, n) for race, (k, n) in enumerate(zip(optimal_stops, n_laps))],
+        'expected_time_s': (fixed + totals[np.arange(len(curves)), optimal_stops]) / 1000,
+    })
+    for k in stops[stops >= MIN_STOPS]:
+        plans[f'time_{k}_stop_s'] = (fixed + totals[:, k]) / 1000
+
+    plans['actual_time_lost_s'] = [
+        np.mean([get_plan_cost(stint_costs[race], n, actual, pit_loss) for actual in race_stops.values()]) / 1000
+        - totals[race, k] / 1000 if race_stops else np.nan
+        for race, (race_stops, n, pit_loss, k) in enumerate(zip(curves['actual_stops'], n_laps, curves['pit_loss_ms'], optimal_stops))
+    ]
+
+    return plans.sort_values(['gp_year', 'gp_name']).reset_index(drop=True)
+
+
+if __name__ == '__main__':
+    start = time.perf_counter()
+    plans = optimise_pit_windows()
+    print(f"Optimal Williams pit plans for {len(plans)} races ({time.perf_counter() - start:.2f} s including fitting):\n")
+    print(plans.round(3).to_string(index=False))
+
+    # the DP against brute force - every plan of up to two stops, for every race of the batch
+    curves = get_degradation_curves(pd.read_csv(LAP_TIMES_PATH))
+    curves = curves.join(get_pit_loss(pd.read_csv(PIT_STOPS_PATH)), on=['gp_year', 'gp_name'], how='inner').reset_index(drop=True)
+    n_laps = curves['n_laps'].to_numpy()
+    stint_costs = get_stint_costs(curves, n_laps.max())
+
+    start = time.perf_counter()
+    best, last_stint = solve_stint_dp(stint_costs, max_stops=2)
+    dp_ms = (time.perf_counter() - start) * 1000
+
+    start = time.perf_counter()
+    for race, n in enumerate(n_laps):
+        for k in [1, 2]:
+            plans_k = [stop_laps for stop_laps in combinations(range(MIN_STINT_LAPS, n - MIN_STINT_LAPS + 1), k)
+                       if min(np.diff((0,) + stop_laps + (n,))) >= MIN_STINT_LAPS]
+            brute = min(get_plan_cost(stint_costs[race], n, list(stop_laps), 0) for stop_laps in plans_k)
+            assert np.isclose(brute, best[race, k, n])
+            assert np.isclose(get_plan_cost(stint_costs[race], n, get_stop_laps(last_stint, race, k, n), 0), best[race, k, n])
+    brute_ms = (time.perf_counter() - start) * 1000
+    print(f"\nDP matches brute force for 1 and 2 stops in all {len(curves)} races: DP {dp_ms:.1f} ms vs brute force {brute_ms:.0f} ms")
+
+    # what the fastest team's stops would change
+    df_pits = pd.read_csv(PIT_STOPS_PATH)
+    fastest = df_pits[~df_pits['long_stop_flag'] & ~df_pits['chaotic_race_flag']].groupby('constructor_ref')['pit_duration_ms'].median().idxmin()
+    benchmark = optimise_pit_windows(constructor_ref=fastest)
+    changed = plans.merge(benchmark, on=['gp_year', 'gp_name'], suffixes=('', f'_{fastest}'))
+    changed = changed[changed['optimal_stops'] != changed[f'optimal_stops_{fastest}']]
+    print(f"\nRaces where {fastest}'s pit loss (fastest median stop) would change the optimal number of stops:\n")
+    print(changed[['gp_year', 'gp_name', 'pit_loss_s', 'optimal_stops', f'pit_loss_s_{fastest}', f'optimal_stops_{fastest}']].round(3).to_string(index=False))
@@ -0,0 +1,442 @@
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from itertools import combinations
+import numpy as np
+import pandas as pd
+
+"""
+Race Strategy Simulator - Monte Carlo races for every car, vectorised over (simulations x cars x laps)
+
+KPI 2 and KPI 3 describe what happened - pit stop durations, lap time consistency - but cannot say whether a different
+strategy would have scored more. This module replays a race many times with the lap time and pit stop data behind
+processed_data/laptimes_std.csv and constructor-pit-stops-validated.csv, so a 1-stop and a 2-stop plan for Williams
+can be compared on finishing positions.
+
+Steps:
+1. Lap model, fitted on the laps laptimes_std.csv is computed from (driver-lap-times-validated.csv - the Williams
+    drivers of each season):
+    lap time = driver base + fuel effect * (lap - 1) + tyre degradation * laps on the current set + residual,
+    by least squares over representative laps (no lap 1, in- or out-laps, or laps beyond 107% of the driver's best).
+    Each of those drivers keeps their own residuals, the distribution their lap times are resampled from.
+2. The field comes from raw_data: every car that covered 90% of the race, its grid slot and real pit stops.
+    Cars without laps in the file get their fastest lap plus the mean gap between the fitted drivers' base and their
+    fastest laps as base pace, and resample the pooled residuals. Pit loss is resampled from the non-chaotic, non-long stops at
+    that Grand Prix in that season (all seasons if there were none) - Williams' own stops for Williams cars, every constructor's for the rest.
+3. Simulate in chunks of (simulations x cars x laps) arrays - one numpy draw per chunk for every lap of every car.
+    Each chunk has its own seed spawned from the main one, so results are identical serial or over a process pool,
+    and lap and pit draws use separate streams, so every plan sees the same races (common random numbers).
+4. Rank cars on total race time per simulation and summarise each plan - positions, points finishes,
+    and how often it beat the first plan in the same simulated races.
+
+Limitations: cars do not interact (no traffic, overtaking difficulty, safety cars or retirements), every compound
+degrades at the same rate, and pit stop durations stand in for the full time lost in the pit lane.
+
+Run from the project root: python -m src.race_sim (1-stop vs 2-stop for Williams, plus a runs per second benchmark)
+"""
+
+LAP_TIMES_PATH = 'processed_data/driver-lap-times-validated.csv'
+PIT_STOPS_PATH = 'processed_data/constructor-pit-stops-validated.csv'
+
+# laps slower than this multiple of the driver's best lap in the race are not used to fit the lap model
+REPRESENTATIVE_LAP_RATIO = 1.07
+
+# cars that covered less than this share of the race distance are left out of the field
+MIN_DISTANCE_SHARE = 0.9
+
+# time between consecutive grid slots at the start, in ms
+GRID_SLOT_MS = 250
+
+POINTS_POSITIONS = 10
+
+# (simulations x cars x laps) elements per chunk - bounds memory at roughly 100 MB per chunk
+CHUNK_ELEMENTS = 1 << 22
+
+# jobs smaller than this (simulations x cars x laps) run in-process - a process pool costs more than it saves
+PARALLEL_MIN_ELEMENTS = 1 << 24
+
+# -------------------------------------------------------------------------------------------------------- #
+
+# step 1 - lap model from the Williams laps
+
+def get_tyre_age(stop_laps: np.ndarray, n_laps: int) -> np.ndarray:
+    """
+    Laps already run on the current set of tyres, for every lap of every car.
+
+    Arguments:
+    stop_laps (np.ndarray): (cars, stops) in-lap of each stop, padded with 0 for cars with fewer stops.
+    n_laps (int): Race distance in laps.
+
+    Returns:
+    np.ndarray: (cars, n_laps) tyre age - 0 on lap 1 and on the lap after each stop.
+    """
+    laps = np.arange(1, n_laps + 1)
+    stop_laps = np.asarray(stop_laps, dtype='int64').reshape(len(stop_laps), -1)
+    last_stop = np.where(stop_laps[:, :, np.newaxis] < laps, stop_laps[:, :, np.newaxis], 0).max(axis=1, initial=0)
+    return laps - 1 - last_stop
+
+
+def _lstsq_non_negative(design: np.ndarray, times: np.ndarray, constrained: list[int]) -> np.ndarray:
+    """
+    Least squares with the coefficients of the constrained columns held >= 0. Every subset of those columns is tried
+    with the rest fixed at 0, and the best fit whose free coefficients all come out >= 0 wins - exact for the one or
+    two tyre age terms of the lap model.
+    """
+    best_coefficients, best_error = None, np.inf
+    for n_fixed in range(len(constrained) + 1):
+        for fixed in combinations(constrained, n_fixed):
+            free = [col for col in range(design.shape[1]) if col not in fixed]
+            coefficients = np.zeros(design.shape[1])
+            coefficients[free] = np.linalg.lstsq(design[:, free], times, rcond=None)[0]
+            error = np.sum((times - design @ coefficients) ** 2)
+            if (coefficients[constrained] >= 0).all() and error < best_error:
+                best_coefficients, best_error = coefficients, error
+    return best_coefficients
+
+
+def fit_lap_model(laps: pd.DataFrame, stops: pd.DataFrame, n_laps: int, degree: int = 1, non_negative: bool = False) -> dict:
+    """
+    Fit lap time = driver base + fuel_ms * (lap - 1) + degradation_ms * tyre age on representative laps.
+    With degree > 1 the tyre age term is a polynomial, e.g. degree 2 adds a tyre age ** 2 term.
+
+    Arguments:
+    laps (pd.DataFrame): One race's laps with 'driver_id', 'lap_number' and 'lap_time_ms'.
+    stops (pd.DataFrame): Pit stops of those drivers in that race, with 'driver_id' and 'lap'.
+    n_laps (int): Race distance in laps.
+    degree (int): Degree of the tyre age polynomial. Default is 1.
+    non_negative (bool): If True, every tyre age coefficient is fitted >= 0, so tyres never get faster with age.
+        Default is False.
+
+    Returns:
+    dict: 'base_ms' (driver_id -> fitted base lap), 'fuel_ms' and 'degradation_ms' (per lap, the linear term),
+    'degradation_coefficients' (np.ndarray, ms per tyre age ** 1 ... ** degree),
+    'residuals' (driver_id -> np.ndarray of residuals in ms) and 'laps' (representative laps used).
+    """
+    laps = laps[['driver_id', 'lap_number', 'lap_time_ms']].astype('int64')
+    drivers = np.sort(laps['driver_id'].unique())
+
+    stop_laps = stops.groupby('driver_id')['lap'].apply(list).reindex(drivers, fill_value=[])
+    width = max(1, stop_laps.map(len).max())
+    stop_matrix = np.array([row + [0] * (width - len(row)) for row in stop_laps], dtype='int64')
+    tyre_age = get_tyre_age(stop_matrix, n_laps)
+
+    driver_index = np.searchsorted(drivers, laps['driver_id'].to_numpy())
+    lap_index = laps['lap_number'].to_numpy() - 1
+    laps = laps.assign(tyre_age=tyre_age[driver_index, np.clip(lap_index, 0, n_laps - 1)])
+
+    # representative laps - no standing start, in-laps, out-laps or laps behind the safety car
+    pit_laps = set(zip(stops['driver_id'], stops['lap'])) | set(zip(stops['driver_id'], stops['lap'] + 1))
+    in_or_out = pd.Series([key in pit_laps for key in zip(laps['driver_id'], laps['lap_number'])], index=laps.index)
+    best = laps.groupby('driver_id')['lap_time_ms'].transform('min')
+    keep = (laps['lap_number'] > 1) & ~in_or_out & (laps['lap_time_ms'] <= best * REPRESENTATIVE_LAP_RATIO)
+    laps = laps[keep]
+    driver_index = np.searchsorted(drivers, laps['driver_id'].to_numpy())
+
+    # one intercept per driver, shared fuel and degradation terms
+    n_drivers = len(drivers)
+    design = np.zeros((len(laps), n_drivers + 1 + degree))
+    design[np.arange(len(laps)), driver_index] = 1
+    design[:, n_drivers] = laps['lap_number'].to_numpy() - 1
+    design[:, n_drivers + 1:] = laps['tyre_age'].to_numpy()[:, np.newaxis] ** np.arange(1, degree + 1)
+    times = laps['lap_time_ms'].to_numpy(dtype='float64')
+    if non_negative:
+        coefficients = _lstsq_non_negative(design, times, list(range(n_drivers + 1, n_drivers + 1 + degree)))
+    else:
+        coefficients = np.linalg.lstsq(design, times, rcond=None)[0]
+
+    residuals = times - design @ coefficients
+    return {
+        'base_ms': dict(zip(drivers.tolist(), coefficients[:n_drivers])),
+        'fuel_ms': coefficients[n_drivers],
+        'degradation_ms': coefficients[n_drivers + 1],
+        'degradation_coefficients': coefficients[n_drivers + 1:],
+        'residuals': {driver: residuals[driver_index == i] for i, driver in enumerate(drivers.tolist())},
+        'laps': laps,
+    }
+
+# -------------------------------------------------------------------------------------------------------- #
+
+# step 2 - the whole field, as arrays
+
+def _pad(pools: list[np.ndarray]) -> tuple[np.ndarray, np.ndarray]:
+    # ragged per-car samples -> (cars, longest) matrix and per-car sizes, for one vectorised draw over all cars
+    sizes = np.array([len(pool) for pool in pools])
+    padded = np.zeros((len(pools), sizes.max()))
+    for car, pool in enumerate(pools):
+        padded[car, :len(pool)] = pool
+    return padded, sizes
+
+
+def build_race_model(gp_year: int,
+                     gp_name: str,
+                     laps_path: str = LAP_TIMES_PATH,
+                     pit_stops_path: str = PIT_STOPS_PATH,
+                     raw_dir: str = 'raw_data') -> dict:
+    """
+    Everything a simulation of one race needs, as numpy arrays over the cars of the field.
+
+    Arguments:
+    gp_year (int): Season, e.g. 2018.
+    gp_name (str): Grand Prix, e.g. 'British Grand Prix'.
+    laps_path (str): Williams lap times. Default is processed_data/driver-lap-times-validated.csv.
+    pit_stops_path (str): Validated pit stops. Default is processed_data/constructor-pit-stops-validated.csv.
+    raw_dir (str): Directory of the Ergast tables. Default is 'raw_data'.
+
+    Returns:
+    dict: 'cars' (one row per car - driver, constructor, grid, actual finish and stops, 'is_williams'), 'n_laps',
+    'base_ms', 'fuel_ms', 'degradation_ms', 'grid_ms', 'stop_laps' (actual, (cars, stops)), the padded residual
+    and pit loss pools with their sizes, and 'lap_model' (the fit_lap_model output).
+    """
+    from src.loader import load_table
+
+    df_laps = pd.read_csv(laps_path)
+    df_laps = df_laps[(df_laps['gp_year'] == gp_year) & (df_laps['gp_name'] == gp_name)]
+    if df_laps.empty:
+        raise ValueError(f"no Williams laps for the {gp_year} {gp_name} in {laps_path}")
+    race_id = int(df_laps['race_id'].iloc[0])
+
+    # 2. ---------- field: cars that covered most of the race ----------
+    results = load_table('results', raw_dir)
+    results = results[results['raceId'] == race_id]
+    n_laps = int(results['laps'].max())
+    results = results[(results['laps'] >= MIN_DISTANCE_SHARE * n_laps) & results['fastestLapTime_ms'].notna()]
+
+    drivers = load_table('drivers', raw_dir)[['driverId', 'forename', 'surname']]
+    constructors = load_table('constructors', raw_dir)[['constructorId', 'constructorRef']]
+    cars = results.merge(drivers, on='driverId').merge(constructors, on='constructorId')
+    cars = pd.DataFrame({
+        'driver_id': cars['driverId'].astype('int64'),
+        'driver_name': cars['forename'] + ' ' + cars['surname'],
+        'constructor_ref': cars['constructorRef'].astype(str),
+        'grid': cars['grid'].astype('int64'),
+        'finish': cars['positionOrder'].astype('int64'),
+        'fastest_lap_ms': cars['fastestLapTime_ms'].astype('float64'),
+    }).sort_values('finish').reset_index(drop=True)
+    cars['grid'] = cars['grid'].where(cars['grid'] > 0, cars['grid'].max() + 1) # pit lane starts at the back
+
+    pit_stops = load_table('pit_stops', raw_dir)
+    pit_stops = pit_stops[pit_stops['raceId'] == race_id][['driverId', 'lap']].astype('int64').rename(columns={'driverId': 'driver_id'})
+    cars['stops'] = cars['driver_id'].map(pit_stops.groupby('driver_id')['lap'].apply(sorted)).apply(
+        lambda laps: laps if isinstance(laps, list) else [])
+
+    cars['is_williams'] = cars['constructor_ref'] == 'williams'
+    if not cars['is_williams'].any():
+        raise ValueError(f"no Williams car covered {MIN_DISTANCE_SHARE:.0%} of the {gp_year} {gp_name}")
+
+    # 1. ---------- lap model on the drivers with laps in the file ----------
+    lap_model = fit_lap_model(df_laps, pit_stops, n_laps, non_negative=True) # a drying track would fit tyres that get faster with age
+    fitted = cars['driver_id'].isin(list(lap_model['base_ms']))
+    if not fitted.any():
+        raise ValueError(f"no driver with laps in {laps_path} covered {MIN_DISTANCE_SHARE:.0%} of the {gp_year} {gp_name}")
+
+    fastest_lap_gap = (cars['driver_id'].map(lap_model['base_ms']) - cars['fastest_lap_ms'])[fitted].mean()
+    base_ms = np.where(fitted, cars['driver_id'].map(lap_model['base_ms']), cars['fastest_lap_ms'] + fastest_lap_gap)
+
+    pooled_residuals = np.concatenate(list(lap_model['residuals'].values()))
+    residuals, residual_sizes = _pad([lap_model['residuals'].get(driver, pooled_residuals) for driver in cars['driver_id']])
+
+    # pit loss - this Grand Prix's clean stops in this season, or over every season if there were none
+    df_pits = pd.read_csv(pit_stops_path)
+    df_pits = df_pits[(df_pits['gp_name'] == gp_name) & ~df_pits['long_stop_flag'] & ~df_pits['chaotic_race_flag']]
+
+    def season_or_all(stops: pd.DataFrame) -> np.ndarray:
+        season = stops[stops['gp_year'] == gp_year]
+        return (season if len(season) else stops)['pit_duration_ms'].to_numpy(dtype='float64')
+
+    field_losses = season_or_all(df_pits)
+    williams_losses = season_or_all(df_pits[df_pits['is_williams']])
+    if len(williams_losses) == 0:
+        williams_losses = field_losses
+    pit_losses, pit_loss_sizes = _pad([williams_losses if is_williams else field_losses for is_williams in cars['is_williams']])
+
+    width = max(1, cars['stops'].map(len).max())
+    return {
+        'gp_year': gp_year,
+        'gp_name': gp_name,
+        'cars': cars,
+        'n_laps': n_laps,
+        'base_ms': base_ms.astype('float64'),
+        'fuel_ms': lap_model['fuel_ms'],
+        'degradation_ms': lap_model['degradation_ms'],
+        'grid_ms': (cars['grid'].to_numpy() - 1) * float(GRID_SLOT_MS),
+        'stop_laps': np.array([stops + [0] * (width - len(stops)) for stops in cars['stops']], dtype='int64'),
+        'residuals': residuals,
+        'residual_sizes': residual_sizes,
+        'pit_losses': pit_losses,
+        'pit_loss_sizes': pit_loss_sizes,
+        'lap_model': lap_model,
+    }
+
+
+def get_plan_stops(model: dict, williams_stops: list[int]) -> np.ndarray:
+    """
+    Stop laps of every car under a plan - the Williams cars stop on williams_stops, the rest as they did in the race.
+
+    Returns:
+    np.ndarray: (cars, stops) in-laps, padded with 0.
+    """
+    williams_stops = sorted(williams_stops)
+    if any(lap < 1 or lap >= model['n_laps'] for lap in williams_stops):
+        raise ValueError(f"stop laps must be between 1 and {model['n_laps'] - 1}, not {williams_stops}")
+
+    actual = model['stop_laps']
+    width = max(actual.shape[1], len(williams_stops), 1)
+    stop_laps = np.zeros((len(actual), width), dtype='int64')
+    stop_laps[:, :actual.shape[1]] = actual
+    stop_laps[model['cars']['is_williams'].to_numpy()] = williams_stops + [0] * (width - len(williams_stops))
+    return stop_laps
+
+
+def get_default_plans(n_laps: int) -> dict[str, list[int]]:
+    """
+    Returns:
+    dict[str, list[int]]: An evenly split 1-stop and 2-stop plan for a race of n_laps.
+    """
+    return {'1-stop': [round(n_laps / 2)], '2-stop': [round(n_laps / 3), round(2 * n_laps / 3)]}
+
+# -------------------------------------------------------------------------------------------------------- #
+
+# step 3 - simulation, one chunk of races per task
+
+def _simulate_chunk(model: dict, stop_laps: np.ndarray, n_sims: int, seed: np.random.SeedSequence) -> np.ndarray:
+    """
+    Worker task: total race time of every car in n_sims simulated races.
+    """
+    lap_seed, pit_seed = seed.spawn(2)
+    n_cars, n_laps = len(model['base_ms']), model['n_laps']
+
+    # deterministic part of every lap - (cars, laps)
+    expected = (model['base_ms'][:, np.newaxis]
+                + model['fuel_ms'] * np.arange(n_laps)
+                + model['degradation_ms'] * get_tyre_age(stop_laps, n_laps))
+
+    # lap times - (simulations x cars x laps) residuals, each car drawing from its own pool
+    rng = np.random.default_rng(lap_seed)
+    draws = (rng.random((n_sims, n_cars, n_laps)) * model['residual_sizes'][:, np.newaxis]).astype('int64')
+    residuals = model['residuals'][np.arange(n_cars)[:, np.newaxis], draws]
+    totals = residuals.sum(axis=2) + expected.sum(axis=1) + model['grid_ms']
+
+    # pit losses - drawn stop by stop, so the first stops are the same draws whatever the number of stops
+    rng = np.random.default_rng(pit_seed)
+    for stop in range(stop_laps.shape[1]):
+        draws = (rng.random((n_sims, n_cars)) * model['pit_loss_sizes']).astype('int64')
+        totals += np.where(stop_laps[:, stop] > 0, model['pit_losses'][np.arange(n_cars), draws], 0)
+
+    return totals
+
+
+def simulate_race(model: dict,
+                  williams_stops: list[int],
+                  n_sims: int = 20_000,
+                  seed: int = 0,
+                  max_workers: int = None) -> np.ndarray:
+    """
+    Simulate a race n_sims times with the Williams cars on a given plan.
+
+    Arguments:
+    model (dict): Output of build_race_model.
+    williams_stops (list[int]): In-laps of the Williams plan, e.g. [22, 44] for a 2-stop.
+    n_sims (int): Number of simulated races. Default is 20,000.
+    seed (int): Seed for the simulations - the same seed gives the same races for every plan. Default is 0.
+    max_workers (int): Worker processes for large jobs - 1 never starts a pool. Default is one per CPU.
+
+    Returns:
+    np.ndarray: (n_sims, cars) total race times in ms, cars in the order of model['cars'].
+    """
+    stop_laps = get_plan_stops(model, williams_stops)
+    cells = len(model['base_ms']) * model['n_laps']
+
+    chunk_size = max(1, CHUNK_ELEMENTS // cells)
+    chunk_sizes = [min(chunk_size, n_sims - start) for start in range(0, n_sims, chunk_size)]
+    seeds = np.random.SeedSequence(seed).spawn(len(chunk_sizes))
+
+    parallel = max_workers != 1 and len(chunk_sizes) > 1 and n_sims * cells >= PARALLEL_MIN_ELEMENTS
+
+    if not parallel:
+        chunks = [_simulate_chunk(model, stop_laps, size, chunk_seed) for size, chunk_seed in zip(chunk_sizes, seeds)]
+    else:
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            chunks = list(executor.map(_simulate_chunk, [model] * len(seeds), [stop_laps] * len(seeds), chunk_sizes, seeds))
+
+    return np.concatenate(chunks)
+
+# -------------------------------------------------------------------------------------------------------- #
+
+# step 4 - positions and plan comparison
+
+def get_positions(totals: np.ndarray) -> np.ndarray:
+    """
+    Returns:
+    np.ndarray: (n_sims, cars) finishing position of every car in every simulated race, 1 = winner.
+    """
+    positions = np.empty(totals.shape, dtype='int64')
+    np.put_along_axis(positions, np.argsort(totals, axis=1), np.arange(1, totals.shape[1] + 1), axis=1)
+    return positions
+
+
+def compare_plans(model: dict,
+                  plans: dict[str, list[int]] = None,
+                  n_sims: int = 20_000,
+                  seed: int = 0,
+                  max_workers: int = None) -> pd.DataFrame:
+    """
+    Simulate each Williams plan over the same n_sims races and summarise every Williams car's result.
+
+    Arguments:
+    model (dict): Output of build_race_model.
+    plans (dict[str, list[int]]): Plan name -> in-laps, e.g. {'1-stop': [30], '2-stop': [20, 40]}.
+        Default is get_default_plans. The first plan is the baseline the others are compared with.
+    n_sims, seed, max_workers: As simulate_race.
+
+    Returns:
+    pd.DataFrame: One row per plan and Williams driver - 'plan', 'stops', 'driver_name', 'actual_finish',
+    'mean_position', 'median_position', 'p_points', 'mean_race_time_s' and 'p_ahead_of_baseline'
+    (share of races where the driver finished ahead of where the baseline plan put them).
+    """
+    plans = plans or get_default_plans(model['n_laps'])
+    williams = np.flatnonzero(model['cars']['is_williams'].to_numpy())
+
+    rows, baseline = [], None
+    for plan, stops in plans.items():
+        totals = simulate_race(model, stops, n_sims, seed, max_workers)
+        positions = get_positions(totals)[:, williams]
+        if baseline is None:
+            baseline = positions
+
+        for i, car in enumerate(williams):
+            rows.append({
+                'plan': plan,
+                'stops': list(stops),
+                'driver_name': model['cars']['driver_name'].iloc[car],
+                'actual_finish': model['cars']['finish'].iloc[car],
+                'mean_position': positions[:, i].mean(),
+                'median_position': np.median(positions[:, i]),
+                'p_points': (positions[:, i] <= POINTS_POSITIONS).mean(),
+                'mean_race_time_s': totals[:, car].mean() / 1000,
+                'p_ahead_of_baseline': (positions[:, i] < baseline[:, i]).mean(),
+            })
+    return pd.DataFrame(rows)
+
+
+if __name__ == '__main__':
+    model = build_race_model(2018, 'British Grand Prix')
+    print(f"{model['gp_year']} {model['gp_name']}: {len(model['cars'])} cars, {model['n_laps']} laps, "
+          f"fuel {model['fuel_ms']:.0f} ms/lap, tyre degradation {model['degradation_ms']:.0f} ms/lap")
+    print(model['cars'].assign(base_s=model['base_ms'] / 1000)[['driver_name', 'constructor_ref', 'grid', 'finish', 'stops', 'base_s']].round(3).to_string(index=False))
+
+    n_sims = 20_000
+    comparison = compare_plans(model, n_sims=n_sims)
+    print(f"\n1-stop vs 2-stop for Williams, {n_sims:,} simulated races per plan:\n")
+    print(comparison.round(3).to_string(index=False))
+
+    # benchmark - the same races serial and over a process pool
+    plan = get_default_plans(model['n_laps'])['2-stop']
+    timings = {}
+    for method, max_workers in [('serial', 1), ('process pool', None)]:
+        start = time.perf_counter()
+        timings[method] = (simulate_race(model, plan, n_sims, max_workers=max_workers), time.perf_counter() - start)
+    assert np.array_equal(timings['serial'][0], timings['process pool'][0])
+
+    print(f"\n{n_sims:,} races of {len(model['cars'])} cars x {model['n_laps']} laps ({os.cpu_count()} CPUs, same results):")
+    for method, (_, total_s) in timings.items():
+        print(f"{method}: {total_s:.2f} s ({int(n_sims / total_s):,} races/s)")
@@ -0,0 +1,421 @@
+import os
+import sqlite3
+import time
+import numpy as np
+import pandas as pd
+
+from src.kpi2 import MIDFIELD_CONSTRUCTORS, circuit_type
+from src.loader import RAW_DATA_DIR
+
+"""
+SQL Backend - the Ergast tables in an indexed SQLite file, with KPI filters and aggregations pushed down to it
+
+grid-to-finish.csv, driver-lap-times.csv and constructor-pit-stops.csv were exported from BigQuery (sql/), and every
+other join happens in pandas - each question reloads and rejoins the raw tables. This backend loads raw_data/*.csv once
+into a local SQLite file (the stdlib sqlite3 module - no server, no extra dependency) and answers queries from it.
+
+Steps:
+1. Load every raw_data/*.csv through src.loader (typed, '\\N' as null) into cache/f1.sqlite, one table per file, plus the
+    validated extracts the KPI modules read (grid_to_finish, driver_lap_times). Every raceId, driverId, constructorId and
+    year column - and race_id, driver_id and gp_year in the extracts - gets an index. A table is only reloaded when
+    its CSV is newer than the load, as src.loader does for parquet.
+2. The three BigQuery extracts as SQLite queries over the raw tables, parameterised by years, circuits and constructors.
+3. Push-down versions of the KPI aggregations: the filters become WHERE clauses and the groupby a GROUP BY, so only the
+    aggregated rows come back to pandas. src.kpi1.get_constructor_delta_panel and src.kpi3.get_laptime_consistency
+    take a connection in place of a DataFrame and call these.
+4. Latency of typical KPI queries against the pandas path, checking both give the same result.
+
+Limitations:
+- raw_data/ has no lap_times.csv, so the driver lap times extract only runs once the Ergast lap_times table is
+    downloaded there; the push-down KPI 3 queries use the validated extract in processed_data/.
+
+Run from the project root: python -m src.sql_backend (builds the database, checks the extracts, compares latency)
+"""
+
+SQL_DB_PATH = 'cache/f1.sqlite'
+
+# every column of these names gets an index
+INDEXED_COLUMNS = ['raceId', 'driverId', 'constructorId', 'year', 'race_id', 'driver_id', 'gp_year']
+
+# processed extracts loaded next to the raw tables, for the KPI push-down queries
+EXTRACT_TABLES = {
+    'grid_to_finish': 'processed_data/grid-to-finish-validated.csv',
+    'driver_lap_times': 'processed_data/driver-lap-times-validated.csv',
+}
+
+# the scope of the BigQuery extracts
+EXTRACT_YEARS = (2015, 2019)
+EXTRACT_CIRCUITS = list(circuit_type.keys())
+
+# -------------------------------------------------------------------------------------------------------- #
+
+# step 1 - load the tables once, with indexes
+
+def to_sql_frame(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Make a typed table storable by sqlite3 - categoricals as text, nullable ints with None for nulls, dates as ISO text.
+    """
+    df = df.copy()
+    for col in df.columns:
+        if isinstance(df[col].dtype, pd.CategoricalDtype) or pd.api.types.is_string_dtype(df[col]):
+            df[col] = df[col].astype(object).where(df[col].notna(), None)
+        elif pd.api.types.is_datetime64_any_dtype(df[col]):
+            df[col] = df[col].dt.strftime('%Y-%m-%d').astype(object).where(df[col].notna(), None)
+        elif pd.api.types.is_extension_array_dtype(df[col]):
+            df[col] = df[col].astype(object).where(df[col].notna(), None)
+    return df
+
+
+def load_sql_table(con: sqlite3.Connection, table: str, df: pd.DataFrame, source_path: str) -> None:
+    """
+    Replace one table in the database with df, index it, and record when its source was loaded - in one transaction.
+    """
+    with con:
+        con.execute(f'DROP TABLE IF EXISTS "{table}"')
+        to_sql_frame(df).to_sql(table, con, index=False)
+        for col in INDEXED_COLUMNS:
+            if col in df.columns:
+                con.execute(f'CREATE INDEX "idx_{table}_{col}" ON "{table}" ("{col}")')
+        con.execute('INSERT OR REPLACE INTO _loaded (table_name, source_path, source_mtime) VALUES (?, ?, ?)',
+                    (table, source_path, os.path.getmtime(source_path)))
+
+
+def get_sources(raw_dir: str = RAW_DATA_DIR) -> dict[str, str]:
+    """
+    Returns:
+    dict[str, str]: Table name to source CSV - every raw_data/*.csv, and EXTRACT_TABLES.
+    """
+    sources = {file_name[:-len('.csv')]: os.path.join(raw_dir, file_name)
+               for file_name in sorted(os.listdir(raw_dir)) if file_name.endswith('.csv')}
+    sources.update({table: path for table, path in EXTRACT_TABLES.items() if os.path.exists(path)})
+    return sources
+
+
+def build_database(raw_dir: str = RAW_DATA_DIR, db_path: str = SQL_DB_PATH, refresh: bool = False) -> list[str]:
+    """
+    Load every source CSV into the database. Tables loaded after their CSV last changed are skipped unless refresh=True.
+
+    Arguments:
+    raw_dir (str): The directory holding the raw CSV files. Default is 'raw_data'.
+    db_path (str): The SQLite file. Default is 'cache/f1.sqlite'.
+    refresh (bool): If True, reload every table. Default is False.
+
+    Returns:
+    list[str]: The names of the tables that were (re)loaded.
+    """
+    from src.loader import load_table
+
+    os.makedirs(os.path.dirname(db_path) or '.', exist_ok=True)
+    con = sqlite3.connect(db_path)
+    try:
+        con.execute('CREATE TABLE IF NOT EXISTS _loaded (table_name TEXT PRIMARY KEY, source_path TEXT, source_mtime REAL)')
+        loaded = dict(con.execute('SELECT table_name, source_mtime FROM _loaded').fetchall())
+
+        built = []
+        for table, path in get_sources(raw_dir).items():
+            if not refresh and loaded.get(table, -1) >= os.path.getmtime(path):
+                continue
+            df = load_table(table, raw_dir) if table not in EXTRACT_TABLES else pd.read_csv(path)
+            load_sql_table(con, table, df, path)
+            built.append(table)
+
+        if built:
+            con.execute('ANALYZE') # table statistics for the query planner
+            con.commit()
+        return built
+    finally:
+        con.close()
+
+
+def connect(db_path: str = SQL_DB_PATH, raw_dir: str = RAW_DATA_DIR) -> sqlite3.Connection:
+    """
+    Open the database, loading any table missing or older than its CSV first.
+
+    Returns:
+    sqlite3.Connection: A connection to pass to the query functions below.
+    """
+    build_database(raw_dir, db_path)
+    return sqlite3.connect(db_path)
+
+
+def placeholders(values) -> str:
+    """
+    Returns:
+    str: '?, ?, ?' - one placeholder per value, for an IN clause.
+    """
+    return ', '.join('?' * len(values))
+
+# -------------------------------------------------------------------------------------------------------- #
+
+# step 2 - the BigQuery extracts, over the raw tables
+
+def query_grid_to_finish(con: sqlite3.Connection,
+                         years: tuple[int, int] = EXTRACT_YEARS,
+                         gp_names: list[str] = EXTRACT_CIRCUITS,
+                         constructor_refs: list[str] = MIDFIELD_CONSTRUCTORS) -> pd.DataFrame:
+    """
+    processed_data/grid-to-finish.csv, from the raw tables (sql/1-grid-to-finish.sql).
+
+    Arguments:
+    con (sqlite3.Connection): From connect().
+    years (tuple[int, int]): First and last season. Default is (2015, 2019).
+    gp_names (list[str]): GPs to keep. Default is the 10 KPI circuits.
+    constructor_refs (list[str]): Constructors to keep. Default is Williams and its midfield rivals.
+
+    Returns:
+    pd.DataFrame: The grid-to-finish.csv columns, ordered by year, round and driver.
+    """
+    sql = f"""
+        SELECT RA.raceId AS race_id, RA.year AS gp_year, RA.name AS gp_name, RA.round AS gp_round,
+               D.forename || ' ' || D.surname AS driver_name,
+               C.name AS constructor, C.constructorRef AS constructor_ref, C.constructorRef = 'williams' AS is_williams,
+               RE.grid AS start_position, RE.position AS final_position, RE.grid - RE.position AS grid_delta
+        FROM results RE
+        JOIN drivers D ON RE.driverId = D.driverId
+        JOIN constructors C ON RE.constructorId = C.constructorId
+        JOIN races RA ON RE.raceId = RA.raceId
+        WHERE RA.year BETWEEN ? AND ?
+          AND C.constructorRef IN ({placeholders(constructor_refs)})
+          AND RA.name IN ({placeholders(gp_names)})
+          AND RE.position IS NOT NULL
+          AND RE.grid > 0
+        ORDER BY RA.year, RA.round, driver_name
+    """
+    df = pd.read_sql_query(sql, con, params=[*years, *constructor_refs, *gp_names])
+    return df.astype({'is_williams': bool})
+
+
+def query_constructor_pit_stops(con: sqlite3.Connection,
+                                years: tuple[int, int] = EXTRACT_YEARS,
+                                gp_names: list[str] = EXTRACT_CIRCUITS,
+                                constructor_refs: list[str] = MIDFIELD_CONSTRUCTORS) -> pd.DataFrame:
+    """
+    processed_data/constructor-pit-stops.csv, from the raw tables (sql/3-constructor-pit-stops).
+
+    Returns:
+    pd.DataFrame: The constructor-pit-stops.csv columns, ordered by year, round, constructor, driver and stop.
+    """
+    sql = f"""
+        SELECT P.raceId AS race_id, R.year AS gp_year, R.name AS gp_name, R.round AS gp_round,
+               P.driverId AS driver_id, D.forename || ' ' || D.surname AS driver_name,
+               C.name AS constructor, C.constructorRef AS constructor_ref, C.constructorRef = 'williams' AS is_williams,
+               P.stop AS stop_number, P.lap AS lap_number, P.time AS time_of_stop, P.duration AS pit_duration,
+               P.milliseconds AS pit_duration_ms, P.milliseconds / 1000.0 AS pit_duration_s
+        FROM pit_stops P
+        JOIN drivers D ON P.driverId = D.driverId
+        JOIN races R ON P.raceId = R.raceId
+        JOIN results RE ON RE.raceId = P.raceId AND RE.driverId = P.driverId
+        JOIN constructors C ON RE.constructorId = C.constructorId
+        WHERE R.year BETWEEN ? AND ?
+          AND C.constructorRef IN ({placeholders(constructor_refs)})
+          AND R.name IN ({placeholders(gp_names)})
+          AND P.milliseconds IS NOT NULL
+        ORDER BY R.year, R.round, constructor, driver_id, stop_number
+    """
+    df = pd.read_sql_query(sql, con, params=[*years, *constructor_refs, *gp_names])
+    return df.astype({'is_williams': bool})
+
+
+def get_driver_levels(con: sqlite3.Connection) -> dict[int, str]:
+    """
+    Returns:
+    dict[int, str]: Driver id to 'rookie' or 'experienced', as labelled in the driver_lap_times extract.
+    """
+    return dict(con.execute('SELECT DISTINCT driver_id, rookie_or_experienced FROM driver_lap_times ORDER BY driver_id').fetchall())
+
+
+def query_driver_lap_times(con: sqlite3.Connection,
+                           years: tuple[int, int] = EXTRACT_YEARS,
+                           gp_names: list[str] = EXTRACT_CIRCUITS,
+                           driver_levels: dict[int, str] = None) -> pd.DataFrame:
+    """
+    processed_data/driver-lap-times.csv, from the raw tables (sql/2-driver-lap-times.sql) - needs the Ergast lap_times
+    table in raw_data/, which this repository does not ship.
+
+    Arguments:
+    driver_levels (dict[int, str]): Driver id to 'rookie' or 'experienced'. Default is get_driver_levels(con) - the
+        Williams drivers of the validated extract.
+
+    Returns:
+    pd.DataFrame: The driver-lap-times.csv columns, ordered by year, round, driver and lap.
+    """
+    if driver_levels is None:
+        driver_levels = get_driver_levels(con)
+    levels = ' '.join(f'WHEN {driver_id} THEN ?' for driver_id in driver_levels)
+    sql = f"""
+        SELECT L.raceId AS race_id, R.year AS gp_year, R.name AS gp_name, R.round AS gp_round,
+               L.driverId AS driver_id, D.forename || ' ' || D.surname AS driver_name,
+               CASE L.driverId {levels} END AS rookie_or_experienced,
+               L.lap AS lap_number, L.time AS lap_time, L.milliseconds AS lap_time_ms
+        FROM lap_times L
+        JOIN drivers D ON L.driverId = D.driverId
+        JOIN races R ON L.raceId = R.raceId
+        WHERE L.driverId IN ({placeholders(driver_levels)})
+          AND R.year BETWEEN ? AND ?
+          AND R.name IN ({placeholders(gp_names)})
+          AND L.milliseconds IS NOT NULL
+        ORDER BY R.year, R.round, driver_name, lap_number
+    """
+    return pd.read_sql_query(sql, con, params=[*driver_levels.values(), *driver_levels, *years, *gp_names])
+
+# -------------------------------------------------------------------------------------------------------- #
+
+# step 3 - KPI aggregations pushed down
+
+def get_filter_clause(filters: dict[str, object]) -> tuple[str, list]:
+    """
+    WHERE clause for the KPI filters - each value a single value or a list, None for no filter.
+
+    Returns:
+    tuple[str, list]: The clause ('' if no filters) and its parameters.
+    """
+    clauses, params = [], []
+    for column, value in filters.items():
+        if value is None:
+            continue
+        values = value if isinstance(value, (list, tuple)) else [value]
+        clauses.append(f'{column} IN ({placeholders(values)})')
+        params.extend(values)
+    return (' AND '.join(clauses), params)
+
+
+def sql_constructor_delta_panel(con: sqlite3.Connection, year: int | list[int] = None, gp_name: str | list[str] = None) -> pd.DataFrame:
+    """
+    src.kpi1.get_constructor_delta_panel on the grid_to_finish table - the same rows, filtered and averaged in SQL.
+    """
+    where, params = get_filter_clause({'gp_year': year, 'gp_name': gp_name})
+    sql = f"""
+        WITH filtered AS (SELECT rowid AS row_number, * FROM grid_to_finish {'WHERE ' + where if where else ''}),
+             constructor_order AS (SELECT constructor_ref, MIN(row_number) AS first_row FROM filtered GROUP BY constructor_ref)
+        SELECT F.constructor_ref, F.gp_year, F.gp_name, AVG(F.grid_delta) AS avg_grid_delta
+        FROM filtered F JOIN constructor_order O ON F.constructor_ref = O.constructor_ref
+        GROUP BY F.constructor_ref, F.gp_year, F.gp_name
+        ORDER BY MIN(O.first_row), F.gp_year, F.gp_name
+    """
+    panel = pd.read_sql_query(sql, con, params=params)
+    panel['gained_or_lost'] = ['lost' if x < 0 else 'gained' for x in panel['avg_grid_delta']]
+    panel['num_places'] = panel['avg_grid_delta'].abs()
+    return panel
+
+
+def sql_laptime_consistency(con: sqlite3.Connection,
+                            experience_level: str = None,
+                            year: int | list[int] = None,
+                            gp_name: str | list[str] = None) -> pd.DataFrame:
+    """
+    src.kpi3.get_laptime_consistency on the driver_lap_times table - counts, sums and sums of squares come back from SQL,
+    as exact integers, and the mean and std are finished in Python.
+    """
+    from src.kpi3 import format_ms
+
+    where, params = get_filter_clause({'rookie_or_experienced': experience_level, 'gp_year': year, 'gp_name': gp_name})
+    sql = f"""
+        SELECT rookie_or_experienced, COUNT(*), SUM(lap_time_ms), SUM(lap_time_ms * lap_time_ms)
+        FROM driver_lap_times
+        WHERE lap_time_ms > 0 {'AND ' + where if where else ''}
+        GROUP BY rookie_or_experienced
+        ORDER BY rookie_or_experienced
+    """
+    rows = con.execute(sql, params).fetchall()
+
+    # n * sum_sq - sum^2 in Python integers - no cancellation error
+    mean_ms = [total / n for _, n, total, _ in rows]
+    std_dev_ms = [((n * total_sq - total * total) / (n * (n - 1))) ** 0.5 if n > 1 else np.nan for _, n, total, total_sq in rows]
+
+    return pd.DataFrame({
+        'experience_level': [level for level, *_ in rows],
+        'mean_ms': mean_ms,
+        'mean_formatted': format_ms(mean_ms),
+        'std_dev_ms': std_dev_ms,
+        'std_dev_formatted': format_ms(std_dev_ms),
+        'n_laps': [n for _, n, *_ in rows],
+    })
+
+# -------------------------------------------------------------------------------------------------------- #
+
+# step 4 - latency against the pandas path
+
+def compare_sql_latency(con: sqlite3.Connection, n_queries: int = 100, seed: int = 0) -> pd.DataFrame:
+    """
+    Time typical KPI queries on the pandas path and pushed down to SQL, checking every pair of results is equal.
+    The pandas path is timed from the CSVs each question reloads - and, separately, from frames already in memory.
+
+    Returns:
+    pd.DataFrame: One row per query type and path - 'query', 'path', 'n_queries', 'total_ms', 'mean_query_ms'.
+    """
+    import random
+    from src.kpi1 import GRID_TO_FINISH_PATH, get_constructor_delta_panel
+    from src.kpi3 import LAP_TIMES_PATH, get_laptime_consistency
+    from src.loader import load_table
+
+    rng = random.Random(seed)
+    df_grid, df_laps = pd.read_csv(GRID_TO_FINISH_PATH), pd.read_csv(LAP_TIMES_PATH)
+    years, gp_names = sorted(df_grid['gp_year'].unique().tolist()), sorted(df_grid['gp_name'].unique().tolist())
+
+    def random_filters() -> dict:
+        return {'year': rng.choice([None, rng.choice(years), rng.sample(years, 2)]),
+                'gp_name': rng.choice([None, rng.choice(gp_names), rng.sample(gp_names, 3)])}
+
+    panel_queries = [random_filters() for _ in range(n_queries)]
+    laptime_queries = [{**random_filters(), 'experience_level': rng.choice([None, 'rookie', 'experienced'])} for _ in range(n_queries)]
+    laptime_queries = [query for query in laptime_queries if not sql_laptime_consistency(con, **query).empty]
+
+    def pandas_extract() -> pd.DataFrame:
+        # the notebook way - reload the raw tables and rejoin them
+        races, drivers = load_table('races'), load_table('drivers')
+        results, constructors = load_table('results'), load_table('constructors')
+        df = results.merge(races, on='raceId').merge(drivers, on='driverId').merge(constructors, on='constructorId', suffixes=('', '_constructor'))
+        return df[df['year'].between(*EXTRACT_YEARS) & df['constructorRef'].isin(MIDFIELD_CONSTRUCTORS) & df['name'].isin(EXTRACT_CIRCUITS)
+                  & df['position'].notna() & (df['grid'] > 0)]
+
+    timings = []
+    def timed(query: str, path: str, run, queries: list) -> list:
+        start = time.perf_counter()
+        results = [run(**query_filters) for query_filters in queries]
+        timings.append({'query': query, 'path': path, 'n_queries': len(queries), 'total_ms': (time.perf_counter() - start) * 1000})
+        return results
+
+    extract_reps = [{}] * 5
+    pandas_rows = timed('grid-to-finish extract', 'pandas (load + merge)', pandas_extract, extract_reps)
+    sql_rows = timed('grid-to-finish extract', 'sql', lambda: query_grid_to_finish(con), extract_reps)
+    assert len(pandas_rows[0]) == len(sql_rows[0])
+
+    in_memory = timed('KPI 1 constructor panel', 'pandas (in memory)', lambda **query: get_constructor_delta_panel(df_grid, **query), panel_queries)
+    timed('KPI 1 constructor panel', 'pandas (read csv)', lambda **query: get_constructor_delta_panel(pd.read_csv(GRID_TO_FINISH_PATH), **query), panel_queries)
+    pushed = timed('KPI 1 constructor panel', 'sql', lambda **query: sql_constructor_delta_panel(con, **query), panel_queries)
+    for expected, actual in zip(in_memory, pushed):
+        pd.testing.assert_frame_equal(expected, actual, check_dtype=False)
+
+    in_memory = timed('KPI 3 lap time consistency', 'pandas (in memory)', lambda **query: get_laptime_consistency(df_laps, verbose=False, **query), laptime_queries)
+    timed('KPI 3 lap time consistency', 'pandas (read csv)', lambda **query: get_laptime_consistency(pd.read_csv(LAP_TIMES_PATH), verbose=False, **query), laptime_queries)
+    pushed = timed('KPI 3 lap time consistency', 'sql', lambda **query: sql_laptime_consistency(con, **query), laptime_queries)
+    for expected, actual in zip(in_memory, pushed):
+        pd.testing.assert_frame_equal(expected, actual, check_dtype=False, check_exact=False, rtol=1e-9)
+
+    df_times = pd.DataFrame(timings)
+    df_times['mean_query_ms'] = df_times['total_ms'] / df_times['n_queries']
+    return df_times.round(3)
+
+
+if __name__ == '__main__':
+    start = time.perf_counter()
+    built = build_database()
+    print(f"Loaded {len(built)} tables into {SQL_DB_PATH} in {time.perf_counter() - start:.2f}s (up-to-date tables are skipped)\n")
+
+    con = connect()
+
+    # the BigQuery extracts, reproduced from the raw tables
+    keys = ['race_id', 'driver_name', 'constructor_ref']
+    expected = pd.read_csv('processed_data/grid-to-finish.csv').sort_values(keys).reset_index(drop=True)
+    actual = query_grid_to_finish(con).sort_values(keys).reset_index(drop=True)
+    pd.testing.assert_frame_equal(expected, actual[expected.columns], check_dtype=False)
+
+    keys = ['race_id', 'driver_id', 'stop_number']
+    expected = pd.read_csv('processed_data/constructor-pit-stops.csv').sort_values(keys).reset_index(drop=True)
+    actual = query_constructor_pit_stops(con).sort_values(keys).reset_index(drop=True)
+    pd.testing.assert_frame_equal(expected, actual[expected.columns], check_dtype=False)
+    print("grid-to-finish.csv and constructor-pit-stops.csv reproduced from raw_data/ - identical rows.\n")
+
+    print("Latency of typical KPI queries - pandas vs pushed down to SQLite (same results):\n")
+    print(compare_sql_latency(con).to_string(index=False))
+    con.close()
@@ -0,0 +1,285 @@
+import os
+import time
+from functools import partial
+import numpy as np
+import pandas as pd
+
+from src.ingest import FASTF1_CACHE_DIR, get_session_path, ingest_sessions, read_session_store
+from src.kpi2 import MIDFIELD_TEAMS
+
+"""
+Telemetry Alignment - Williams vs the fastest midfield lap, on a common distance grid
+
+KPI 2 loads sessions with session.load(laps=True, telemetry=False), so it can only say how much time Williams lost
+in each of three sectors. Car data (speed, throttle, brake against time) says where within the sector it went.
+
+Steps:
+1. For each session, load the fastest Williams lap and the fastest lap of any other midfield team, with car data
+    and distance along the lap (FastF1's get_car_data().add_distance()).
+2. Resample time, speed, throttle and brake of both laps onto one distance grid (every DISTANCE_STEP_M metres)
+    in one vectorised interpolation: the traces are laid end to end with a distance offset per trace, so a single
+    searchsorted finds the surrounding samples of every grid point of every trace, for every channel at once.
+3. Delta time at each grid point = Williams' time to reach it - the rival's, so the trace accumulates to the lap
+    time gap; Williams' sector times mark which sector every grid point is in.
+4. Sessions are aligned across a process pool and each aligned session is stored as parquet in cache/telemetry/
+    (through src.ingest, keyed by year, event and session type) - a stored session is never downloaded or aligned again.
+
+Run from the project root: python -m src.telemetry (aligns the KPI 2 qualifying sessions - needs fastf1 and network
+access, or a populated FastF1 cache)
+"""
+
+TELEMETRY_STORE_DIR = 'cache/telemetry'
+
+# spacing of the common distance grid, in metres
+DISTANCE_STEP_M = 5.0
+
+# car data channels resampled onto the grid - Time in seconds from the start of the lap
+TELEMETRY_CHANNELS = ['Time', 'Speed', 'Throttle', 'Brake']
+
+TEAM = 'Williams'
+
+# -------------------------------------------------------------------------------------------------------- #
+
+# step 1 - car data of the two fastest laps
+
+def load_fastest_lap_telemetry(year: int, event: str, session_type: str,
+                               team: str = TEAM,
+                               rivals: list[str] = MIDFIELD_TEAMS,
+                               fastf1_cache_dir: str = FASTF1_CACHE_DIR,
+                               offline: bool = False) -> pd.DataFrame:
+    """
+    Load car data for the fastest lap of team and the fastest lap of any rival team in one session.
+
+    Arguments:
+    year (int): The season, e.g. 2019.
+    event (str): The GP name, e.g. 'Monaco Grand Prix'.
+    session_type (str): The FastF1 session identifier, e.g. 'Q'.
+    team (str): Team to compare. Default is 'Williams'.
+    rivals (list[str]): Teams the rival lap may come from - team itself is left out. Default is MIDFIELD_TEAMS.
+    fastf1_cache_dir (str): The FastF1 cache directory. Default is 'cache/fastf1'. None disables the cache.
+    offline (bool): If True, only use data already in the FastF1 cache - never download. Default is False.
+
+    Returns:
+    pd.DataFrame: One row per car data sample of both laps - 'role' ('team' or 'rival'), 'Team', 'Driver', 'LapTime',
+    'Sector1Time', 'Sector2Time' (seconds), 'Distance' (metres) and TELEMETRY_CHANNELS. Empty if either lap is missing.
+    """
+    import fastf1 # imported lazily - heavy, and each worker process imports it once
+
+    if fastf1_cache_dir is not None:
+        os.makedirs(fastf1_cache_dir, exist_ok=True)
+        fastf1.Cache.enable_cache(fastf1_cache_dir)
+        fastf1.Cache.offline_mode(offline)
+
+    session = fastf1.get_session(year, event, session_type)
+    session.load(laps=True, telemetry=True, weather=False, messages=False)
+
+    laps = session.laps
+    candidates = {'team': laps[laps['Team'] == team],
+                  'rival': laps[laps['Team'].isin([rival for rival in rivals if rival != team])]}
+
+    traces = []
+    for role, role_laps in candidates.items():
+        lap = role_laps.pick_fastest()
+        if lap is None or pd.isna(lap['LapTime']):
+            return pd.DataFrame()
+
+        car_data = lap.get_car_data().add_distance()
+        traces.append(pd.DataFrame({
+            'role': role,
+            'Team': lap['Team'],
+            'Driver': lap['Driver'],
+            'LapTime': lap['LapTime'].total_seconds(),
+            'Sector1Time': lap['Sector1Time'].total_seconds(),
+            'Sector2Time': lap['Sector2Time'].total_seconds(),
+            'Distance': car_data['Distance'].to_numpy(dtype='float64'),
+            'Time': car_data['Time'].dt.total_seconds().to_numpy(),
+            'Speed': car_data['Speed'].to_numpy(dtype='float64'),
+            'Throttle': car_data['Throttle'].to_numpy(dtype='float64'),
+            'Brake': car_data['Brake'].to_numpy(dtype='float64'),
+        }))
+    return pd.concat(traces, ignore_index=True)
+
+# -------------------------------------------------------------------------------------------------------- #
+
+# step 2 - every trace and channel onto one grid, in one interpolation
+
+def interpolate_traces(grid: np.ndarray, distance: np.ndarray, values: np.ndarray, trace: np.ndarray) -> np.ndarray:
+    """
+    Linear interpolation of several traces onto the same grid, as np.interp per trace and channel but in one pass.
+
+    Arguments:
+    grid (np.ndarray): Distances to resample at, ascending.
+    distance (np.ndarray): Distance of every sample - ascending within each trace.
+    values (np.ndarray): (samples, channels) values of every sample.
+    trace (np.ndarray): Trace number of every sample, 0 to traces - 1, in ascending order - every trace needs 2+ samples.
+
+    Returns:
+    np.ndarray: (traces, len(grid), channels) resampled values - held flat beyond either end of a trace, as np.interp.
+    """
+    sizes = np.bincount(trace)
+    ends = np.cumsum(sizes)
+    starts = ends - sizes
+
+    # lay the traces end to end - each one shifted past the end of the previous, so one sorted array holds them all
+    span = max(distance.max(), grid.max()) - min(distance.min(), grid.min()) + 1
+    shifted = distance + trace * span
+    queries = (grid[np.newaxis, :] + (np.arange(len(sizes)) * span)[:, np.newaxis])
+
+    # index of the sample just after every query, kept inside its own trace
+    after = np.searchsorted(shifted, queries, side='right')
+    after = np.clip(after, starts[:, np.newaxis] + 1, ends[:, np.newaxis] - 1)
+    before = after - 1
+
+    gap = shifted[after] - shifted[before]
+    weight = np.clip(np.divide(queries - shifted[before], gap, out=np.zeros(queries.shape), where=gap > 0), 0, 1)
+    return values[before] + weight[:, :, np.newaxis] * (values[after] - values[before])
+
+# -------------------------------------------------------------------------------------------------------- #
+
+# step 3 - delta time along the lap
+
+def align_laps(telemetry: pd.DataFrame, step_m: float = DISTANCE_STEP_M) -> pd.DataFrame:
+    """
+    Resample the team and rival laps of one session onto a common distance grid and compute the delta time trace.
+
+    Arguments:
+    telemetry (pd.DataFrame): Output of load_fastest_lap_telemetry.
+    step_m (float): Grid spacing in metres. Default is DISTANCE_STEP_M.
+
+    Returns:
+    pd.DataFrame: One row per grid point - 'distance_m', 'sector' (from the team lap's sector times, or the rival lap's if
+    the team lap has none), '<channel>_team' and
+    '<channel>_rival' for each of time_s, speed, throttle and brake, 'delta_s' (team - rival time to reach the point, so
+    positive = Williams behind), and the 'team_driver', 'rival_team' and 'rival_driver' of the two laps.
+    """
+    telemetry = telemetry.assign(trace=(telemetry['role'] == 'rival').astype('int64')).sort_values(['trace', 'Distance'], kind='stable')
+    trace = telemetry['trace'].to_numpy()
+    distance = telemetry['Distance'].to_numpy(dtype='float64')
+
+    # the grid covers the distance both laps recorded
+    lap_ends = [distance[trace == i].max() for i in (0, 1)]
+    grid = np.arange(0, min(lap_ends), step_m)
+    resampled = interpolate_traces(grid, distance, telemetry[TELEMETRY_CHANNELS].to_numpy(dtype='float64'), trace)
+
+    team, rival = telemetry[trace == 0].iloc[0], telemetry[trace == 1].iloc[0]
+
+    # sector boundaries in metres, where the team lap's clock reaches its sector times. A lap without sector times
+    # (NaT, e.g. a deleted lap) would put every point in sector 1 - the boundaries are the same for both laps of the
+    # session, so take them from the rival lap instead
+    sector_ends = np.full(2, np.nan)
+    for i, lap in enumerate([team, rival]):
+        if np.isnan(sector_ends).any():
+            sector_ends = np.interp([lap['Sector1Time'], lap['Sector1Time'] + lap['Sector2Time']], resampled[i, :, 0], grid)
+    if np.isnan(sector_ends).any():
+        raise ValueError(f"Neither {team['Driver']}'s nor {rival['Driver']}'s lap has sector times - cannot label sectors")
+
+    aligned = pd.DataFrame({'distance_m': grid, 'sector': 1 + np.searchsorted(sector_ends, grid, side='right')})
+    for i, role in enumerate(['team', 'rival']):
+        for c, channel in enumerate(TELEMETRY_CHANNELS):
+            aligned[f"{'time_s' if channel == 'Time' else channel.lower()}_{role}"] = resampled[i, :, c]
+    aligned['delta_s'] = aligned['time_s_team'] - aligned['time_s_rival']
+
+    aligned['team_driver'] = team['Driver']
+    aligned['rival_team'] = rival['Team']
+    aligned['rival_driver'] = rival['Driver']
+    return aligned
+
+
+def load_aligned_telemetry(year: int, event: str, session_type: str, load_telemetry=None, step_m: float = DISTANCE_STEP_M) -> pd.DataFrame:
+    """
+    Session loader for src.ingest: load both laps' car data and align them.
+
+    Arguments:
+    year, event, session_type: The session, as in load_fastest_lap_telemetry.
+    load_telemetry (callable): Loader taking (year, event, session_type) and returning car data in the shape of
+        load_fastest_lap_telemetry. Default is load_fastest_lap_telemetry.
+    step_m (float): Grid spacing in metres. Default is DISTANCE_STEP_M.
+
+    Returns:
+    pd.DataFrame: align_laps output with added 'Year' and 'Race' columns - empty if either lap has no data.
+    """
+    telemetry = (load_telemetry or load_fastest_lap_telemetry)(year, event, session_type)
+    if telemetry.empty:
+        return pd.DataFrame()
+
+    aligned = align_laps(telemetry, step_m)
+    aligned['Year'] = year
+    aligned['Race'] = event
+    return aligned
+
+# -------------------------------------------------------------------------------------------------------- #
+
+# step 4 - batches of sessions, in parallel, stored on disk
+
+def align_sessions(sessions: list[tuple[int, str, str]],
+                   store_dir: str = TELEMETRY_STORE_DIR,
+                   load_telemetry=None,
+                   step_m: float = DISTANCE_STEP_M,
+                   max_workers: int = None,
+                   refresh: bool = False) -> pd.DataFrame:
+    """
+    Align every session missing from the telemetry store across a process pool (src.ingest.ingest_sessions).
+
+    Arguments:
+    sessions (list[tuple[int, str, str]]): (year, event, session_type) for each session, e.g. (2019, 'Monaco Grand Prix', 'Q').
+    store_dir (str): The aligned telemetry store. Default is 'cache/telemetry'.
+    load_telemetry (callable): Car data loader, as in load_aligned_telemetry - must be picklable. Default is load_fastest_lap_telemetry.
+    step_m (float): Grid spacing in metres. Default is DISTANCE_STEP_M.
+    max_workers (int): Number of worker processes - 1 aligns sessions in this process. Default is one per CPU.
+    refresh (bool): If True, realign sessions already in the store. Default is False.
+
+    Returns:
+    pd.DataFrame: The ingest_sessions report - one row per session, 'rows' being grid points.
+    """
+    loader = partial(load_aligned_telemetry, load_telemetry=load_telemetry, step_m=step_m)
+    return ingest_sessions(sessions, store_dir=store_dir, load_laps=loader, max_workers=max_workers, refresh=refresh, verbose=False)
+
+
+def read_aligned_telemetry(year: int = None, event: str = None, session_type: str = 'Q', store_dir: str = TELEMETRY_STORE_DIR) -> pd.DataFrame:
+    """
+    Aligned telemetry from the store - one session if year and event are given, otherwise every stored session
+    (of session_type, and of year if given).
+    """
+    if year is not None and event is not None:
+        return pd.read_parquet(get_session_path(year, event, session_type, store_dir))
+    return read_session_store(store_dir, years=None if year is None else [year], session_type=session_type)
+
+
+def get_sector_losses(aligned: pd.DataFrame, window_m: float = 100.0) -> pd.DataFrame:
+    """
+    Where in each sector the time went - per session and sector, the time lost over the sector and the window_m stretch
+    with the largest loss.
+
+    Returns:
+    pd.DataFrame: 'Year', 'Race', 'sector', 'delta_s' (lost over the sector), 'worst_from_m', 'worst_to_m' and 'worst_delta_s'.
+    """
+    rows = []
+    for (year, race), session in aligned.groupby(['Year', 'Race'], sort=False):
+        distance, delta, sectors = session['distance_m'].to_numpy(), session['delta_s'].to_numpy(), session['sector'].to_numpy()
+        step = max(1, int(round(window_m / (distance[1] - distance[0]))))
+        window_loss = np.full(len(delta), -np.inf)
+        window_loss[:len(delta) - step] = delta[step:] - delta[:-step] # loss over the window starting at each point
+
+        for sector in np.unique(sectors):
+            start, end = np.flatnonzero(sectors == sector)[[0, -1]]
+            worst = start + window_loss[start:end + 1].argmax()
+            rows.append({'Year': year, 'Race': race, 'sector': sector,
+                         'delta_s': delta[end] - (delta[start - 1] if start > 0 else 0.0),
+                         'worst_from_m': distance[worst], 'worst_to_m': distance[min(worst + step, len(distance) - 1)],
+                         'worst_delta_s': window_loss[worst] if np.isfinite(window_loss[worst]) else np.nan})
+    return pd.DataFrame(rows)
+
+
+if __name__ == '__main__':
+    from src.kpi2 import circuit_type
+
+    kpi2_sessions = [(year, race, 'Q') for year in [2018, 2019] for race in circuit_type.keys()]
+
+    start = time.perf_counter()
+    df_report = align_sessions(kpi2_sessions)
+    print(df_report.drop(columns=['path', 'error']).to_string(index=False))
+    print(f"\n{len(kpi2_sessions)} sessions in {time.perf_counter() - start:.1f}s (stored sessions are skipped)\n")
+
+    aligned = read_aligned_telemetry(session_type='Q')
+    print("Where Williams lost the most time in each sector, per session (positive = Williams behind):\n")
+    print(get_sector_losses(aligned).round(3).to_string(index=False))
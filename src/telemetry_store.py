@@ -0,0 +1,399 @@
+import json
+import os
+import shutil
+import time
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+import numpy as np
+import pandas as pd
+
+from src.ingest import FASTF1_CACHE_DIR
+
+"""
+Telemetry Store - full-session car and position data on disk, partitioned by (year, event, session, driver), read in chunks
+
+processed_data/all-laps.csv holds one row per lap and fits in a pandas frame. Car data does not: a driver's qualifying
+session is ~30-50k samples, so every session since 2018 runs to hundreds of millions of samples. This store keeps each
+channel of each partition as its own .npy file and reads it memory-mapped, so a scan only ever holds one chunk in memory.
+
+Steps:
+1. For each session, load every driver's car and position data for the whole session with FastF1 and tag every sample
+    with its lap number.
+2. Write one partition per driver - <store>/<year>/<event>_<session>/<driver>/ with one .npy per channel (float32, lap
+    number int16) and a partition.json with the keys and sample count. A partition is written to a temporary directory
+    and renamed into place, so an interrupted run never leaves a partial one. Once every driver is written, the session
+    gets a _SESSION.json marker listing them - a session is only complete, and only skipped by later runs, once the marker
+    exists. Sessions run across a process pool and complete sessions are skipped, as in src.ingest.
+3. iter_partitions() finds partitions of complete sessions by year, event, session type and driver, and opens their
+    channels with np.load(mmap_mode='r') - nothing is read until it is sliced.
+4. iter_chunks() streams every partition in slices of at most chunk_samples samples, so a reducer (mini-sector, corner,
+    speed trap statistics) processes the store with memory bounded by the chunk size, not the store size.
+    get_speed_trap_stats() is one such reducer.
+
+Run from the project root: python -m src.telemetry_store (stores the KPI 2 qualifying sessions - needs fastf1 and network
+access, or a populated FastF1 cache - then times a full scan in samples per second)
+"""
+
+TELEMETRY_STORE_DIR = 'cache/telemetry_store'
+
+# channels stored per partition, with their on-disk dtypes
+CHANNEL_DTYPES = {
+    'SessionTime': 'float64', # seconds - float32 would lose milliseconds over a session
+    'LapNumber': 'int16',
+    'Distance': 'float32', # metres along the lap
+    'Speed': 'float32',
+    'RPM': 'float32',
+    'nGear': 'float32',
+    'Throttle': 'float32',
+    'Brake': 'float32',
+    'DRS': 'float32',
+    'X': 'float32',
+    'Y': 'float32',
+}
+
+# written into a session's directory after all of its partitions - the session is complete once it exists
+SESSION_MARKER = '_SESSION.json'
+
+# samples read per chunk - 1M samples x 11 channels is ~45 MB
+CHUNK_SAMPLES = 1 << 20
+
+# -------------------------------------------------------------------------------------------------------- #
+
+# step 1 - one session's car data, per driver
+
+def load_session_car_data(year: int, event: str, session_type: str,
+                          fastf1_cache_dir: str = FASTF1_CACHE_DIR,
+                          offline: bool = False) -> dict[str, pd.DataFrame]:
+    """
+    Load every driver's merged car and position data for a whole session with FastF1.
+
+    Arguments:
+    year (int): The season, e.g. 2019.
+    event (str): The GP name, e.g. 'Monaco Grand Prix'.
+    session_type (str): The FastF1 session identifier, e.g. 'Q'.
+    fastf1_cache_dir (str): The FastF1 cache directory. Default is 'cache/fastf1'. None disables the cache.
+    offline (bool): If True, only use data already in the FastF1 cache - never download. Default is False.
+
+    Returns:
+    dict[str, pd.DataFrame]: Driver code to that driver's samples, with the CHANNEL_DTYPES columns - 'SessionTime' in seconds,
+    'Distance' from the start of each lap.
+    """
+    import fastf1 # imported lazily - heavy, and each worker process imports it once
+
+    if fastf1_cache_dir is not None:
+        os.makedirs(fastf1_cache_dir, exist_ok=True)
+        fastf1.Cache.enable_cache(fastf1_cache_dir)
+        fastf1.Cache.offline_mode(offline)
+
+    session = fastf1.get_session(year, event, session_type)
+    session.load(laps=True, telemetry=True, weather=False, messages=False)
+
+    car_data = {}
+    for driver in session.laps['Driver'].unique():
+        laps = session.laps.pick_drivers(driver)
+        telemetry = laps.get_telemetry() # every lap, position and car data merged
+        session_time = telemetry['SessionTime'].dt.total_seconds().to_numpy()
+
+        # lap number of every sample - the last lap started at or before it
+        lap_start = laps['LapStartTime'].dt.total_seconds().to_numpy()
+        lap_index = np.searchsorted(lap_start, session_time, side='right') - 1
+
+        samples = telemetry[[column for column in CHANNEL_DTYPES if column in telemetry.columns and column not in ['SessionTime', 'LapNumber']]].copy()
+        samples['SessionTime'] = session_time
+        samples['LapNumber'] = laps['LapNumber'].to_numpy()[np.clip(lap_index, 0, None)]
+        samples['Brake'] = samples['Brake'].astype('float32')
+        samples['Distance'] = samples['Distance'] - samples.groupby('LapNumber')['Distance'].transform('min') # from the start of each lap
+        car_data[driver] = samples
+    return car_data
+
+# -------------------------------------------------------------------------------------------------------- #
+
+# step 2 - one directory per partition, one .npy per channel
+
+def get_session_dir(year: int, event: str, session_type: str, store_dir: str = TELEMETRY_STORE_DIR) -> str:
+    """
+    Returns:
+    str: The directory of one session's partitions, e.g. cache/telemetry_store/2019/monaco-grand-prix_Q
+    """
+    event_slug = event.lower().replace(' ', '-')
+    return os.path.join(store_dir, str(year), f'{event_slug}_{session_type}')
+
+
+def get_partition_dir(year: int, event: str, session_type: str, driver: str, store_dir: str = TELEMETRY_STORE_DIR) -> str:
+    """
+    Returns:
+    str: The directory of one partition, e.g. cache/telemetry_store/2019/monaco-grand-prix_Q/RUS
+    """
+    return os.path.join(get_session_dir(year, event, session_type, store_dir), driver)
+
+
+def read_session_marker(session_dir: str) -> dict:
+    """
+    Returns:
+    dict: The session's _SESSION.json - 'year', 'event', 'session_type', 'drivers' and 'samples' - or None if the
+    session is missing or was never completed.
+    """
+    path = os.path.join(session_dir, SESSION_MARKER)
+    if not os.path.exists(path):
+        return None
+    with open(path) as file:
+        return json.load(file)
+
+
+def write_partition(samples: pd.DataFrame, year: int, event: str, session_type: str, driver: str,
+                    store_dir: str = TELEMETRY_STORE_DIR) -> str:
+    """
+    Write one driver's samples as a partition - replacing any existing one.
+
+    Arguments:
+    samples (pd.DataFrame): The driver's samples, with the CHANNEL_DTYPES columns - missing channels are not stored.
+    year, event, session_type, driver: The partition keys.
+    store_dir (str): The telemetry store. Default is 'cache/telemetry_store'.
+
+    Returns:
+    str: The partition directory.
+    """
+    path = get_partition_dir(year, event, session_type, driver, store_dir)
+    tmp_path = path + '.tmp'
+    shutil.rmtree(tmp_path, ignore_errors=True)
+    os.makedirs(tmp_path)
+
+    channels = [channel for channel in CHANNEL_DTYPES if channel in samples.columns]
+    for channel in channels:
+        np.save(os.path.join(tmp_path, f'{channel}.npy'), samples[channel].to_numpy(dtype=CHANNEL_DTYPES[channel]))
+    with open(os.path.join(tmp_path, 'partition.json'), 'w') as file:
+        json.dump({'year': year, 'event': event, 'session_type': session_type, 'driver': driver,
+                   'samples': len(samples), 'channels': channels}, file)
+
+    shutil.rmtree(path, ignore_errors=True)
+    os.replace(tmp_path, path)
+    return path
+
+
+def _store_session(year: int, event: str, session_type: str, store_dir: str, load_car_data) -> dict:
+    """
+    Worker task: load one session's car data, write a partition per driver, then the session marker, and return timing stats.
+    """
+    start = time.perf_counter()
+    try:
+        car_data = load_car_data(year, event, session_type)
+    except Exception as error: # one bad session should not stop the rest of the batch
+        return {'status': 'failed', 'drivers': 0, 'samples': 0, 'load_s': time.perf_counter() - start, 'error': repr(error)}
+
+    # a re-stored session is incomplete until its new marker is written - drop the old one first
+    session_dir = get_session_dir(year, event, session_type, store_dir)
+    marker_path = os.path.join(session_dir, SESSION_MARKER)
+    if os.path.exists(marker_path):
+        os.remove(marker_path)
+
+    for driver, samples in car_data.items():
+        write_partition(samples, year, event, session_type, driver, store_dir)
+
+    if car_data: # an empty session is retried by the next run, as before
+        with open(marker_path + '.tmp', 'w') as file:
+            json.dump({'year': year, 'event': event, 'session_type': session_type, 'drivers': sorted(car_data),
+                       'samples': sum(len(samples) for samples in car_data.values())}, file)
+        os.replace(marker_path + '.tmp', marker_path)
+
+    return {'status': 'loaded' if car_data else 'empty', 'drivers': len(car_data),
+            'samples': sum(len(samples) for samples in car_data.values()), 'load_s': time.perf_counter() - start, 'error': None}
+
+
+def store_sessions(sessions: list[tuple[int, str, str]],
+                   store_dir: str = TELEMETRY_STORE_DIR,
+                   load_car_data = None,
+                   max_workers: int = None,
+                   refresh: bool = False) -> pd.DataFrame:
+    """
+    Store the car data of every session missing from the store, across a process pool.
+
+    Arguments:
+    sessions (list[tuple[int, str, str]]): (year, event, session_type) for each session, e.g. (2019, 'Monaco Grand Prix', 'Q').
+    store_dir (str): The telemetry store. Default is 'cache/telemetry_store'.
+    load_car_data (callable): Loader taking (year, event, session_type) and returning a dict of driver to samples, as
+        load_session_car_data. Must be picklable. Default is load_session_car_data.
+    max_workers (int): Number of worker processes - 1 stores sessions in this process. Default is one per CPU.
+    refresh (bool): If True, reload sessions already stored. Default is False. Sessions without a marker - never
+        stored, or interrupted part way - are always (re)loaded.
+
+    Returns:
+    pd.DataFrame: One row per session - 'year', 'event', 'session_type', 'status' ('loaded', 'skipped', 'empty' or 'failed'),
+    'drivers', 'samples', 'load_s', 'samples_per_s' and 'error'.
+    """
+    if load_car_data is None:
+        load_car_data = load_session_car_data
+
+    report, to_load = [], []
+    for year, event, session_type in sessions:
+        row = {'year': year, 'event': event, 'session_type': session_type}
+        marker = read_session_marker(get_session_dir(year, event, session_type, store_dir))
+        if not refresh and marker is not None:
+            row.update({'status': 'skipped', 'drivers': len(marker['drivers']), 'samples': marker['samples'],
+                        'load_s': 0.0, 'error': None})
+        else:
+            to_load.append(row)
+        report.append(row)
+
+    task = partial(_store_session, store_dir=store_dir, load_car_data=load_car_data)
+    args = [(row['year'], row['event'], row['session_type']) for row in to_load]
+
+    if max_workers == 1 or len(to_load) <= 1:
+        results = (task(*arg) for arg in args)
+        executor = None
+    else:
+        executor = ProcessPoolExecutor(max_workers=max_workers)
+        results = executor.map(task, *zip(*args)) if args else iter([])
+
+    try:
+        for row, stats in zip(to_load, results):
+            row.update(stats)
+    finally:
+        if executor is not None:
+            executor.shutdown()
+
+    df_report = pd.DataFrame(report)[['year', 'event', 'session_type', 'status', 'drivers', 'samples', 'load_s', 'error']]
+    df_report['samples_per_s'] = (df_report['samples'] / df_report['load_s']).where(df_report['load_s'] > 0).round(0)
+    df_report['load_s'] = df_report['load_s'].round(3)
+    return df_report[['year', 'event', 'session_type', 'status', 'drivers', 'samples', 'load_s', 'samples_per_s', 'error']]
+
+# -------------------------------------------------------------------------------------------------------- #
+
+# step 3 - partitions, memory-mapped
+
+def iter_partitions(store_dir: str = TELEMETRY_STORE_DIR,
+                    years: list[int] = None,
+                    events: list[str] = None,
+                    session_type: str = None,
+                    drivers: list[str] = None,
+                    channels: list[str] = None):
+    """
+    Iterate over the stored partitions matching the filters, in year, session and driver order. Only complete sessions
+    are read - those with a marker - and only the drivers it lists.
+
+    Arguments:
+    store_dir (str): The telemetry store. Default is 'cache/telemetry_store'.
+    years (list[int]): Seasons to read (optional - default is every season).
+    events (list[str]): GP names to read, e.g. ['Monaco Grand Prix'] (optional).
+    session_type (str): Only read sessions of this type, e.g. 'Q' (optional).
+    drivers (list[str]): Driver codes to read (optional).
+    channels (list[str]): Channels to open (optional - default is every stored channel).
+
+    Yields:
+    tuple[dict, dict[str, np.memmap]]: The partition.json keys ('year', 'event', 'session_type', 'driver', 'samples',
+    'channels'), and each channel opened memory-mapped (read-only).
+    """
+    if not os.path.isdir(store_dir):
+        return
+    event_slugs = None if events is None else {event.lower().replace(' ', '-') for event in events}
+
+    for year_dir in sorted(os.listdir(store_dir)):
+        if years is not None and int(year_dir) not in years:
+            continue
+        for session_dir in sorted(os.listdir(os.path.join(store_dir, year_dir))):
+            event_slug, _, stored_type = session_dir.rpartition('_')
+            if (event_slugs is not None and event_slug not in event_slugs) or (session_type is not None and stored_type != session_type):
+                continue
+            marker = read_session_marker(os.path.join(store_dir, year_dir, session_dir))
+            if marker is None: # never completed - a run was interrupted part way through writing its drivers
+                continue
+            for driver in marker['drivers']:
+                path = os.path.join(store_dir, year_dir, session_dir, driver)
+                if drivers is not None and driver not in drivers:
+                    continue
+
+                with open(os.path.join(path, 'partition.json')) as file:
+                    meta = json.load(file)
+                opened = [channel for channel in meta['channels'] if channels is None or channel in channels]
+                yield meta, {channel: np.load(os.path.join(path, f'{channel}.npy'), mmap_mode='r') for channel in opened}
+
+# -------------------------------------------------------------------------------------------------------- #
+
+# step 4 - bounded-memory streaming, and a reducer over it
+
+def iter_chunks(chunk_samples: int = CHUNK_SAMPLES, **filters):
+    """
+    Stream the matching partitions in slices of at most chunk_samples samples.
+
+    Arguments:
+    chunk_samples (int): Most samples per chunk. Default is CHUNK_SAMPLES.
+    **filters: store_dir, years, events, session_type, drivers and channels, as in iter_partitions.
+
+    Yields:
+    tuple[dict, dict[str, np.ndarray]]: The partition keys, and the chunk of each channel - read into memory, so a
+    reducer can hold on to it without keeping the file open.
+    """
+    for meta, channels in iter_partitions(**filters):
+        for start in range(0, meta['samples'], chunk_samples):
+            yield meta, {channel: np.array(values[start:start + chunk_samples]) for channel, values in channels.items()}
+
+
+def get_speed_trap_stats(chunk_samples: int = CHUNK_SAMPLES, **filters) -> pd.DataFrame:
+    """
+    Speed statistics per partition from one streaming pass - memory bounded by chunk_samples.
+
+    Arguments:
+    chunk_samples (int): Most samples per chunk. Default is CHUNK_SAMPLES.
+    **filters: store_dir, years, events, session_type and drivers, as in iter_partitions.
+
+    Returns:
+    pd.DataFrame: One row per partition - 'year', 'event', 'session_type', 'driver', 'samples', 'top_speed_kmh',
+    'mean_speed_kmh', 'full_throttle_share' (throttle at 99%+) and 'braking_share'.
+    """
+    totals = {} # running samples, top speed, speed sum, full throttle and braking samples per partition
+    for meta, chunk in iter_chunks(chunk_samples, channels=['Speed', 'Throttle', 'Brake'], **filters):
+        key = (meta['year'], meta['event'], meta['session_type'], meta['driver'])
+        samples, top_speed, speed_sum, full_throttle, braking = totals.get(key, (0, -np.inf, 0.0, 0, 0))
+        totals[key] = (samples + len(chunk['Speed']),
+                       max(top_speed, float(chunk['Speed'].max())),
+                       speed_sum + float(chunk['Speed'].sum(dtype='float64')),
+                       full_throttle + int((chunk['Throttle'] >= 99).sum()),
+                       braking + int((chunk['Brake'] > 0).sum()))
+
+    stats = pd.DataFrame([(*key, *running) for key, running in totals.items()],
+                         columns=['year', 'event', 'session_type', 'driver', 'samples', 'top_speed_kmh', 'speed_sum', 'full_throttle', 'braking'])
+    stats['mean_speed_kmh'] = stats['speed_sum'] / stats['samples']
+    stats['full_throttle_share'] = stats['full_throttle'] / stats['samples']
+    stats['braking_share'] = stats['braking'] / stats['samples']
+    return stats[['year', 'event', 'session_type', 'driver', 'samples', 'top_speed_kmh', 'mean_speed_kmh', 'full_throttle_share', 'braking_share']]
+
+
+def benchmark_scan(chunk_samples: int = CHUNK_SAMPLES, channels: list[str] = ['Speed'], **filters) -> dict:
+    """
+    Time a full streaming scan of the matching partitions.
+
+    Returns:
+    dict: 'samples', 'chunks', 'seconds', 'samples_per_s' and 'mb_per_s' (bytes read from the channels).
+    """
+    samples = chunks = n_bytes = 0
+    checksum = 0.0
+    start = time.perf_counter()
+    for meta, chunk in iter_chunks(chunk_samples, channels=channels, **filters):
+        samples += len(next(iter(chunk.values())))
+        chunks += 1
+        n_bytes += sum(values.nbytes for values in chunk.values())
+        checksum += sum(float(values.sum(dtype='float64')) for values in chunk.values()) # touch every value
+    seconds = time.perf_counter() - start
+    return {'samples': samples, 'chunks': chunks, 'seconds': round(seconds, 3),
+            'samples_per_s': round(samples / seconds) if seconds else None, 'mb_per_s': round(n_bytes / seconds / 2**20, 1) if seconds else None}
+
+
+if __name__ == '__main__':
+    from src.kpi2 import circuit_type
+
+    kpi2_sessions = [(year, race, 'Q') for year in [2018, 2019] for race in circuit_type.keys()]
+
+    df_report = store_sessions(kpi2_sessions)
+    print(df_report.drop(columns=['error']).to_string(index=False))
+    print(f"\n{df_report['samples'].sum():,} samples in {sum(1 for _ in iter_partitions(session_type='Q'))} partitions\n")
+
+    stats = get_speed_trap_stats(session_type='Q')
+    print("Top speed and full throttle share per session (median over drivers):\n")
+    print(stats.groupby(['year', 'event'])[['top_speed_kmh', 'full_throttle_share']].median().round(3).to_string())
+
+    # scan throughput - one channel and every channel, at a few chunk sizes
+    print()
+    for channels in [['Speed'], list(CHANNEL_DTYPES)]:
+        for chunk_samples in [1 << 16, 1 << 20]:
+            result = benchmark_scan(chunk_samples, channels=channels, session_type='Q')
+            print(f"{len(channels)} channel(s), chunks of {chunk_samples:,}: {result['samples_per_s']:,} samples/s "
+                  f"({result['mb_per_s']} MB/s, {result['chunks']} chunks)")
@@ -0,0 +1,321 @@
+import os
+import numpy as np
+import pandas as pd
+
+from src.fastf1_times import decode_time_columns
+
+"""
+Track Types - power / balanced / technical labels for circuits and sectors, derived from FastF1 speed traps and sector times
+
+The circuit_type and sector_type mappings in src/kpi2.py (copied into src/analysis1.py) are hand-labelled for 10 circuits,
+which keeps KPI 1 and KPI 2 from going beyond those tracks. This module derives the same labels from the data already in
+processed_data/all-laps.csv, for every circuit and season present - no per-circuit constants, so any circuit with dry
+laps gets a label.
+
+Steps:
+1. Keep dry, representative laps only:
+    - drop weather-affected sessions - more than WET_SESSION_SHARE of laps on intermediates or wets, or a best lap
+        more than SLOW_SESSION_RATIO slower than the circuit's best session - and any remaining wet-tyre laps
+    - keep timed laps within 107% of the session's fastest lap, so in/out laps and traffic do not drag the features down
+2. Extract features per (season, circuit) and per sector, in grouped passes:
+    - circuit: the median of every speed trap (SpeedI1, SpeedI2, SpeedFL, SpeedST) and each sector's share of the
+        median lap time
+    - sector: its own trap speed (SpeedI1 in sector 1, SpeedI2 in sector 2, SpeedFL in sector 3), that trap as a share
+        of SpeedST, and the sector's share of the lap time
+3. Standardise the features and cluster with k-means (k = 3, deterministic initialisation), vectorised in numpy.
+    Clusters are named by their trap speeds only - fastest centroid 'power', slowest 'technical', the other 'balanced'.
+4. Cache the labels per (season, circuit) as parquet, refreshed when all-laps.csv changes, and expose them as
+    lookups in the shape of the hand-made mappings, for KPI 1 (technical circuits) and KPI 2 (sector and circuit types).
+    get_label_stability() reports whether each circuit and sector keeps its label from season to season.
+
+Limitations: FastF1 laps carry no lap or sector lengths, so there is no average speed - a circuit with slow corners
+but long straights can look like a power track. Sessions are labelled per season and the label of a circuit can change
+between seasons (car and tyre rules, a new trap position); the lookups only give a label that is the most common
+across seasons, and leave a circuit out when the seasons are split. The derived labels differ from some hand labels -
+run the module to see which, and how stable each label is.
+
+Run from the project root: python -m src.track_types (labels, their stability across seasons, agreement with the hand-made mappings)
+"""
+
+TRACK_TYPES_CACHE_DIR = 'cache/track-types'
+
+TRACK_TYPES = ['technical', 'balanced', 'power'] # slowest to fastest cluster
+
+# the speed trap that falls within each sector
+SECTOR_TRAPS = {1: 'SpeedI1', 2: 'SpeedI2', 3: 'SpeedFL'}
+SPEED_TRAPS = list(SECTOR_TRAPS.values()) + ['SpeedST']
+
+# laps slower than this multiple of the session's fastest lap are not representative (FIA 107% rule)
+REPRESENTATIVE_LAP_RATIO = 1.07
+
+# sessions with more than this share of laps on wet-weather tyres are weather-affected, e.g. Belgium and Hungary 2018
+WET_COMPOUNDS = ['INTERMEDIATE', 'WET']
+WET_SESSION_SHARE = 0.05
+
+# sessions whose best lap is this much slower than the circuit's best session were slowed by conditions
+SLOW_SESSION_RATIO = 1.02
+
+# features each label is clustered on - the trap speeds also name the clusters
+CIRCUIT_FEATURES = SPEED_TRAPS + [f'sector{sector}_share' for sector in SECTOR_TRAPS]
+SECTOR_FEATURES = ['trap_speed', 'top_speed_share', 'time_share']
+
+# -------------------------------------------------------------------------------------------------------- #
+
+# steps 1 & 2 - feature extraction
+
+def get_lap_seconds(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Returns:
+    pd.DataFrame: 'LapTime', 'Sector1Time', 'Sector2Time' and 'Sector3Time' of df in seconds - NaN where missing.
+    """
+    columns = ['LapTime'] + [f'Sector{sector}Time' for sector in SECTOR_TRAPS]
+    decoded = pd.DataFrame(decode_time_columns(df, columns, unit='ms'), index=df.index).astype('float64')
+    return decoded.where(decoded > 0) / 1000 # NaT decodes to a large negative number
+
+
+def get_dry_sessions(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Laps of sessions (Year, Race) not affected by weather, without any wet-tyre laps.
+    A session is weather-affected if more than WET_SESSION_SHARE of its laps are on WET_COMPOUNDS, or if its best lap is
+    more than SLOW_SESSION_RATIO slower than the best of the circuit's other sessions.
+    """
+    session = [df['Year'], df['Race']]
+    is_wet = df['Compound'].isin(WET_COMPOUNDS)
+    lap_s = get_lap_seconds(df)['LapTime'].where(~is_wet)
+
+    session_best = lap_s.groupby(session).transform('min')
+    circuit_best = lap_s.groupby(df['Race']).transform('min')
+
+    dry = (is_wet.groupby(session).transform('mean') <= WET_SESSION_SHARE) & (session_best <= circuit_best * SLOW_SESSION_RATIO)
+    return df[dry & ~is_wet]
+
+
+def get_representative_laps(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Timed laps within REPRESENTATIVE_LAP_RATIO of the fastest lap of their session (Year, Race).
+    """
+    lap_s = get_lap_seconds(df)['LapTime']
+
+    session_best = lap_s.groupby([df['Year'], df['Race']]).transform('min')
+    return df[lap_s <= session_best * REPRESENTATIVE_LAP_RATIO]
+
+
+def get_circuit_features(df_laps: pd.DataFrame) -> pd.DataFrame:
+    """
+    Returns:
+    pd.DataFrame: One row per season and circuit - 'year', 'race', 'laps', median 'SpeedI1', 'SpeedI2', 'SpeedFL', 'SpeedST',
+    median 'lap_s' and 'sector1_s' to 'sector3_s', and 'sector1_share' to 'sector3_share' (of the median lap time).
+    """
+    seconds = get_lap_seconds(df_laps)
+    seconds.columns = ['lap_s'] + [f'sector{sector}_s' for sector in SECTOR_TRAPS]
+
+    features = pd.concat([df_laps[['Year', 'Race'] + SPEED_TRAPS], seconds], axis=1).groupby(['Year', 'Race']).agg(
+        laps=('lap_s', 'size'),
+        **{column: (column, 'median') for column in SPEED_TRAPS + list(seconds.columns)}
+    ).reset_index().rename(columns={'Year': 'year', 'Race': 'race'})
+
+    for sector in SECTOR_TRAPS:
+        features[f'sector{sector}_share'] = features[f'sector{sector}_s'] / features['lap_s']
+    return features
+
+
+def get_sector_features(circuit_features: pd.DataFrame) -> pd.DataFrame:
+    """
+    Returns:
+    pd.DataFrame: One row per season, circuit and sector - 'year', 'race', 'sector', 'sector_s', 'time_share' (of the
+    median lap), 'trap_speed' and 'top_speed_share' (trap speed / SpeedST).
+    """
+    sectors = pd.concat([
+        circuit_features[['year', 'race']].assign(
+            sector=sector,
+            sector_s=circuit_features[f'sector{sector}_s'],
+            time_share=circuit_features[f'sector{sector}_share'],
+            trap_speed=circuit_features[trap],
+            top_speed_share=circuit_features[trap] / circuit_features['SpeedST'],
+        )
+        for sector, trap in SECTOR_TRAPS.items()
+    ], ignore_index=True)
+
+    return sectors.sort_values(['year', 'race', 'sector']).reset_index(drop=True)
+
+# -------------------------------------------------------------------------------------------------------- #
+
+# step 3 - clustering
+
+def kmeans(features: np.ndarray, k: int = 3, max_iterations: int = 100) -> tuple[np.ndarray, np.ndarray]:
+    """
+    k-means on standardised features. Centroids start at evenly spaced quantiles of the mean standardised feature,
+    so the result is deterministic and the initial centroids already run from slow to fast.
+
+    Arguments:
+    features (np.ndarray): (rows, features) - rows with NaN features are not clustered.
+    k (int): Number of clusters. Default is 3.
+    max_iterations (int): Iteration limit. Default is 100.
+
+    Returns:
+    tuple[np.ndarray, np.ndarray]: Cluster per row (-1 for rows not clustered), and the (k, features) centroids in standardised units.
+    """
+    valid = ~np.isnan(features).any(axis=1)
+    points = features[valid]
+    std = points.std(axis=0)
+    points = (points - points.mean(axis=0)) / np.where(std > 0, std, 1)
+
+    score = points.mean(axis=1)
+    initial = np.argsort(score)[np.linspace(0, len(points) - 1, k + 2)[1:-1].round().astype(int)]
+    centroids = points[initial]
+
+    for _ in range(max_iterations):
+        distances = ((points[:, np.newaxis, :] - centroids[np.newaxis, :, :]) ** 2).sum(axis=2)
+        assigned = distances.argmin(axis=1)
+        updated = np.array([points[assigned == c].mean(axis=0) if (assigned == c).any() else centroids[c] for c in range(k)])
+        if np.allclose(updated, centroids):
+            break
+        centroids = updated
+
+    clusters = np.full(len(features), -1)
+    clusters[valid] = assigned
+    return clusters, centroids
+
+
+def label_by_speed(features: pd.DataFrame, columns: list[str], speed_columns: list[str] = None) -> pd.Series:
+    """
+    Cluster rows of features on columns and name the clusters by speed, slowest to fastest, as TRACK_TYPES.
+    A cluster's speed is the mean of its centroid over speed_columns (default: every column).
+    """
+    clusters, centroids = kmeans(features[columns].to_numpy(dtype='float64'), k=len(TRACK_TYPES))
+    speed = centroids[:, [columns.index(column) for column in (speed_columns or columns)]].mean(axis=1)
+    names = np.empty(len(TRACK_TYPES), dtype=object)
+    names[np.argsort(speed)] = TRACK_TYPES
+
+    return pd.Series([names[c] if c >= 0 else None for c in clusters], index=features.index)
+
+
+def classify_tracks(df: pd.DataFrame) -> tuple[pd.DataFrame, pd.DataFrame]:
+    """
+    Label every circuit and sector in a set of FastF1 laps as power, balanced or technical.
+    All seasons are clustered together, so a label means the same thing in every season. Weather-affected sessions
+    are left out, so they have no labels.
+
+    Arguments:
+    df (pd.DataFrame): FastF1 laps with 'Year' and 'Race', e.g. processed_data/all-laps.csv.
+
+    Returns:
+    tuple[pd.DataFrame, pd.DataFrame]: Circuit labels (get_circuit_features columns plus 'circuit_type'),
+    and sector labels (get_sector_features columns plus 'sector_type').
+    """
+    circuits = get_circuit_features(get_representative_laps(get_dry_sessions(df)))
+    circuits['circuit_type'] = label_by_speed(circuits, CIRCUIT_FEATURES, SPEED_TRAPS)
+
+    sectors = get_sector_features(circuits)
+    sectors['sector_type'] = label_by_speed(sectors, SECTOR_FEATURES, ['trap_speed', 'top_speed_share'])
+
+    return circuits, sectors
+
+# -------------------------------------------------------------------------------------------------------- #
+
+# step 4 - cached labels and lookups
+
+def get_track_types(laps_path: str = 'processed_data/all-laps.csv',
+                    cache_dir: str = TRACK_TYPES_CACHE_DIR,
+                    refresh: bool = False) -> tuple[pd.DataFrame, pd.DataFrame]:
+    """
+    classify_tracks on a laps CSV, cached per (season, circuit) in cache_dir until the CSV or this module changes.
+
+    Returns:
+    tuple[pd.DataFrame, pd.DataFrame]: Circuit labels and sector labels, as classify_tracks.
+    """
+    paths = [os.path.join(cache_dir, 'circuits.parquet'), os.path.join(cache_dir, 'sectors.parquet')]
+    changed = max(os.path.getmtime(laps_path), os.path.getmtime(__file__)) # new features or constants relabel everything
+    if not refresh and all(os.path.exists(path) and os.path.getmtime(path) >= changed for path in paths):
+        return tuple(pd.read_parquet(path) for path in paths)
+
+    labels = classify_tracks(pd.read_csv(laps_path, index_col=0))
+
+    os.makedirs(cache_dir, exist_ok=True)
+    for table, path in zip(labels, paths):
+        table.to_parquet(path + '.tmp', index=False)
+        os.replace(path + '.tmp', path)
+
+    return labels
+
+
+def _most_common(labels: pd.DataFrame, keys: list[str], column: str, year: int = None) -> dict:
+    # one label per key - the given season's, or the most common across seasons; keys whose seasons are split evenly
+    # between labels are left out rather than given one of them
+    if year is not None:
+        labels = labels[labels['year'] == year]
+    counts = labels.dropna(subset=[column]).groupby(keys + [column]).size().rename('n').reset_index()
+    top = counts['n'] == counts.groupby(keys)['n'].transform('max')
+    counts = counts[top & (top.groupby([counts[key] for key in keys]).transform('sum') == 1)]
+
+    if len(keys) == 1:
+        return dict(zip(counts[keys[0]], counts[column]))
+    return dict(zip(zip(*[counts[key] for key in keys]), counts[column]))
+
+
+def get_circuit_type_lookup(circuit_labels: pd.DataFrame, year: int = None) -> dict[str, str]:
+    """
+    Returns:
+    dict[str, str]: GP name -> circuit type, in the shape of circuit_type in src/kpi2.py.
+    """
+    return _most_common(circuit_labels, ['race'], 'circuit_type', year)
+
+
+def get_sector_type_lookup(sector_labels: pd.DataFrame, year: int = None) -> dict[tuple[str, int], str]:
+    """
+    Returns:
+    dict[tuple[str, int], str]: (GP name, sector) -> sector type, in the shape of sector_type in src/kpi2.py.
+    """
+    return _most_common(sector_labels, ['race', 'sector'], 'sector_type', year)
+
+
+def get_label_stability(labels: pd.DataFrame, keys: list[str], column: str) -> pd.DataFrame:
+    """
+    How consistently each circuit (or sector) is labelled from one season to the next.
+
+    Arguments:
+    labels (pd.DataFrame): Circuit or sector labels from classify_tracks / get_track_types.
+    keys (list[str]): ['race'] for circuits, ['race', 'sector'] for sectors.
+    column (str): 'circuit_type' or 'sector_type'.
+
+    Returns:
+    pd.DataFrame: One row per key - its label in each season (one column per year, None where unlabelled),
+    'n_seasons' labelled, 'n_labels' (distinct labels given) and 'stable' (one label in every labelled season).
+    """
+    labelled = labels.dropna(subset=[column])
+    stability = labels.pivot(index=keys, columns='year', values=column)
+    stability.columns = [str(year) for year in stability.columns]
+    stability['n_seasons'] = labelled.groupby(keys).size().reindex(stability.index, fill_value=0)
+    stability['n_labels'] = labelled.groupby(keys)[column].nunique().reindex(stability.index, fill_value=0)
+    stability['stable'] = stability['n_labels'] == 1
+    return stability.reset_index()
+
+
+if __name__ == '__main__':
+    from src.kpi1 import GRID_TO_FINISH_PATH, get_high_downforce_deltas
+    from src.kpi2 import circuit_type, sector_type
+
+    circuit_labels, sector_labels = get_track_types(refresh=True)
+
+    print("Circuit labels from dry-session trap speeds and sector time shares, per season:\n")
+    print(circuit_labels.round(3).to_string(index=False))
+
+    circuit_stability = get_label_stability(circuit_labels, ['race'], 'circuit_type')
+    sector_stability = get_label_stability(sector_labels, ['race', 'sector'], 'sector_type')
+    print("\n\nCircuit labels across seasons:\n")
+    print(circuit_stability.to_string(index=False))
+    print(f"\nSame label in every season: circuits {circuit_stability['stable'].mean():.0%}, sectors {sector_stability['stable'].mean():.0%}")
+
+    derived_circuits = get_circuit_type_lookup(circuit_labels)
+    derived_sectors = get_sector_type_lookup(sector_labels)
+
+    # the hand labels are a comparison, not ground truth - they are what this module is meant to replace
+    comparison = pd.DataFrame({'hand_labelled': circuit_type, 'derived': derived_circuits})
+    print("\n\nCircuit types - hand-labelled vs derived (most common across seasons, None if the seasons are split):\n")
+    print(comparison)
+    print(f"\nAgreement with the hand labels: circuits {(comparison['hand_labelled'] == comparison['derived']).mean():.0%}, "
+          f"sectors {np.mean([derived_sectors.get(key) == label for key, label in sector_type.items()]):.0%}")
+
+    technical = [race for race, label in derived_circuits.items() if label == 'technical']
+    df_technical = get_high_downforce_deltas(pd.read_csv(GRID_TO_FINISH_PATH), gp_names=technical)
+    print(f"\nKPI 1 rows at derived technical circuits {technical}: {len(df_technical)}")
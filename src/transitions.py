@@ -0,0 +1,292 @@
+import time
+import numpy as np
+import pandas as pd
+
+"""
+Grid-to-Finish Transitions - empirical grid -> finish distributions over the full Ergast history
+
+KPI 1 reduces each race to a mean grid delta. A delta of +2 from P3 and from P18 mean very different things, though:
+the baseline depends on where a car starts, and on the circuit. This engine counts every grid -> finish transition
+in raw_data/results.csv and raw_data/sprint_results.csv, so questions like "expected finish and points from P14 at Monaco,
+2015-2019" are lookups rather than a new pandas pipeline each time.
+
+Steps:
+1. Build one row per start - session ('race' or 'sprint'), year, circuit, constructor, grid, finish (positionOrder) and points.
+    Grid 0 (pit lane start) is kept as grid 0.
+2. Count transitions sparsely: one row per (session, circuit, constructor, year, grid, finish) that actually occurred.
+3. Index the counts for lookups: for every (session, circuit, constructor, grid) - with '*' standing for all circuits or
+    all constructors - keep per-year running totals of starts, finishing positions and points. Any season window is then
+    the difference of two running totals, found with one dict lookup and a binary search over at most ~75 seasons.
+4. Expected places gained per constructor relative to that baseline - actual finish vs the expected finish from each grid slot.
+
+Run from the project root: python -m src.transitions
+"""
+
+# stands for "every circuit" or "every constructor" in index keys
+ALL = '*'
+
+SESSIONS = {'race': 'results', 'sprint': 'sprint_results'}
+
+# -------------------------------------------------------------------------------------------------------- #
+
+# steps 1 & 2 - one row per start, then sparse transition counts
+
+def get_starts(raw_dir: str = 'raw_data') -> pd.DataFrame:
+    """
+    Returns:
+    pd.DataFrame: One row per start in every race and sprint - 'session', 'race_id', 'year', 'circuit_ref', 'constructor_ref',
+    'grid', 'finish' and 'points'.
+    """
+    from src.loader import load_table
+
+    races = load_table('races', raw_dir)[['raceId', 'year', 'circuitId']].merge(
+        load_table('circuits', raw_dir)[['circuitId', 'circuitRef']], on='circuitId')
+    constructors = load_table('constructors', raw_dir)[['constructorId', 'constructorRef']]
+
+    starts = []
+    for session, table in SESSIONS.items():
+        results = load_table(table, raw_dir)[['raceId', 'constructorId', 'grid', 'positionOrder', 'points']]
+        df = results.merge(races, on='raceId').merge(constructors, on='constructorId')
+        starts.append(pd.DataFrame({
+            'session': session,
+            'race_id': df['raceId'].astype('int64'),
+            'year': df['year'].astype('int64'),
+            'circuit_ref': df['circuitRef'].astype(str),
+            'constructor_ref': df['constructorRef'].astype(str),
+            'grid': df['grid'].astype('int64'),
+            'finish': df['positionOrder'].astype('int64'),
+            'points': df['points'].astype('float64'),
+        }))
+
+    return pd.concat(starts, ignore_index=True)
+
+
+def get_transition_counts(starts: pd.DataFrame) -> pd.DataFrame:
+    """
+    Sparse transition counts - only (grid, finish) pairs that occurred are stored.
+
+    Returns:
+    pd.DataFrame: 'session', 'circuit_ref', 'constructor_ref', 'year', 'grid', 'finish', 'n' and 'points' (total points scored).
+    """
+    return starts.groupby(['session', 'circuit_ref', 'constructor_ref', 'year', 'grid', 'finish']).agg(
+        n=('finish', 'size'),
+        points=('points', 'sum')
+    ).reset_index()
+
+
+def get_transition_matrix(counts: pd.DataFrame,
+                          circuit_ref: str = None,
+                          constructor_ref: str = None,
+                          years: tuple[int, int] = None,
+                          session: str = 'race',
+                          normalize: bool = True):
+    """
+    The grid -> finish transition matrix for one slice, as a scipy sparse matrix.
+
+    Arguments:
+    counts (pd.DataFrame): Output of get_transition_counts.
+    circuit_ref (str): Ergast circuitRef, e.g. 'monaco' (optional - default is every circuit).
+    constructor_ref (str): Ergast constructorRef, e.g. 'williams' (optional - default is every constructor).
+    years (tuple[int, int]): First and last season, inclusive (optional - default is every season).
+    session (str): 'race' or 'sprint'. Default is 'race'.
+    normalize (bool): If True, each grid row holds P(finish | grid); otherwise raw counts. Default is True.
+
+    Returns:
+    scipy.sparse.csr_matrix: Row = grid slot (0 = pit lane), column = finishing position.
+    """
+    from scipy.sparse import csr_matrix # imported lazily - only needed for matrices, not lookups
+
+    mask = counts['session'] == session
+    if circuit_ref is not None:
+        mask &= counts['circuit_ref'] == circuit_ref
+    if constructor_ref is not None:
+        mask &= counts['constructor_ref'] == constructor_ref
+    if years is not None:
+        mask &= counts['year'].between(*years)
+
+    cells = counts[mask].groupby(['grid', 'finish'])['n'].sum().reset_index()
+    shape = (int(counts['grid'].max()) + 1, int(counts['finish'].max()) + 1)
+    matrix = csr_matrix((cells['n'].to_numpy(dtype='float64'), (cells['grid'], cells['finish'])), shape=shape)
+
+    if normalize:
+        row_totals = np.asarray(matrix.sum(axis=1)).ravel()
+        matrix = csr_matrix(matrix.multiply(1 / np.where(row_totals > 0, row_totals, 1)[:, np.newaxis]))
+    return matrix
+
+# -------------------------------------------------------------------------------------------------------- #
+
+# step 3 - running totals per (session, circuit, constructor, grid), for constant-time window lookups
+
+def build_transition_index(counts: pd.DataFrame) -> dict:
+    """
+    Precompute per-year running totals of starts, finishing positions and points for every
+    (session, circuit_ref, constructor_ref, grid) key, including ALL ('*') for circuit and/or constructor.
+
+    Returns:
+    dict: 'keys' maps each key to its (start, end) rows in the 'year', 'n', 'finish' and 'points' arrays,
+    which hold running totals by year within each key.
+    """
+    levels = []
+    for circuit_all in [False, True]:
+        for constructor_all in [False, True]:
+            level = counts.assign(
+                circuit_ref=ALL if circuit_all else counts['circuit_ref'],
+                constructor_ref=ALL if constructor_all else counts['constructor_ref'],
+                finish_total=counts['finish'] * counts['n'],
+            ).groupby(['session', 'circuit_ref', 'constructor_ref', 'grid', 'year']).agg(
+                n=('n', 'sum'), finish=('finish_total', 'sum'), points=('points', 'sum')
+            ).reset_index()
+            levels.append(level)
+
+    totals = pd.concat(levels, ignore_index=True).sort_values(
+        ['session', 'circuit_ref', 'constructor_ref', 'grid', 'year']).reset_index(drop=True)
+
+    key_columns = ['session', 'circuit_ref', 'constructor_ref', 'grid']
+    grouped = totals.groupby(key_columns, sort=False)
+    running = grouped[['n', 'finish', 'points']].cumsum()
+
+    # (start, end) row range of each key in the sorted arrays
+    key_starts = totals.drop_duplicates(key_columns)
+    ends = np.r_[key_starts.index[1:], len(totals)]
+    keys = {
+        (session, circuit, constructor, int(grid)): (start, end)
+        for session, circuit, constructor, grid, start, end in zip(
+            key_starts['session'], key_starts['circuit_ref'], key_starts['constructor_ref'], key_starts['grid'], key_starts.index, ends)
+    }
+
+    return {
+        'keys': keys,
+        'year': totals['year'].to_numpy(),
+        'n': running['n'].to_numpy(dtype='float64'),
+        'finish': running['finish'].to_numpy(dtype='float64'),
+        'points': running['points'].to_numpy(dtype='float64'),
+    }
+
+
+def lookup_expected(index: dict,
+                    grid: int,
+                    circuit_ref: str = ALL,
+                    constructor_ref: str = ALL,
+                    years: tuple[int, int] = None,
+                    session: str = 'race') -> dict:
+    """
+    Expected finishing position and points from a grid slot - e.g. lookup_expected(index, 14, 'monaco', years=(2015, 2019)).
+
+    Arguments:
+    index (dict): Output of build_transition_index.
+    grid (int): The grid slot (0 = pit lane).
+    circuit_ref (str): Ergast circuitRef. Default is ALL.
+    constructor_ref (str): Ergast constructorRef. Default is ALL.
+    years (tuple[int, int]): First and last season, inclusive (optional - default is every season).
+    session (str): 'race' or 'sprint'. Default is 'race'.
+
+    Returns:
+    dict: 'n' (starts from that slot), 'expected_finish', 'expected_points' and 'expected_gain' (grid - expected finish).
+    Expectations are NaN when there were no starts.
+    """
+    start, end = index['keys'].get((session, circuit_ref, constructor_ref, int(grid)), (0, 0))
+    years_in_key = index['year'][start:end]
+
+    # running totals up to the last season in the window, minus those before the first
+    first, last = years if years is not None else (-np.inf, np.inf)
+    upper = start + np.searchsorted(years_in_key, last, side='right') - 1
+    lower = start + np.searchsorted(years_in_key, first, side='left') - 1
+
+    totals = {}
+    for column in ['n', 'finish', 'points']:
+        totals[column] = (index[column][upper] if upper >= start else 0.0) - (index[column][lower] if lower >= start else 0.0)
+
+    n = totals['n']
+    expected_finish = float(totals['finish'] / n) if n > 0 else np.nan
+    return {
+        'n': int(n),
+        'expected_finish': expected_finish,
+        'expected_points': float(totals['points'] / n) if n > 0 else np.nan,
+        'expected_gain': grid - expected_finish,
+    }
+
+# -------------------------------------------------------------------------------------------------------- #
+
+# step 4 - places gained relative to the grid-slot baseline
+
+def get_gain_vs_expected(starts: pd.DataFrame,
+                         years: tuple[int, int] = None,
+                         circuit_refs: list[str] = None,
+                         by_circuit: bool = True,
+                         session: str = 'race') -> pd.DataFrame:
+    """
+    Places gained per constructor beyond what its grid slots would predict. The baseline for each start is the
+    mean finish of every start from the same grid slot (at the same circuit if by_circuit) within the window.
+
+    Arguments:
+    starts (pd.DataFrame): Output of get_starts.
+    years (tuple[int, int]): First and last season, inclusive (optional - default is every season).
+    circuit_refs (list[str]): Circuits to include (optional - default is every circuit).
+    by_circuit (bool): If True, the baseline is per circuit and grid slot; otherwise per grid slot only. Default is True.
+    session (str): 'race' or 'sprint'. Default is 'race'.
+
+    Returns:
+    pd.DataFrame: One row per constructor - 'constructor_ref', 'starts', 'avg_grid_delta' (grid - finish, as KPI 1),
+    'avg_expected_delta' (grid - expected finish) and 'avg_gain_vs_expected' (expected finish - finish), sorted by the last.
+    """
+    df = starts[starts['session'] == session]
+    if years is not None:
+        df = df[df['year'].between(*years)]
+    if circuit_refs is not None:
+        df = df[df['circuit_ref'].isin(circuit_refs)]
+
+    baseline_keys = ['circuit_ref', 'grid'] if by_circuit else ['grid']
+    df = df.assign(expected_finish=df.groupby(baseline_keys)['finish'].transform('mean'))
+
+    gains = df.assign(
+        grid_delta=df['grid'] - df['finish'],
+        expected_delta=df['grid'] - df['expected_finish'],
+        gain_vs_expected=df['expected_finish'] - df['finish'],
+    ).groupby('constructor_ref').agg(
+        starts=('finish', 'size'),
+        avg_grid_delta=('grid_delta', 'mean'),
+        avg_expected_delta=('expected_delta', 'mean'),
+        avg_gain_vs_expected=('gain_vs_expected', 'mean'),
+    ).reset_index()
+
+    return gains.sort_values('avg_gain_vs_expected', ascending=False).reset_index(drop=True)
+
+
+if __name__ == '__main__':
+    from src.kpi2 import MIDFIELD_CONSTRUCTORS
+
+    starts = get_starts()
+
+    start = time.perf_counter()
+    counts = get_transition_counts(starts)
+    index = build_transition_index(counts)
+    build_s = time.perf_counter() - start
+    print(f"{len(starts)} starts -> {len(counts)} sparse transition counts, {len(index['keys'])} index keys, built in {build_s:.2f}s.\n")
+
+    # lookups vs recomputing from the starts with pandas each time
+    queries = [(grid, 'monaco', (2015, 2019)) for grid in range(1, 21)]
+
+    start = time.perf_counter()
+    looked_up = [lookup_expected(index, grid, circuit, years=years) for grid, circuit, years in queries]
+    lookup_ms = (time.perf_counter() - start) * 1000 / len(queries)
+
+    start = time.perf_counter()
+    for (grid, circuit, years), result in zip(queries, looked_up):
+        rows = starts[(starts['session'] == 'race') & (starts['circuit_ref'] == circuit) & (starts['grid'] == grid) & starts['year'].between(*years)]
+        assert np.isclose(rows['finish'].mean(), result['expected_finish'], equal_nan=True)
+        assert np.isclose(rows['points'].mean(), result['expected_points'], equal_nan=True)
+    pandas_ms = (time.perf_counter() - start) * 1000 / len(queries)
+
+    print("Monaco 2015-2019, expected finish and points by grid slot:\n")
+    print(pd.DataFrame([{'grid': grid, **result} for (grid, _, _), result in zip(queries, looked_up)]).round(2).to_string(index=False))
+    print(f"\nPer query: {lookup_ms:.3f} ms from the index vs {pandas_ms:.3f} ms filtering starts with pandas (same results).")
+
+    monaco = get_transition_matrix(counts, circuit_ref='monaco')
+    print(f"\nMonaco race transition matrix (all seasons): {monaco.shape}, {monaco.nnz} non-zero cells.")
+    print(f"P(finish P14 or better | start P14, Monaco) = {monaco[14, 1:15].sum():.2f}")
+
+    # places gained beyond the grid-slot baseline, for the KPI 1 midfield at the KPI 1 circuits
+    kpi1_circuits = ['monza', 'monaco', 'silverstone', 'spa', 'catalunya', 'marina_bay', 'interlagos', 'hungaroring', 'red_bull_ring', 'suzuka']
+    print("\nMidfield places gained vs the grid-slot baseline at the KPI 1 circuits, 2015-2019:\n")
+    gains = get_gain_vs_expected(starts, years=(2015, 2019), circuit_refs=kpi1_circuits)
+    print(gains[gains['constructor_ref'].isin(MIDFIELD_CONSTRUCTORS)].round(3).to_string(index=False))
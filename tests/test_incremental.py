@@ -0,0 +1,64 @@
+import os
+import pandas as pd
+import pytest
+
+from src.incremental import STATE_TABLES, load_raw_tables, update_kpi_state
+from src.kpi3 import LAP_TIMES_PATH
+from src.loader import load_table
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+@pytest.fixture(scope='module')
+def inputs():
+    # raw_data/ and processed_data/ paths are relative to the project root
+    cwd = os.getcwd()
+    os.chdir(PROJECT_ROOT)
+    try:
+        races = load_table('races')
+        race_ids = races.loc[races['year'] == 2019].sort_values('date')['raceId'].tolist()
+        yield race_ids, pd.read_csv(LAP_TIMES_PATH), load_raw_tables()
+    finally:
+        os.chdir(cwd)
+
+
+def assert_state_equal(incremental: dict, rebuilt: dict):
+    for name in STATE_TABLES:
+        pd.testing.assert_frame_equal(incremental[name], rebuilt[name], check_exact=True, obj=name)
+
+
+def test_races_added_one_by_one_match_a_full_rebuild(inputs):
+    race_ids, laps, raw_tables = inputs
+    rebuilt = update_kpi_state({}, race_ids, laps=laps, raw_tables=raw_tables)
+
+    incremental = {}
+    for race_id in race_ids:
+        incremental = update_kpi_state(incremental, [race_id], laps=laps, raw_tables=raw_tables)
+
+    assert len(rebuilt['grid_to_finish']) > 0
+    assert_state_equal(incremental, rebuilt)
+
+
+def test_races_added_out_of_order_and_re_added_match_a_full_rebuild(inputs):
+    race_ids, laps, raw_tables = inputs
+    rebuilt = update_kpi_state({}, race_ids, laps=laps, raw_tables=raw_tables)
+
+    # latest races first, then the rest in one batch, then one race again - replaced, not double counted
+    incremental = update_kpi_state({}, race_ids[-3:], laps=laps, raw_tables=raw_tables)
+    incremental = update_kpi_state(incremental, race_ids[:-3], laps=laps, raw_tables=raw_tables)
+    incremental = update_kpi_state(incremental, race_ids[5:6], laps=laps, raw_tables=raw_tables)
+
+    assert_state_equal(incremental, rebuilt)
+
+
+def test_grid_to_finish_rows_match_the_bigquery_extract(inputs):
+    race_ids, laps, raw_tables = inputs
+    rebuilt = update_kpi_state({}, race_ids, raw_tables=raw_tables)
+
+    extract = pd.read_csv(os.path.join(PROJECT_ROOT, 'processed_data/grid-to-finish.csv'))
+    extract = extract[extract['race_id'].isin(race_ids)].sort_values(['race_id', 'driver_name']).reset_index(drop=True)
+
+    rows = rebuilt['grid_to_finish']
+    pd.testing.assert_frame_equal(rows[['race_id', 'driver_name', 'constructor_ref', 'start_position', 'final_position']],
+                                  extract[['race_id', 'driver_name', 'constructor_ref', 'start_position', 'final_position']],
+                                  check_dtype=False)